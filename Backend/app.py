@@ -1,7 +1,7 @@
 import os
 from flask import Flask
 from flask_cors import CORS
-from config import SECRET_KEY
+from config import SECRET_KEY, OPENROUTER_WARMUP, ENABLE_CACHE_WARMUP
 
 from routes.session import session_bp
 from routes.chat import chat_bp
@@ -11,6 +11,8 @@ from routes.language import language_bp
 from routes.health import health_bp
 from routes.tts import tts_bp
 from routes.admin import admin_bp
+from services.model_router import warm_up_connections
+from services.warmup import cache_warmer
 
 app = Flask(__name__)
 app.secret_key = SECRET_KEY
@@ -25,6 +27,17 @@ app.register_blueprint(health_bp)
 app.register_blueprint(tts_bp)
 app.register_blueprint(admin_bp)
 
+# Batch moderation workers started while running `python app.py` import this
+# file as __mp_main__; they must not warm anything up
+if __name__ != "__mp_main__":
+    # Open upstream keep-alive connections before the first request arrives
+    if OPENROUTER_WARMUP:
+        warm_up_connections()
+
+    # Fill the response cache with FAQ and popular answers in the background
+    if ENABLE_CACHE_WARMUP:
+        cache_warmer.start()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=True)
\ No newline at end of file
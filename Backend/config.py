@@ -5,7 +5,146 @@ load_dotenv()
 
 OPENROUTER_API_KEY_PRIMARY = os.getenv("OPENROUTER_API_KEY_PRIMARY")
 OPENROUTER_API_KEY_SECONDARY = os.getenv("OPENROUTER_API_KEY_SECONDARY")
+# Additional OpenRouter keys, comma separated; pooled with the primary/secondary keys
+OPENROUTER_API_KEYS = [key.strip() for key in os.getenv("OPENROUTER_API_KEYS", "").split(",") if key.strip()]
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 ENABLE_TTS = os.getenv("ENABLE_TTS", "false").lower() == "true"
 ALLOWED_LANGS = os.getenv("ALLOWED_LANGS", "en,fr,pt,sw,es,hi").split(',')
-SECRET_KEY = os.getenv("SECRET_KEY", "change_this_secret_for_prod")
\ No newline at end of file
+SECRET_KEY = os.getenv("SECRET_KEY", "change_this_secret_for_prod")
+
+def _parse_int_map(raw: str) -> dict:
+    """Parse "name=value,name2=value2" env strings into a dict of ints"""
+    parsed = {}
+    for item in (raw or "").split(","):
+        name, sep, value = item.strip().rpartition("=")
+        if sep and name and value.strip().isdigit():
+            parsed[name.strip()] = int(value)
+    return parsed
+
+
+# OpenRouter connection pooling
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "10"))
+OPENROUTER_POOL_SIZES = _parse_int_map(os.getenv("OPENROUTER_POOL_SIZES", ""))
+OPENROUTER_WARMUP = os.getenv("OPENROUTER_WARMUP", "true").lower() == "true"
+
+# Hedged upstream requests (opt-in)
+ENABLE_HEDGING = os.getenv("ENABLE_HEDGING", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "2.0"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+
+# Circuit breakers and model failover
+MODEL_FAILOVER_CHAIN = [m.strip() for m in os.getenv(
+    "MODEL_FAILOVER_CHAIN",
+    "meta-llama/llama-3.3-70b-instruct:free,mistralai/mistral-nemo:free"
+).split(",") if m.strip()]
+BREAKER_ERROR_THRESHOLD = float(os.getenv("BREAKER_ERROR_THRESHOLD", "0.5"))
+BREAKER_LATENCY_THRESHOLD = float(os.getenv("BREAKER_LATENCY_THRESHOLD", "20.0"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_EWMA_ALPHA = float(os.getenv("BREAKER_EWMA_ALPHA", "0.3"))
+BREAKER_MIN_SAMPLES = int(os.getenv("BREAKER_MIN_SAMPLES", "5"))
+
+# Request deadlines and upstream retry backoff (seconds)
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "25"))
+LESSON_DEADLINE_SECONDS = float(os.getenv("LESSON_DEADLINE_SECONDS", "45"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "4.0"))
+
+# Adaptive admission control for upstream LLM calls
+LIMITER_INITIAL_LIMIT = int(os.getenv("LIMITER_INITIAL_LIMIT", "8"))
+LIMITER_MIN_LIMIT = int(os.getenv("LIMITER_MIN_LIMIT", "2"))
+LIMITER_MAX_LIMIT = int(os.getenv("LIMITER_MAX_LIMIT", "64"))
+LIMITER_QUEUE_SIZE = int(os.getenv("LIMITER_QUEUE_SIZE", "32"))
+LIMITER_QUEUE_TIMEOUT = float(os.getenv("LIMITER_QUEUE_TIMEOUT", "10"))
+LIMITER_RESERVED_SLOTS = int(os.getenv("LIMITER_RESERVED_SLOTS", "2"))
+LIMITER_AGING_SECONDS = float(os.getenv("LIMITER_AGING_SECONDS", "8"))
+
+# API key pool: throttled keys are benched for KEY_QUARANTINE_SECONDS, doubling
+# on repeated 429s up to KEY_QUARANTINE_MAX_SECONDS
+KEY_QUARANTINE_SECONDS = float(os.getenv("KEY_QUARANTINE_SECONDS", "15"))
+KEY_QUARANTINE_MAX_SECONDS = float(os.getenv("KEY_QUARANTINE_MAX_SECONDS", "300"))
+KEY_THROTTLE_WINDOW = float(os.getenv("KEY_THROTTLE_WINDOW", "60"))
+
+# Load-adaptive downgrade of non-sensitive chats to the faster model
+ENABLE_DEGRADATION = os.getenv("ENABLE_DEGRADATION", "false").lower() == "true"
+DEGRADE_LATENCY_RATIO = float(os.getenv("DEGRADE_LATENCY_RATIO", "3.0"))
+DEGRADE_RECOVER_RATIO = float(os.getenv("DEGRADE_RECOVER_RATIO", "1.5"))
+DEGRADE_QUEUE_RATIO = float(os.getenv("DEGRADE_QUEUE_RATIO", "0.5"))
+DEGRADE_RECOVER_QUEUE_RATIO = float(os.getenv("DEGRADE_RECOVER_QUEUE_RATIO", "0.2"))
+DEGRADE_MIN_SECONDS = float(os.getenv("DEGRADE_MIN_SECONDS", "30"))
+DEGRADE_MAX_TOKENS_FACTOR = float(os.getenv("DEGRADE_MAX_TOKENS_FACTOR", "1.5"))
+
+# Directory for state that should survive restarts (learned tables, disk caches)
+STATE_DIR = os.getenv("STATE_DIR", "state")
+
+# Learned max_tokens per (intent, language, complexity)
+TOKEN_BUDGET_PERCENTILE = float(os.getenv("TOKEN_BUDGET_PERCENTILE", "0.95"))
+TOKEN_BUDGET_MIN_SAMPLES = int(os.getenv("TOKEN_BUDGET_MIN_SAMPLES", "20"))
+TOKEN_BUDGET_MIN = int(os.getenv("TOKEN_BUDGET_MIN", "128"))
+TOKEN_BUDGET_MAX = int(os.getenv("TOKEN_BUDGET_MAX", "1200"))
+
+# Response cache
+CACHE_TTL_SECONDS = int(os.getenv("CACHE_TTL_SECONDS", "1800"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Shared disk tier behind the response cache (SQLite WAL, one file per node)
+ENABLE_DISK_CACHE = os.getenv("ENABLE_DISK_CACHE", "false").lower() == "true"
+DISK_CACHE_PATH = os.getenv("DISK_CACHE_PATH", os.path.join(STATE_DIR, "response_cache.db"))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("DISK_CACHE_MAX_ENTRIES", "50000"))
+
+# Near-duplicate (MinHash LSH) chat answer cache
+ENABLE_SEMANTIC_CACHE = os.getenv("ENABLE_SEMANTIC_CACHE", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.8"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+# Chat cache policies: per-intent freshness ("intent=seconds,..."), medium questions
+# cached for a share of that, stale answers served for a grace period while refreshing
+CACHE_INTENT_TTLS = _parse_int_map(os.getenv("CACHE_INTENT_TTLS", ""))
+CACHE_MEDIUM_TTL_RATIO = float(os.getenv("CACHE_MEDIUM_TTL_RATIO", "0.5"))
+CACHE_STALE_GRACE_RATIO = float(os.getenv("CACHE_STALE_GRACE_RATIO", "0.5"))
+CACHE_REFRESH_WORKERS = int(os.getenv("CACHE_REFRESH_WORKERS", "2"))
+NEGATIVE_CACHE_SECONDS = int(os.getenv("NEGATIVE_CACHE_SECONDS", "30"))
+
+# Generated lesson store (persisted under STATE_DIR); bump the version when the lesson prompt changes
+LESSON_TTL_SECONDS = int(os.getenv("LESSON_TTL_SECONDS", str(30 * 24 * 3600)))
+LESSON_STORE_MAX_ENTRIES = int(os.getenv("LESSON_STORE_MAX_ENTRIES", "5000"))
+LESSON_PROMPT_VERSION = int(os.getenv("LESSON_PROMPT_VERSION", "1"))
+
+# Background cache warm-up from the FAQ and the most asked questions
+ENABLE_CACHE_WARMUP = os.getenv("ENABLE_CACHE_WARMUP", "false").lower() == "true"
+WARMUP_INTERVAL_SECONDS = int(os.getenv("WARMUP_INTERVAL_SECONDS", "3600"))
+WARMUP_WORKERS = int(os.getenv("WARMUP_WORKERS", "2"))
+WARMUP_TOP_QUERIES = int(os.getenv("WARMUP_TOP_QUERIES", "20"))
+WARMUP_MAX_UPSTREAM_CALLS = int(os.getenv("WARMUP_MAX_UPSTREAM_CALLS", "100"))
+
+# Idempotency-Key support on /api/chat: completed responses replayed to retries
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "300"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+# Heavy-hitter sketches of popular questions and lesson topics (fixed memory per language)
+HEAVY_HITTERS_CAPACITY = int(os.getenv("HEAVY_HITTERS_CAPACITY", "200"))
+HEAVY_HITTERS_SKETCH_WIDTH = int(os.getenv("HEAVY_HITTERS_SKETCH_WIDTH", "2048"))
+
+# Speculative prefetch of likely follow-up answers (opt-in)
+ENABLE_PREFETCH = os.getenv("ENABLE_PREFETCH", "false").lower() == "true"
+PREFETCH_MAX_CALLS_PER_MINUTE = int(os.getenv("PREFETCH_MAX_CALLS_PER_MINUTE", "10"))
+PREFETCH_MIN_PROBABILITY = float(os.getenv("PREFETCH_MIN_PROBABILITY", "0.3"))
+PREFETCH_MIN_COUNT = int(os.getenv("PREFETCH_MIN_COUNT", "3"))
+PREFETCH_MAX_STATES = int(os.getenv("PREFETCH_MAX_STATES", "5000"))
+PREFETCH_HIT_WINDOW_SECONDS = int(os.getenv("PREFETCH_HIT_WINDOW_SECONDS", "900"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "2"))
+
+# Safety verdicts memoized per normalized message
+SAFETY_CACHE_SIZE = int(os.getenv("SAFETY_CACHE_SIZE", "4096"))
+
+# Per-session safety context: verdicts of the last N messages are kept; a blocked
+# attempt among them (or a blocked phrase split across messages) flags blocked_context,
+# and this many warnings flag needs_review
+SAFETY_CONTEXT_WINDOW = int(os.getenv("SAFETY_CONTEXT_WINDOW", "10"))
+SAFETY_CONTEXT_BLOCKS = int(os.getenv("SAFETY_CONTEXT_BLOCKS", "1"))
+SAFETY_CONTEXT_WARNINGS = int(os.getenv("SAFETY_CONTEXT_WARNINGS", "3"))
+
+# Batch moderation (/api/admin/moderate/batch): worker processes and lines per task
+MODERATION_WORKERS = int(os.getenv("MODERATION_WORKERS", str(os.cpu_count() or 1)))
+MODERATION_CHUNK_SIZE = int(os.getenv("MODERATION_CHUNK_SIZE", "2000"))
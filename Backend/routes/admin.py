@@ -2,9 +2,24 @@
 Admin Route
 Provides access to system metrics and administration functions
 """
-from flask import Blueprint, jsonify, request
-from services.telemetry import get_metrics, reset_metrics
+import json
+import threading
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from services.telemetry import get_metrics, reset_metrics, DEFAULT_TOP_K
 from services.session_store import get_session_stats
+from services.openrouter_client import openrouter_client
+from services.circuit_breaker import breakers
+from services.admission import upstream_limiter
+from services.key_pool import key_pool
+from services.degradation import degradation_policy
+from services.token_budget import token_budget
+from services.semantic_cache import semantic_cache
+from services.lesson_store import lesson_store
+from services.warmup import cache_warmer
+from services.prefetch import prefetcher
+from services.safety import get_safety_stats
+from services.moderation import batch_moderator
+from utils.cache import cache
 from utils.logger import logger
 
 admin_bp = Blueprint("admin", __name__)
@@ -22,6 +37,7 @@ def _check_auth():
 def metrics():
     """
     Get comprehensive system metrics
+    Query: top_k (popular questions / lesson topics per language, default 10, max 100)
     Requires authentication via X-API-Key header or api_key query parameter
     """
     if not _check_auth():
@@ -30,7 +46,18 @@ def metrics():
         return jsonify({"error": "Unauthorized"}), 401
     
     try:
-        metrics_data = get_metrics()
+        try:
+            top_k = min(max(int(request.args.get("top_k", DEFAULT_TOP_K)), 1), 100)
+        except ValueError:
+            return jsonify({"error": "top_k must be an integer"}), 400
+        metrics_data = get_metrics(top_k=top_k)
+        metrics_data["http_pool"] = openrouter_client.get_stats()
+        metrics_data["circuit_breakers"] = breakers.get_states()
+        metrics_data["admission"] = upstream_limiter.get_stats()
+        metrics_data["api_keys"] = key_pool.get_stats()
+        metrics_data["degradation"]["models"] = degradation_policy.get_stats()
+        metrics_data["prefetch"] = prefetcher.get_stats()
+        metrics_data["safety"] = get_safety_stats()
         return jsonify(metrics_data)
     except Exception as e:
         logger.error("Error getting metrics", error=e)
@@ -69,4 +96,144 @@ def session_stats():
         return jsonify(stats)
     except Exception as e:
         logger.error("Error getting session stats", error=e)
-        return jsonify({"error": "Failed to retrieve session stats"}), 500
\ No newline at end of file
+        return jsonify({"error": "Failed to retrieve session stats"}), 500
+
+@admin_bp.route("/api/admin/token-budgets", methods=["GET"])
+def token_budgets():
+    """
+    Get learned max_tokens budgets per intent|language|complexity
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        return jsonify(token_budget.get_table())
+    except Exception as e:
+        logger.error("Error getting token budgets", error=e)
+        return jsonify({"error": "Failed to retrieve token budgets"}), 500
+
+
+@admin_bp.route("/api/admin/cache", methods=["GET"])
+def cache_stats():
+    """
+    Get response cache statistics, overall and per key prefix
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        stats = cache.get_stats()
+        stats["semantic"] = semantic_cache.get_stats()
+        stats["lessons"] = lesson_store.get_stats()
+        return jsonify(stats)
+    except Exception as e:
+        logger.error("Error getting cache stats", error=e)
+        return jsonify({"error": "Failed to retrieve cache stats"}), 500
+
+
+@admin_bp.route("/api/admin/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    """
+    Drop every cache entry under a prefix ("lesson" clears the lesson store)
+    Body: {"prefix": "chat_response"}
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    data = request.get_json(silent=True) or {}
+    prefix = (data.get("prefix") or request.args.get("prefix") or "").strip()
+    if not prefix:
+        return jsonify({"error": "prefix is required"}), 400
+    
+    try:
+        # Lessons live in their own store under the same prefix
+        removed = lesson_store.clear() if prefix == "lesson" else cache.invalidate(prefix)
+        logger.info("Cache invalidated via admin endpoint", prefix=prefix, removed=removed,
+                    ip=request.remote_addr)
+        return jsonify({"prefix": prefix, "removed": removed})
+    except Exception as e:
+        logger.error("Error invalidating cache", error=e)
+        return jsonify({"error": "Failed to invalidate cache"}), 500
+
+
+@admin_bp.route("/api/admin/cache/dump", methods=["GET"])
+def cache_dump():
+    """
+    List most recently used cache entries with value previews
+    Query: prefix (optional), limit (default 100, max 1000)
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        limit = min(max(int(request.args.get("limit", 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    
+    try:
+        entries = cache.dump(prefix=request.args.get("prefix"), limit=limit)
+        return jsonify({"count": len(entries), "entries": entries})
+    except Exception as e:
+        logger.error("Error dumping cache", error=e)
+        return jsonify({"error": "Failed to dump cache"}), 500
+
+
+@admin_bp.route("/api/admin/warmup", methods=["GET"])
+def warmup_progress():
+    """
+    Cache warm-up progress per language and upstream calls used
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    try:
+        return jsonify(cache_warmer.get_progress())
+    except Exception as e:
+        logger.error("Error getting warm-up progress", error=e)
+        return jsonify({"error": "Failed to retrieve warm-up progress"}), 500
+
+
+@admin_bp.route("/api/admin/warmup", methods=["POST"])
+def warmup_run():
+    """
+    Start a cache warm-up pass now (in the background)
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    if cache_warmer.get_progress()["running"]:
+        return jsonify({"error": "A warm-up pass is already running"}), 409
+    
+    threading.Thread(target=cache_warmer.run_once, name="cache-warmup-manual", daemon=True).start()
+    logger.info("Cache warm-up started via admin endpoint", ip=request.remote_addr)
+    return jsonify({"started": True}), 202
+
+
+@admin_bp.route("/api/admin/moderate/batch", methods=["POST"])
+def moderate_batch():
+    """
+    Run the safety filter and intent classifier over a JSONL body, one
+    {"message": "...", "id": ..., "language": "en"} object per line.
+    Streams NDJSON results ({"line", "id", "flags", "blocked", "intent"}) in input order.
+    Requires authentication
+    """
+    if not _check_auth():
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    logger.info("Batch moderation started", ip=request.remote_addr)
+    lines = (line.decode("utf-8", errors="replace") for line in request.stream)
+    
+    def generate():
+        try:
+            yield from batch_moderator.moderate(lines)
+        except Exception as e:
+            logger.error("Batch moderation failed", error=e)
+            yield json.dumps({"error": "Batch moderation failed"}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -2,159 +2,232 @@
 Advanced Chat Route
 Enhanced with validation, rate limiting, error handling, and all advanced features
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from services.session_store import get_session, update_session
-from services.model_router import route_chat
-from services.safety import check_safety, classify_intent, localized_system_prompt
+from services.model_router import route_chat, stream_chat
+from services.admission import LoadShedError
+from services.safety import check_safety, classify_intent, localized_system_prompt, new_safety_state
+from services.message_analysis import AnalyzedMessage
 from services.reading_level import adapt_reading_level
 from services.glossary import inject_glossary
-from services.telemetry import record_request, record_message, record_error, record_safety_block, record_rate_limit
+from services.telemetry import (record_request, record_message, record_error, record_safety_block,
+                                record_rate_limit, record_stream, record_question, record_idempotent_retry)
+from services.idempotency import (idempotency_store, fingerprint, MAX_KEY_LENGTH, NEW, COMPLETED,
+                                  MISMATCH)
 from utils.validators import validator
 from utils.rate_limiter import rate_limiter
 from utils.logger import logger
+from utils.deadline import Deadline
+from services.prefetch import prefetcher
+from config import CHAT_DEADLINE_SECONDS, ENABLE_PREFETCH
+import itertools
+import json
 import time
 
 chat_bp = Blueprint("chat", __name__)
 
-@chat_bp.route("/api/chat", methods=["POST"])
-def chat():
+
+def _prepare_chat(data: dict):
     """
-    Advanced chat endpoint with comprehensive validation and error handling
+    Validate the request, run the safety gate and classify intent.
+    Adds the user message to the session history.
+    
+    Returns:
+        (context, None) on success, or (None, error_response)
     """
-    start_time = time.time()
-    record_request()
+    session_id = data.get("session_id")
+    message = data.get("message", "")
+    lang = data.get("language")
     
-    try:
-        # Parse and validate request
-        data = request.get_json() or {}
-        session_id = data.get("session_id")
-        message = data.get("message", "")
-        lang = data.get("language")
-        
-        # Validate session ID
-        is_valid, error_msg = validator.validate_session_id(session_id)
-        if not is_valid:
-            logger.warning("Invalid session ID", error=error_msg)
-            return jsonify({"error": error_msg or "Invalid session ID"}), 400
-        
-        # Validate message
-        is_valid, error_msg = validator.validate_message(message)
+    # Validate session ID
+    is_valid, error_msg = validator.validate_session_id(session_id)
+    if not is_valid:
+        logger.warning("Invalid session ID", error=error_msg)
+        return None, (jsonify({"error": error_msg or "Invalid session ID"}), 400)
+    
+    # Validate message (the analysis is shared by every later stage, so the text is prepared once)
+    analysis = AnalyzedMessage(message) if isinstance(message, str) else None
+    is_valid, error_msg = validator.validate_message(message, analysis=analysis)
+    if not is_valid:
+        logger.warning("Invalid message", error=error_msg)
+        return None, (jsonify({"error": error_msg or "Invalid message"}), 400)
+    
+    # Rate limiting
+    is_allowed, remaining = rate_limiter.is_allowed(session_id)
+    if not is_allowed:
+        logger.warning("Rate limit exceeded", session_id=session_id[:8])
+        record_rate_limit()
+        return None, (jsonify({
+            "error": "Rate limit exceeded. Please wait a moment before sending another message.",
+            "retry_after": 60
+        }), 429)
+    
+    # Get session
+    session = get_session(session_id)
+    if not session:
+        logger.warning("Session not found", session_id=session_id[:8])
+        return None, (jsonify({"error": "Session not found or expired. Please create a new session."}), 404)
+    
+    # Validate language if provided
+    if lang:
+        from config import ALLOWED_LANGS
+        is_valid, error_msg = validator.validate_language(lang, ALLOWED_LANGS)
         if not is_valid:
-            logger.warning("Invalid message", error=error_msg)
-            return jsonify({"error": error_msg or "Invalid message"}), 400
-        
-        # Rate limiting
-        is_allowed, remaining = rate_limiter.is_allowed(session_id)
-        if not is_allowed:
-            logger.warning("Rate limit exceeded", session_id=session_id[:8])
-            record_rate_limit()
-            return jsonify({
-                "error": "Rate limit exceeded. Please wait a moment before sending another message.",
-                "retry_after": 60
-            }), 429
-        
-        # Get session
-        session = get_session(session_id)
-        if not session:
-            logger.warning("Session not found", session_id=session_id[:8])
-            return jsonify({"error": "Session not found or expired. Please create a new session."}), 404
-        
-        # Validate language if provided
-        if lang:
-            from config import ALLOWED_LANGS
-            is_valid, error_msg = validator.validate_language(lang, ALLOWED_LANGS)
-            if not is_valid:
-                logger.warning("Invalid language", error=error_msg)
-                return jsonify({"error": error_msg}), 400
-        
-        # Update language if changed
-        if lang and lang != session.get("language"):
-            session["language"] = lang
-            # Remove any previous system prompts and insert new one
-            session["history"] = [m for m in session["history"] if m.get("role") != "system"]
-            system_prompt = localized_system_prompt(lang, session.get("reading_level", "simple"))
-            session["history"].insert(0, {"role": "system", "content": system_prompt})
-            update_session(session_id, {"language": lang, "history": session["history"]})
-        
-        # Get context for context-aware safety checking
-        recent_messages = [m.get("content", "") for m in session.get("history", [])[-5:] 
-                          if m.get("role") == "user"]
-        
-        # Advanced safety check with context
-        safety_flags = check_safety(message, session.get("language", "en"), context=recent_messages)
-        if "blocked" in safety_flags:
-            logger.warning("Message blocked by safety filter", 
-                         session_id=session_id[:8], message_preview=message[:50])
-            record_safety_block()
-            return jsonify({
-                "error": "Your message could not be processed due to content policy restrictions. Please rephrase your question in an educational context."
-            }), 403
-        
-        # Advanced intent classification
-        intent = classify_intent(message, session.get("language", "en"))
-        
-        # Track intent in session metadata
-        if intent not in session.get("metadata", {}).get("intents_used", []):
-            metadata = session.get("metadata", {})
-            intents_used = metadata.get("intents_used", [])
-            intents_used.append(intent)
-            metadata["intents_used"] = intents_used
-            session["metadata"] = metadata
-        
-        # Add user message to history
-        session["history"].append({"role": "user", "content": message})
+            logger.warning("Invalid language", error=error_msg)
+            return None, (jsonify({"error": error_msg}), 400)
+    
+    # Update language if changed
+    if lang and lang != session.get("language"):
+        session["language"] = lang
+        # Remove any previous system prompts and insert new one
+        session["history"] = [m for m in session["history"] if m.get("role") != "system"]
+        system_prompt = localized_system_prompt(lang, session.get("reading_level", "simple"))
+        session["history"].insert(0, {"role": "system", "content": system_prompt})
+        update_session(session_id, {"language": lang, "history": session["history"]})
+    
+    # Advanced safety check; the session's safety state carries the context forward
+    safety_state = session.setdefault("safety_state", new_safety_state())
+    safety_flags = check_safety(message, session.get("language", "en"), analysis=analysis, state=safety_state)
+    update_session(session_id, {"safety_state": safety_state})
+    if "blocked" in safety_flags:
+        logger.warning("Message blocked by safety filter", 
+                     session_id=session_id[:8], message_preview=message[:50])
+        record_safety_block()
+        return None, (jsonify({
+            "error": "Your message could not be processed due to content policy restrictions. Please rephrase your question in an educational context."
+        }), 403)
+    
+    # Advanced intent classification
+    intent = classify_intent(message, session.get("language", "en"), analysis=analysis)
+    record_question(session.get("language", "en"), message, analysis=analysis)
+    
+    # Track intent in session metadata
+    if intent not in session.get("metadata", {}).get("intents_used", []):
+        metadata = session.get("metadata", {})
+        intents_used = metadata.get("intents_used", [])
+        intents_used.append(intent)
+        metadata["intents_used"] = intents_used
+        session["metadata"] = metadata
+    
+    # The previous question feeds the follow-up prefetcher
+    previous_message = next((m.get("content") for m in reversed(session["history"]) if m.get("role") == "user"),
+                            None)
+    
+    # Add user message to history
+    session["history"].append({"role": "user", "content": message})
+    
+    return {
+        "session_id": session_id,
+        "session": session,
+        "message": message,
+        "analysis": analysis,
+        "intent": intent,
+        "safety_flags": safety_flags,
+        "previous_message": previous_message,
+        "previous_intent": session.get("metadata", {}).get("last_intent")
+    }, None
+
+
+def _finalize_chat(context: dict, ai_resp: str, model_used: str, confidence: float) -> dict:
+    """
+    Adapt the AI response, persist the assistant turn and record telemetry.
+    
+    Returns:
+        Response body for the client
+    """
+    session_id = context["session_id"]
+    session = context["session"]
+    intent = context["intent"]
+    
+    # Adapt reading levels
+    answer_simple = adapt_reading_level(
+        ai_resp, session.get("language", "en"), "simple"
+    )
+    answer_detailed = adapt_reading_level(
+        ai_resp, session.get("language", "en"), "detailed"
+    )
+    
+    # Inject glossary terms
+    answer_simple = inject_glossary(answer_simple, session.get("language", "en"))
+    answer_detailed = inject_glossary(answer_detailed, session.get("language", "en"))
+    
+    # Add AI response to history
+    session["history"].append({"role": "assistant", "content": answer_simple})
+    
+    # Update counters
+    session["counters"]["messages"] = session.get("counters", {}).get("messages", 0) + 1
+    session["counters"]["ai_responses"] = session.get("counters", {}).get("ai_responses", 0) + 1
+    
+    session.setdefault("metadata", {})["last_intent"] = intent
+    
+    # Trim history to last 20 messages (keep system prompt)
+    system_msgs = [m for m in session["history"] if m.get("role") == "system"]
+    other_msgs = [m for m in session["history"] if m.get("role") != "system"]
+    session["history"] = system_msgs + other_msgs[-20:]
+    
+    # Save session
+    update_session(session_id, {
+        "history": session["history"],
+        "counters": session["counters"],
+        "metadata": session.get("metadata", {})
+    })
+    
+    # Record successful message processing
+    record_message(intent=intent, model=model_used)
+    
+    if ENABLE_PREFETCH:
+        # Learn the question path and cache the likely next answer in the background
+        prefetcher.observe(session, context["previous_message"], context["previous_intent"],
+                           context["message"], intent)
+    
+    return {
+        "answer_simple": answer_simple,
+        "answer_detailed": answer_detailed,
+        "model_used": model_used,
+        "confidence": confidence,
+        "reading_level": session.get("reading_level", "simple"),
+        "intent": intent
+    }
+
+
+def _overloaded_response(error: LoadShedError):
+    """503 response for a request shed by upstream admission control"""
+    response = jsonify({
+        "error": "The assistant is very busy right now. Please try again shortly.",
+        "retry_after": error.retry_after
+    })
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 503
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chat_response(data: dict, deadline: Deadline, start_time: float):
+    """Run the chat pipeline for one request and build its response"""
+    try:
+        context, error_response = _prepare_chat(data)
+        if error_response:
+            return error_response
         
         # Route to appropriate AI model with advanced routing
         ai_resp, model_used, confidence = route_chat(
-            session, message, intent=intent, safety_flags=safety_flags
-        )
-        
-        # Adapt reading levels
-        answer_simple = adapt_reading_level(
-            ai_resp, session.get("language", "en"), "simple"
+            context["session"], context["message"], intent=context["intent"],
+            safety_flags=context["safety_flags"], deadline=deadline, analysis=context["analysis"]
         )
-        answer_detailed = adapt_reading_level(
-            ai_resp, session.get("language", "en"), "detailed"
-        )
-        
-        # Inject glossary terms
-        answer_simple = inject_glossary(answer_simple, session.get("language", "en"))
-        answer_detailed = inject_glossary(answer_detailed, session.get("language", "en"))
-        
-        # Add AI response to history
-        session["history"].append({"role": "assistant", "content": answer_simple})
         
-        # Update counters
-        session["counters"]["messages"] = session.get("counters", {}).get("messages", 0) + 1
-        session["counters"]["ai_responses"] = session.get("counters", {}).get("ai_responses", 0) + 1
-        
-        # Trim history to last 20 messages (keep system prompt)
-        system_msgs = [m for m in session["history"] if m.get("role") == "system"]
-        other_msgs = [m for m in session["history"] if m.get("role") != "system"]
-        session["history"] = system_msgs + other_msgs[-20:]
-        
-        # Save session
-        update_session(session_id, {
-            "history": session["history"],
-            "counters": session["counters"],
-            "metadata": session.get("metadata", {})
-        })
-        
-        # Record successful message processing
-        record_message(intent=intent, model=model_used)
+        response_body = _finalize_chat(context, ai_resp, model_used, confidence)
         
         duration = time.time() - start_time
-        logger.performance("chat endpoint", duration, session_id=session_id[:8], 
-                         intent=intent, model=model_used)
+        logger.performance("chat endpoint", duration, session_id=context["session_id"][:8], 
+                         intent=context["intent"], model=model_used)
         
-        return jsonify({
-            "answer_simple": answer_simple,
-            "answer_detailed": answer_detailed,
-            "model_used": model_used,
-            "confidence": confidence,
-            "reading_level": session.get("reading_level", "simple"),
-            "intent": intent
-        })
+        return jsonify(response_body)
+        
+    except LoadShedError as e:
+        return _overloaded_response(e)
         
     except Exception as e:
         logger.error("Unexpected error in chat endpoint", error=e)
@@ -162,4 +235,132 @@ def chat():
         return jsonify({
             "error": "An unexpected error occurred. Please try again.",
             "details": str(e) if logger.logger.level == logger.logger.DEBUG else None
-        }), 500
\ No newline at end of file
+        }), 500
+
+
+def _replay(record):
+    """Response stored for an Idempotency-Key"""
+    response = jsonify(record.body)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response, record.status
+
+
+def _idempotent_chat_response(data: dict, idempotency_key: str, deadline: Deadline, start_time: float):
+    """
+    Run the chat pipeline at most once per (session, Idempotency-Key).
+    Retries get the stored response, or wait for the original while it runs.
+    Transient failures (429, 5xx) are not stored so a retry runs again.
+    """
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}), 400
+    
+    session_id = str(data.get("session_id") or "")
+    request_fingerprint = fingerprint(str(data.get("message", "")))
+    
+    while True:
+        outcome, record = idempotency_store.begin(session_id, idempotency_key, request_fingerprint)
+        if outcome == NEW:
+            break
+        if outcome == MISMATCH:
+            record_idempotent_retry("key_reused")
+            return jsonify({"error": "Idempotency-Key was already used for a different message"}), 422
+        if outcome == COMPLETED:
+            record_idempotent_retry("replayed")
+            return _replay(record)
+        
+        record_idempotent_retry("joined_in_flight")
+        if not idempotency_store.wait(record, deadline.remaining()):
+            return jsonify({"error": "The original request is still being processed.", "retry_after": 1}), 409
+        if record.status is not None:
+            return _replay(record)
+        # The original failed transiently and was forgotten; run it here
+    
+    try:
+        result = _chat_response(data, deadline, start_time)
+    except BaseException:
+        idempotency_store.abandon(session_id, idempotency_key, record)
+        raise
+    
+    response, status = result if isinstance(result, tuple) else (result, result.status_code)
+    if status < 500 and status != 429:
+        idempotency_store.complete(session_id, idempotency_key, record, status, response.get_json())
+    else:
+        idempotency_store.abandon(session_id, idempotency_key, record)
+    return result
+
+
+@chat_bp.route("/api/chat", methods=["POST"])
+def chat():
+    """
+    Advanced chat endpoint with comprehensive validation and error handling.
+    Requests carrying an Idempotency-Key header are run at most once per session.
+    """
+    start_time = time.time()
+    deadline = Deadline(CHAT_DEADLINE_SECONDS)
+    record_request()
+    
+    data = request.get_json(silent=True) or {}
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if idempotency_key is None:
+        return _chat_response(data, deadline, start_time)
+    return _idempotent_chat_response(data, idempotency_key.strip(), deadline, start_time)
+
+
+@chat_bp.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Streaming chat endpoint (Server-Sent Events)
+    Emits `token` events as the model generates, then a `done` event with the
+    same body as /api/chat. Validation and safety errors are returned as JSON.
+    """
+    start_time = time.time()
+    deadline = Deadline(CHAT_DEADLINE_SECONDS)
+    record_request()
+    
+    try:
+        context, error_response = _prepare_chat(request.get_json() or {})
+        if error_response:
+            return error_response
+    except Exception as e:
+        logger.error("Unexpected error in chat stream endpoint", error=e)
+        record_error()
+        return jsonify({"error": "An unexpected error occurred. Please try again."}), 500
+    
+    events = stream_chat(context["session"], context["message"], intent=context["intent"],
+                         safety_flags=context["safety_flags"], deadline=deadline, analysis=context["analysis"])
+    
+    # Pull the first event before responding so admission failures are still a 503
+    try:
+        first_event = next(events)
+    except LoadShedError as e:
+        return _overloaded_response(e)
+    except Exception as e:
+        logger.error("Unexpected error starting chat stream", error=e)
+        record_error()
+        return jsonify({"error": "An unexpected error occurred. Please try again."}), 500
+    
+    def generate():
+        try:
+            for event in itertools.chain([first_event], events):
+                if event["type"] == "token":
+                    yield _sse_event("token", {"content": event["content"]})
+                    continue
+                
+                response_body = _finalize_chat(context, event["content"], event["model"],
+                                               event["confidence"])
+                record_stream(event["time_to_first_token"])
+                
+                duration = time.time() - start_time
+                logger.performance("chat stream endpoint", duration,
+                                   session_id=context["session_id"][:8], intent=context["intent"],
+                                   model=event["model"], time_to_first_token=event["time_to_first_token"])
+                yield _sse_event("done", response_body)
+        except Exception as e:
+            logger.error("Unexpected error in chat stream", error=e)
+            record_error()
+            yield _sse_event("error", {"error": "An unexpected error occurred. Please try again."})
+    
+    return Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
@@ -2,21 +2,38 @@ from flask import Blueprint, request, jsonify
 from services.session_store import get_session
 from services.model_router import generate_lesson
 from services.youtube import get_lesson_videos
+from services.admission import LoadShedError
+from services.telemetry import record_lesson_topic
+from utils.deadline import Deadline
+from utils.validators import validator
+from config import LESSON_DEADLINE_SECONDS
 
 lesson_bp = Blueprint("lesson", __name__)
 
 @lesson_bp.route("/api/lesson", methods=["POST"])
 def lesson():
+    deadline = Deadline(LESSON_DEADLINE_SECONDS)
     data = request.get_json() or {}
     session_id = data.get("session_id")
     topic = data.get("topic", "")
     if not session_id or not topic:
         return jsonify({"error": "Missing session or topic"}), 400
+    # Checked before the topic reaches the popularity sketch or the prompt
+    is_valid, error_msg = validator.validate_topic(topic)
+    if not is_valid:
+        return jsonify({"error": error_msg}), 400
     session = get_session(session_id)
     if not session:
         return jsonify({"error": "Session not found"}), 404
 
-    lesson_json, model_used = generate_lesson(session, topic)
+    record_lesson_topic(session.get("language", "en"), topic)
+    try:
+        lesson_json, model_used = generate_lesson(session, topic, deadline=deadline)
+    except LoadShedError as e:
+        response = jsonify({"error": "Lessons are very busy right now. Please try again shortly.",
+                            "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 503
     videos = get_lesson_videos(topic, session["language"])
     # Optionally, add TTS here if enabled
 
@@ -0,0 +1,91 @@
+"""
+Disk Cache Tier Benchmark
+Replays a Zipf-distributed stream of cache keys through N worker processes
+(round-robin, as gunicorn spreads requests) and compares hit rate and
+lookup latency of per-worker memory caches against memory plus the shared
+SQLite disk tier. A final run restarts the workers against the populated
+disk file to show what survives a restart.
+
+Usage (from Backend/):
+    python -m scripts.bench_disk_cache [--requests 20000] [--keys 5000] [--workers 1 8]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from utils.cache import ResponseCache
+from utils.disk_cache import DiskCache
+
+ANSWER = {"content": "x" * 800, "fresh_until": 0}
+
+
+def _worker(keys, memory_entries, disk_path, results):
+    """Look up each key, filling the cache on a miss like route_chat does"""
+    disk = DiskCache(disk_path) if disk_path else None
+    cache = ResponseCache(ttl_seconds=3600, max_size=memory_entries, disk=disk)
+    hits = 0
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        value = cache.get_key(key)
+        latencies.append(time.perf_counter() - start)
+        if value is not None:
+            hits += 1
+        else:
+            cache.set_key(key, ANSWER)
+    results.put((hits, latencies))
+
+
+def _stream(requests: int, distinct_keys: int, seed: int):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(distinct_keys)]
+    return [f"chat_response:{k}" for k in rng.choices(range(distinct_keys), weights, k=requests)]
+
+
+def run_once(stream, workers: int, memory_entries: int, disk_path):
+    """Hit rate and latency percentiles (ms) for one configuration"""
+    results = multiprocessing.Queue()
+    shares = [stream[i::workers] for i in range(workers)]
+    procs = [multiprocessing.Process(target=_worker, args=(share, memory_entries, disk_path, results))
+             for share in shares]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    hits = sum(h for h, _ in collected)
+    latencies = sorted(lat for _, lats in collected for lat in lats)
+
+    def pct(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+
+    return hits / len(stream), pct(0.5), pct(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--memory-entries", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    stream = _stream(args.requests, args.keys, args.seed)
+    print(f"requests: {args.requests}  distinct keys: {args.keys}  memory entries/worker: {args.memory_entries}")
+    print(f"{'workers':>7}  {'tier':<14} {'hit rate':>8}  {'p50 ms':>8}  {'p99 ms':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for workers in args.workers:
+            disk_path = os.path.join(tmp, f"cache_{workers}.db")
+            rows = [("memory", None), ("memory+disk", disk_path), ("after restart", disk_path)]
+            for label, path in rows:
+                hit_rate, p50, p99 = run_once(stream, workers, args.memory_entries, path)
+                print(f"{workers:>7}  {label:<14} {hit_rate:>8.1%}  {p50:>8.3f}  {p99:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Intent Classifier Benchmark
+Checks that the compiled classifier returns the same intent as the old
+rule-by-rule loop (first matching rule wins) for FAQ questions and
+synthetic messages mixing phrases of several intents, then compares
+messages per second. Exits non-zero on any mismatch.
+
+Usage (from Backend/):
+    python -m scripts.bench_intent [--messages 20000] [--length 300]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from services.safety import INTENT_PATTERNS, classify_intent, classify_many
+
+# At least one phrase per rule, plus near-misses that must not match
+PHRASES = [
+    "emergency", "urgent", "help now", "911", "call police", "contact authorities",
+    "rape", "hurt me", "sexual harassment", "was abused", "forced me", "against my will",
+    "consent", "say no", "can I say no", "do I have to", "forced", "personal boundaries",
+    "hiv", "H.I.V.", "human immunodeficiency", "prevent HIV", "protect from hiv", "hiv test", "get tested",
+    "birth control", "condom", "pill", "iud", "ring", "not get pregnant", "avoid pregnancy",
+    "pregnant", "baby", "test positive", "missed period", "am I pregnant",
+    "sti", "std test", "sexually transmitted", "herpes", "screening",
+    "depressed", "anxiety", "want to die", "self-harm", "feel hopeless", "therapist", "need help",
+    "puberty", "period", "menstrual", "body changes", "voice change",
+    "relationship", "girlfriend", "like someone", "crush", "love",
+    "gay", "queer", "coming out", "gender identity",
+    "pills", "rings", "periodic", "hivemind", "agreement", "lovely", "stis", "babysit",
+]
+
+FILLER = "what should i know about this and who can i talk to at school or home about it".split()
+
+
+def legacy_classify_intent(message: str, lang: str) -> str:
+    """classify_intent as it was before the compiled engine (one re.search per rule)"""
+    message_lower = message.lower()
+    for pattern, intent in INTENT_PATTERNS:
+        if re.search(pattern, message_lower, re.IGNORECASE):
+            return intent
+    return "basic_info"
+
+
+def _load_faq_questions():
+    """FAQ questions from the bundled data files"""
+    questions = []
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    for name in sorted(os.listdir(data_dir)):
+        if name.startswith("faq_en") and name.endswith(".json"):
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                questions.extend(item["question"] for item in json.load(f))
+    return questions
+
+
+def make_message(length: int, rng: random.Random) -> str:
+    """Filler of about `length` characters with zero to three intent phrases at random places"""
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(FILLER))
+    for _ in range(rng.randint(0, 3)):
+        phrase = rng.choice(PHRASES)
+        words.insert(rng.randint(0, len(words)), phrase.upper() if rng.random() < 0.2 else phrase)
+    return " ".join(words)
+
+
+def throughput(classify, messages) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        classify(message, "en")
+    return len(messages) / (time.perf_counter() - start)
+
+
+def run(count: int, length: int, seed: int) -> int:
+    logging.getLogger("SomaAI").setLevel(logging.WARNING)
+    rng = random.Random(seed)
+    messages = [make_message(length, rng) for _ in range(count)]
+    corpus = _load_faq_questions() + PHRASES + messages
+
+    mismatches = [(message, legacy_classify_intent(message, "en"), intent)
+                  for message, intent in zip(corpus, classify_many(corpus))
+                  if legacy_classify_intent(message, "en") != intent]
+    for message, expected, got in mismatches[:10]:
+        print(f"MISMATCH expected {expected} got {got}: {message[:80]!r}")
+
+    legacy = throughput(legacy_classify_intent, messages)
+    compiled = throughput(classify_intent, messages)
+    start = time.perf_counter()
+    classify_many(messages)
+    batch = len(messages) / (time.perf_counter() - start)
+
+    print(f"equivalence: {len(corpus) - len(mismatches)}/{len(corpus)} messages classified identically")
+    print(f"messages: {count}  length: ~{length} chars  rules: {len(INTENT_PATTERNS)}")
+    print(f"legacy loop:    {legacy:10.0f} msg/s")
+    print(f"compiled:       {compiled:10.0f} msg/s  ({compiled / legacy:.1f}x)")
+    print(f"classify_many:  {batch:10.0f} msg/s")
+    return 1 if mismatches else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--length", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(run(args.messages, args.length, args.seed))
+
+
+if __name__ == "__main__":
+    main()
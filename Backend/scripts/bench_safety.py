@@ -0,0 +1,119 @@
+"""
+Safety Check Benchmark
+Measures messages per second through the old per-pattern check_safety loop
+and the compiled engine on long (default 2,000 character) messages: once
+with every message distinct (verdict cache always missing) and once with a
+small set of messages repeated (verdict cache hits). Also checks that both
+return the same flags for every message.
+
+Usage (from Backend/):
+    python -m scripts.bench_safety [--messages 5000] [--length 2000] [--distinct 50]
+"""
+import argparse
+import logging
+import random
+import re
+import time
+from services import safety
+from services.safety import CRITICAL_BLOCKED_PATTERNS, WARNING_PATTERNS, check_safety
+
+FILLER = (
+    "what is the best way to talk to my partner about contraception and getting tested "
+    "i read that condoms protect against most infections but i am not sure how often "
+    "people should get checked and whether the clinic will tell my parents about it "
+).split()
+
+# Phrases mixed into some messages so every branch of the check is exercised
+WARNING_PHRASES = ["drugs", "self harm", "overdose"]
+BLOCKED_PHRASES = ["kill yourself", "human trafficking", "terrorist"]
+
+
+def legacy_check_safety(message: str, lang: str, context=None):
+    """check_safety as it was before the compiled engine (one re.search per pattern)"""
+    message_lower = message.lower().strip()
+    flags = []
+    for pattern in CRITICAL_BLOCKED_PATTERNS:
+        if re.search(pattern, message_lower, re.IGNORECASE):
+            return ["blocked"]
+    for pattern in WARNING_PATTERNS:
+        if re.search(pattern, message_lower, re.IGNORECASE):
+            flags.append("needs_review")
+            break
+    if context:
+        recent_messages = " ".join(context[-3:]).lower()
+        if any(pattern in recent_messages for pattern in CRITICAL_BLOCKED_PATTERNS):
+            flags.append("blocked_context")
+    words = message_lower.split()
+    if len(words) > 0:
+        word_counts = {}
+        for word in words:
+            word_counts[word] = word_counts.get(word, 0) + 1
+        max_repetition = max(word_counts.values())
+        if max_repetition > len(words) * 0.3:
+            flags.append("low_confidence")
+    return flags
+
+
+def make_message(length: int, rng: random.Random) -> str:
+    """Benign filler of about `length` characters, sometimes with a warning or blocked phrase near the end"""
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(FILLER)
+        words.append(word)
+        size += len(word) + 1
+    roll = rng.random()
+    if roll < 0.05:
+        words.insert(len(words) - rng.randint(1, 20), rng.choice(BLOCKED_PHRASES))
+    elif roll < 0.20:
+        words.insert(len(words) - rng.randint(1, 20), rng.choice(WARNING_PHRASES))
+    # A per-message tag keeps distinct messages distinct for the verdict cache
+    words.append(f"#{rng.getrandbits(32):08x}")
+    return " ".join(words)[:length + 10]
+
+
+def throughput(check, messages) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        check(message, "en")
+    return len(messages) / (time.perf_counter() - start)
+
+
+def run(count: int, length: int, distinct: int, seed: int):
+    # Blocked samples would otherwise log a warning each
+    logging.getLogger("SomaAI").setLevel(logging.ERROR)
+    rng = random.Random(seed)
+    unique = [make_message(length, rng) for _ in range(count)]
+    pool = unique[:distinct]
+    repeated = [rng.choice(pool) for _ in range(count)]
+
+    mismatches = sum(1 for message in unique if legacy_check_safety(message, "en") != check_safety(message, "en"))
+
+    legacy = throughput(legacy_check_safety, unique)
+    safety._verdicts = safety._VerdictCache(safety.SAFETY_CACHE_SIZE)
+    compiled_cold = throughput(check_safety, unique)
+    safety._verdicts = safety._VerdictCache(safety.SAFETY_CACHE_SIZE)
+    legacy_repeated = throughput(legacy_check_safety, repeated)
+    compiled_warm = throughput(check_safety, repeated)
+
+    print(f"messages: {count}  length: ~{length} chars  distinct (repeated run): {distinct}")
+    print(f"flag mismatches (no context): {mismatches}")
+    print(f"all distinct  legacy loop: {legacy:10.0f} msg/s   compiled: {compiled_cold:10.0f} msg/s  "
+          f"({compiled_cold / legacy:.1f}x)")
+    print(f"repeated      legacy loop: {legacy_repeated:10.0f} msg/s   compiled+memo: {compiled_warm:10.0f} msg/s  "
+          f"({compiled_warm / legacy_repeated:.1f}x, verdict cache hit rate "
+          f"{safety.get_safety_stats()['verdict_cache']['hit_rate']:.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--length", type=int, default=2000)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    run(args.messages, args.length, args.distinct, args.seed)
+
+
+if __name__ == "__main__":
+    main()
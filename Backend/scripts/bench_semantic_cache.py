@@ -0,0 +1,181 @@
+"""
+Semantic Cache Benchmark
+Replays a synthetic stream of paraphrased questions and compares the hit rate
+of the old raw-message cache key, the normalized exact key, and exact plus
+near-duplicate (MinHash LSH) lookups. Also reports wrong-question hits and
+lookup latency, and checks pairs that must (typos, filler) or must not
+(negations, added or swapped terms) share an answer. Exits non-zero if any
+of those pairs is answered wrongly.
+
+Usage (from Backend/):
+    python -m scripts.bench_semantic_cache [--queries 20000] [--threshold 0.8]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from services.semantic_cache import SemanticCache, normalize_query
+
+BASE_QUESTIONS = [
+    "What is HIV?", "How is HIV transmitted?", "What is AIDS?", "How can I prevent HIV?",
+    "What is PrEP?", "What are the symptoms of an STI?", "How do condoms work?",
+    "What is contraception?", "How does the pill work?", "What is an IUD?",
+    "Can I get pregnant on my period?", "What is a period?", "Why is my period late?",
+    "Is period pain normal?", "What is puberty?", "When does puberty start?",
+    "What is consent?", "How do I say no?", "What is a healthy relationship?",
+    "What is HPV?", "Is there a vaccine for HPV?", "What is chlamydia?",
+    "How do I know if I have an STI?", "Where can I get tested?", "What is emergency contraception?",
+    "How long does the morning after pill work?", "What is menstruation?", "What is ovulation?",
+    "How does pregnancy happen?", "What are the signs of pregnancy?", "What is a pap smear?",
+    "What is gonorrhea?", "Can STIs be cured?", "What is syphilis?", "How do I talk to my parents about sex?",
+    "What is body image?", "Is masturbation normal?", "What is sexual orientation?",
+    "What is gender identity?", "How do I use a condom correctly?"
+]
+
+PREFIXES = ["", "", "", "please ", "can you tell me ", "i want to know ", "hey ", "quick question: "]
+SUFFIXES = ["", "", "", " please", " thanks", "??", "!", " ?"]
+
+# (cached question, new question): same answer
+MUST_HIT = [
+    ("What is HIV?", "what is hiv please"),
+    ("How long does the morning after pill work?", "how long does the morning after pill wrok"),
+    ("How long does the morning after pill work?", "um how long does the morning after pill work"),
+]
+
+# (cached question, new question): different questions despite high similarity
+MUST_MISS = [
+    ("Is it safe to have sex during my period?", "Is it not safe to have sex during my period?"),
+    ("Is it normal to bleed after sex?", "Is it not normal to bleed after sex?"),
+    ("Can I get pregnant on my period?", "Can I not get pregnant on my period?"),
+    ("Should I take the morning after pill?", "Should I not take the morning after pill?"),
+    ("Do condoms protect against herpes?", "Do condoms protect against herpes and HPV?"),
+    ("Can I get pregnant on my period?", "Can't I get pregnant on my period?"),
+    ("What is HIV?", "What is HPV?"),
+    ("Est-ce que la pilule protège du VIH ?", "Est-ce que la pilule ne protège pas du VIH ?"),
+    ("¿Puedo quedar embarazada con la regla?", "¿No puedo quedar embarazada con la regla?"),
+]
+
+
+def check_pairs(threshold: float) -> int:
+    """Answer every MUST_HIT / MUST_MISS pair through a fresh cache; returns the number answered wrongly"""
+    failures = 0
+    for pairs, expected in ((MUST_HIT, True), (MUST_MISS, False)):
+        for cached, query in pairs:
+            semantic = SemanticCache(threshold=threshold, ttl_seconds=float("inf"))
+            semantic.add(cached, ("en",), cached)
+            if (semantic.lookup(query, ("en",)) is not None) != expected:
+                failures += 1
+                print(f"WRONG {'miss' if expected else 'hit'}: {query!r} for cached {cached!r}")
+    print(f"near-duplicate checks: {len(MUST_HIT) + len(MUST_MISS) - failures}/"
+          f"{len(MUST_HIT) + len(MUST_MISS)} answered correctly")
+    return failures
+
+
+def _load_faq_questions():
+    """FAQ questions from the bundled data files"""
+    questions = []
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    for name in sorted(os.listdir(data_dir)):
+        if name.startswith("faq_en") and name.endswith(".json"):
+            with open(os.path.join(data_dir, name), encoding="utf-8") as f:
+                questions.extend(item["question"] for item in json.load(f))
+    return questions
+
+
+def _typo(text: str, rng: random.Random) -> str:
+    """Swap two adjacent letters somewhere in the text"""
+    positions = [i for i in range(len(text) - 1) if text[i].isalpha() and text[i + 1].isalpha()]
+    if not positions:
+        return text
+    i = rng.choice(positions)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def paraphrase(question: str, rng: random.Random) -> str:
+    """Surface-level variant of a question as users type it"""
+    text = question
+    roll = rng.random()
+    if roll < 0.3:
+        text = text.lower()
+    elif roll < 0.4:
+        text = text.upper()
+    if rng.random() < 0.5:
+        text = text.rstrip("?")
+    if rng.random() < 0.15:
+        text = _typo(text, rng)
+    return rng.choice(PREFIXES) + text + rng.choice(SUFFIXES)
+
+
+def run(queries: int, threshold: float, seed: int) -> int:
+    rng = random.Random(seed)
+    questions = list(dict.fromkeys(BASE_QUESTIONS + _load_faq_questions()))
+    # Zipf-like popularity: a few questions dominate, like a class asking the same thing
+    weights = [1.0 / (rank + 1) for rank in range(len(questions))]
+
+    raw_cache, normalized_cache = {}, {}
+    semantic = SemanticCache(threshold=threshold, max_entries=100000, ttl_seconds=float("inf"))
+    partition = ("en", "simple", "basic_info", "model")
+
+    raw_hits = normalized_hits = semantic_hits = wrong_hits = 0
+    lookup_times = []
+
+    for _ in range(queries):
+        base = rng.choices(questions, weights)[0]
+        query = paraphrase(base, rng)
+
+        # Old behaviour: exact match on the raw message
+        if query[:100] in raw_cache:
+            raw_hits += 1
+        else:
+            raw_cache[query[:100]] = base
+
+        # Normalized exact key, then near-duplicate lookup
+        key = normalize_query(query)[:100]
+        if key in normalized_cache:
+            normalized_hits += 1
+            semantic_hits += 1
+            continue
+        normalized_cache[key] = base
+
+        start = time.perf_counter()
+        match = semantic.lookup(query, partition)
+        lookup_times.append(time.perf_counter() - start)
+        if match:
+            semantic_hits += 1
+            if match[0] != base:
+                wrong_hits += 1
+        else:
+            semantic.add(query, partition, base)
+
+    lookup_times.sort()
+    stats = semantic.get_stats()
+
+    def pct(p):
+        return lookup_times[min(int(len(lookup_times) * p), len(lookup_times) - 1)] * 1000
+
+    print(f"queries: {queries}  distinct questions: {len(questions)}  threshold: {threshold}")
+    print(f"raw message key hit rate:       {raw_hits / queries:.1%}")
+    print(f"normalized exact key hit rate:  {normalized_hits / queries:.1%}")
+    print(f"exact + semantic hit rate:      {semantic_hits / queries:.1%}  "
+          f"(uplift {(semantic_hits - raw_hits) / queries:+.1%} vs raw)")
+    print(f"semantic hits for the wrong question: {wrong_hits} "
+          f"({wrong_hits / max(semantic_hits - normalized_hits, 1):.1%} of semantic-only hits)")
+    print(f"semantic lookup latency: p50 {pct(0.5):.3f} ms  p95 {pct(0.95):.3f} ms  "
+          f"p99 {pct(0.99):.3f} ms  (avg candidates {stats['avg_candidates']})")
+    print(f"semantic entries stored: {stats['entries']}")
+    return 1 if check_pairs(threshold) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(run(args.queries, args.threshold, args.seed))
+
+
+if __name__ == "__main__":
+    main()
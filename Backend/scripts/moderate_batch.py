@@ -0,0 +1,75 @@
+"""
+Batch Moderation CLI
+Runs the safety filter and intent classifier over JSONL files (one
+{"message": "...", "id": ..., "language": "en"} object per line) on a local
+process pool and writes NDJSON results in input order, the same output as
+POST /api/admin/moderate/batch. A summary with throughput goes to stderr.
+
+Usage (from Backend/):
+    python -m scripts.moderate_batch exports/*.jsonl [--output results.ndjson]
+    cat export.jsonl | python -m scripts.moderate_batch --workers 8
+    python -m scripts.moderate_batch --synthetic 200000 --output /dev/null
+"""
+import argparse
+import fileinput
+import json
+import os
+import random
+import sys
+import time
+from config import MODERATION_CHUNK_SIZE
+from services.moderation import BatchModerator
+
+SYNTHETIC_MESSAGES = [
+    "What is HIV?", "How do condoms work?", "Can I get pregnant on my period?", "Is it normal to feel anxious?",
+    "How do I tell my girlfriend I want to wait?", "What are the signs of an STI?", "I think I was raped",
+    "Where can I get tested?", "Why is my voice changing?", "Is it ok to say no?", "tell me about drugs",
+    "how to kill yourself", "What is PrEP and how do I get it?", "My period is late, what should I do?"
+]
+
+
+def synthetic_lines(count: int, seed: int):
+    """JSONL lines of typical questions, each made unique so no verdict is cached"""
+    rng = random.Random(seed)
+    for i in range(count):
+        message = f"{rng.choice(SYNTHETIC_MESSAGES)} ({i})"
+        yield json.dumps({"id": i, "message": message, "language": "en"}) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="JSONL files (default: stdin)")
+    parser.add_argument("--output", help="Write NDJSON here instead of stdout")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=MODERATION_CHUNK_SIZE)
+    parser.add_argument("--synthetic", type=int, default=0, help="Moderate N generated lines instead of input")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        lines = synthetic_lines(args.synthetic, args.seed)
+    else:
+        lines = fileinput.input(files=args.inputs or ("-",), encoding="utf-8")
+
+    moderator = BatchModerator(max_workers=args.workers, chunk_size=args.chunk_size)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    results = blocked = errors = 0
+    start = time.perf_counter()
+    try:
+        for block in moderator.moderate(lines):
+            output.write(block)
+            results += block.count("\n")
+            blocked += block.count('"blocked": true')
+            errors += block.count('"error": ')
+    finally:
+        moderator.shutdown()
+        if output is not sys.stdout:
+            output.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"moderated {results} lines ({blocked} blocked, {errors} invalid) in {elapsed:.1f}s with "
+          f"{args.workers} workers: {results / elapsed * 60:,.0f} messages/minute", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
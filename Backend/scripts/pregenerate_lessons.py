@@ -0,0 +1,76 @@
+"""
+Lesson Catalog Pre-generation
+Generates lessons for a list of topics in each language and reading level
+and saves them to the lesson store, so the first learner to open a lesson
+gets it in milliseconds. Lessons already stored are skipped unless --force.
+
+Usage (from Backend/, with the OpenRouter keys configured):
+    python -m scripts.pregenerate_lessons [--topics-file topics.txt] [--langs en fr pt]
+                                          [--reading-levels simple] [--force]
+"""
+import argparse
+import time
+from config import ALLOWED_LANGS
+from services.lesson_store import lesson_store, canonical_topic
+from services.model_router import generate_lesson
+from services.admission import LoadShedError
+
+DEFAULT_TOPICS = [
+    "Puberty", "Menstruation", "Consent", "Healthy relationships", "Contraception",
+    "Condoms", "HIV prevention", "HIV testing", "STI prevention", "Pregnancy",
+    "Emergency contraception", "Body image", "Gender identity", "Sexual orientation",
+    "Mental health", "Online safety"
+]
+
+
+def _load_topics(path: str):
+    """One topic per line; blank lines and # comments ignored"""
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--topics-file", help="File with one topic per line (default: built-in catalog)")
+    parser.add_argument("--langs", nargs="+", default=[lang.strip() for lang in ALLOWED_LANGS])
+    parser.add_argument("--reading-levels", nargs="+", default=["simple"])
+    parser.add_argument("--force", action="store_true", help="Regenerate lessons already in the store")
+    args = parser.parse_args()
+
+    topics = _load_topics(args.topics_file) if args.topics_file else DEFAULT_TOPICS
+    # Topics that canonicalize to the same key are generated once
+    topics = list({canonical_topic(topic): topic for topic in topics}.values())
+
+    generated = skipped = failed = 0
+    for lang in args.langs:
+        for reading_level in args.reading_levels:
+            for topic in topics:
+                label = f"[{lang}/{reading_level}] {topic}"
+                if not args.force and lesson_store.get(topic, lang, reading_level):
+                    skipped += 1
+                    print(f"{label}: already stored")
+                    continue
+                if args.force:
+                    # Drop the stored copy so generate_lesson calls upstream
+                    lesson_store.delete(topic, lang, reading_level)
+
+                start = time.time()
+                try:
+                    generate_lesson({"language": lang, "reading_level": reading_level}, topic)
+                except LoadShedError:
+                    failed += 1
+                    print(f"{label}: upstream busy, skipped")
+                    continue
+                # Fallback lessons are returned but never stored
+                if lesson_store.get(topic, lang, reading_level):
+                    generated += 1
+                    print(f"{label}: generated in {time.time() - start:.1f}s")
+                else:
+                    failed += 1
+                    print(f"{label}: generation failed")
+
+    print(f"generated: {generated}  already stored: {skipped}  failed: {failed}")
+
+
+if __name__ == "__main__":
+    main()
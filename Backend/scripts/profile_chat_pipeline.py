@@ -0,0 +1,108 @@
+"""
+Chat Pipeline CPU Profile
+Times the CPU-only stages a /api/chat message goes through before any
+upstream call (validation, safety check with context, intent, popularity
+count, complexity estimate, cache key), once with every stage preparing the
+text on its own and once with a single shared AnalyzedMessage. Messages are
+all distinct so the safety verdict cache never hits.
+
+Usage (from Backend/):
+    python -m scripts.profile_chat_pipeline [--messages 5000] [--rounds 5] [--length 200] [--cprofile]
+"""
+import argparse
+import cProfile
+import logging
+import pstats
+import random
+import time
+from services.message_analysis import AnalyzedMessage
+from services.model_router import _chat_cache_key, _estimate_query_complexity
+from services.safety import check_safety, classify_intent
+from services.telemetry import record_question
+from utils.validators import validator
+
+WORDS = ("how do i know if i have an sti and where can i get tested near me "
+         "what is the best birth control for someone my age is it normal to feel anxious "
+         "about my first period why does my body change during puberty").split()
+
+SESSION = {"language": "en", "reading_level": "simple", "history": [{"role": "system", "content": "..."}] * 6}
+CONTEXT = ["what is puberty", "how long does a period last", "is it normal to have cramps"]
+MODEL = "meta-llama/llama-3.3-70b-instruct:free"
+
+
+def make_message(length: int, rng: random.Random) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    return " ".join(words).capitalize() + f" ({rng.getrandbits(32):08x})?"
+
+
+def separate(message: str):
+    """Every stage prepares the text itself (as before the shared analysis)"""
+    validator.validate_message(message)
+    check_safety(message, "en", context=CONTEXT)
+    intent = classify_intent(message, "en")
+    record_question("en", message)
+    _estimate_query_complexity(message, len(SESSION["history"]))
+    _chat_cache_key(SESSION, message, intent, MODEL)
+
+
+def shared(message: str):
+    """One analysis built up front and handed to every stage"""
+    analysis = AnalyzedMessage(message)
+    validator.validate_message(message, analysis=analysis)
+    check_safety(message, "en", context=CONTEXT, analysis=analysis)
+    intent = classify_intent(message, "en", analysis=analysis)
+    record_question("en", message, analysis=analysis)
+    _estimate_query_complexity(message, len(SESSION["history"]), analysis)
+    _chat_cache_key(SESSION, message, intent, MODEL, analysis)
+
+
+def timed(pipeline, messages) -> float:
+    """Microseconds per message"""
+    start = time.perf_counter()
+    for message in messages:
+        pipeline(message)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def run(count: int, length: int, rounds: int, seed: int, profile: bool):
+    logging.getLogger("SomaAI").setLevel(logging.ERROR)
+    rng = random.Random(seed)
+    # Variants alternate for a few rounds (best round kept) and always get fresh
+    # messages, so neither benefits from the other's safety verdicts
+    best = {"separate": float("inf"), "shared": float("inf")}
+    for _ in range(rounds):
+        for name, pipeline in (("separate", separate), ("shared", shared)):
+            messages = [make_message(length, rng) for _ in range(count)]
+            best[name] = min(best[name], timed(pipeline, messages))
+    print(f"messages: {count} x {rounds} rounds  length: ~{length} chars")
+    print(f"each stage prepares the text:  {best['separate']:8.1f} us/message")
+    print(f"one shared AnalyzedMessage:    {best['shared']:8.1f} us/message  "
+          f"({1 - best['shared'] / best['separate']:.0%} less CPU)")
+
+    if profile:
+        for name, pipeline in (("separate", separate), ("shared", shared)):
+            messages = [make_message(length, rng) for _ in range(count)]
+            profiler = cProfile.Profile()
+            profiler.enable()
+            for message in messages:
+                pipeline(message)
+            profiler.disable()
+            print(f"\n--- {name} (top functions by own time) ---")
+            pstats.Stats(profiler).sort_stats("tottime").print_stats(12)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="Messages per round")
+    parser.add_argument("--length", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--cprofile", action="store_true", help="Also print cProfile hot spots for each variant")
+    args = parser.parse_args()
+    run(args.messages, args.length, args.rounds, args.seed, args.cprofile)
+
+
+if __name__ == "__main__":
+    main()
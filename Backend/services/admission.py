@@ -0,0 +1,283 @@
+"""
+Upstream Admission Control
+Adaptive (AIMD) concurrency limit with a bounded, priority-ordered wait queue
+in front of the model router, so bursts are shed early instead of parking
+every worker thread, and crisis messages are never stuck behind casual ones
+"""
+import itertools
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Condition
+from typing import Dict, Any, Iterator, List, Optional
+from config import (LIMITER_INITIAL_LIMIT, LIMITER_MIN_LIMIT, LIMITER_MAX_LIMIT,
+                    LIMITER_QUEUE_SIZE, LIMITER_QUEUE_TIMEOUT, LIMITER_RESERVED_SLOTS,
+                    LIMITER_AGING_SECONDS)
+from utils.logger import logger
+
+# Priority classes (lower value is served first)
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_NAMES = {PRIORITY_CRITICAL: "critical", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+
+class LoadShedError(Exception):
+    """Raised when a request is rejected because the upstream queue is full"""
+
+    def __init__(self, retry_after: int, reason: str = "Upstream queue full"):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class _Slot:
+    """Handle for an admitted request; mark it failed so the limit backs off"""
+
+    def __init__(self):
+        self.failed = False
+        # Seconds of the hold not spent on upstream (a stream waiting on its client);
+        # left out of the latency that drives the limit
+        self.excluded = 0.0
+
+
+class _Waiter:
+    """A request queued for an upstream slot"""
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = time.time()
+        self.evicted = False
+
+    def rank(self, now: float, aging_seconds: float) -> float:
+        """Effective priority; improves the longer the request waits (starvation protection)"""
+        return self.priority - (now - self.enqueued_at) / aging_seconds
+
+
+class _PriorityStats:
+    """Per-priority admission counters"""
+
+    def __init__(self):
+        self.admitted = 0
+        self.shed = 0
+        self.wait_samples = deque(maxlen=1000)
+
+
+class AdaptiveLimiter:
+    """
+    Thread-safe adaptive in-flight limit with priority scheduling.
+    Grows additively while latency stays near the observed minimum, shrinks
+    multiplicatively on errors or when latency climbs (Vegas-style queueing signal).
+    Queued requests are admitted by priority (aged by wait time), the last
+    `reserved_slots` of the limit are kept for critical requests, and a full
+    queue evicts its lowest-priority waiter to make room for a higher one.
+    """
+
+    def __init__(self, initial_limit: int = 8, min_limit: int = 2, max_limit: int = 64,
+                 max_queue: int = 32, queue_timeout: float = 10.0,
+                 latency_tolerance: float = 2.0, backoff_ratio: float = 0.9,
+                 reserved_slots: int = 2, aging_seconds: float = 8.0):
+        """
+        Initialize limiter
+        Args:
+            initial_limit: Starting in-flight limit
+            min_limit: Lower bound for the limit
+            max_limit: Upper bound for the limit
+            max_queue: Requests allowed to wait for a slot before shedding
+            queue_timeout: Longest a request waits for a slot, in seconds
+            latency_tolerance: Latency / min latency ratio treated as queueing
+            backoff_ratio: Multiplicative decrease factor
+            reserved_slots: Slots only critical requests may use
+            aging_seconds: Wait after which a request ranks one class higher
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.reserved_slots = reserved_slots
+        self.aging_seconds = aging_seconds
+
+        self.in_flight = 0
+        self.waiters: List[_Waiter] = []
+        self.min_latency = None
+        self.avg_latency = None
+        self.cond = Condition()
+        self._seq = itertools.count()
+
+        self.max_queue_depth = 0
+        self.priority_stats = {priority: _PriorityStats() for priority in PRIORITY_NAMES}
+
+    def _capacity(self, priority: int) -> int:
+        """In-flight calls a request of this priority may join (caller holds the lock)"""
+        limit = int(self.limit)
+        if priority == PRIORITY_CRITICAL:
+            return limit
+        # Keep the reserve for critical requests, but never starve everyone else entirely
+        return max(limit - self.reserved_slots, 1)
+
+    def _is_next(self, waiter: _Waiter) -> bool:
+        """Whether this waiter is the best-ranked one that can be admitted now (caller holds the lock)"""
+        if self.in_flight >= self._capacity(waiter.priority):
+            return False
+        now = time.time()
+        admissible = [w for w in self.waiters if self.in_flight < self._capacity(w.priority)]
+        best = min(admissible, key=lambda w: (w.rank(now, self.aging_seconds), w.seq))
+        return best is waiter
+
+    def _retry_after(self) -> int:
+        """Seconds until the queue ahead would likely drain (caller holds the lock)"""
+        avg_latency = self.avg_latency or 5.0
+        estimate = (len(self.waiters) + 1) * avg_latency / max(self.limit, 1.0)
+        return int(min(max(math.ceil(estimate), 1), 60))
+
+    def _shed(self, priority: int, reason: str) -> LoadShedError:
+        """Count and build a shed error (caller holds the lock)"""
+        self.priority_stats[priority].shed += 1
+        retry_after = self._retry_after()
+        logger.warning("Shedding upstream request", reason=reason, priority=PRIORITY_NAMES[priority],
+                       in_flight=self.in_flight, limit=round(self.limit, 1),
+                       queue_depth=len(self.waiters), retry_after=retry_after)
+        return LoadShedError(retry_after, reason)
+
+    def _make_room(self, waiter: _Waiter) -> bool:
+        """
+        Evict the worst-ranked queued request if it ranks below `waiter`
+        (caller holds the lock). Returns False if nothing can be evicted.
+        """
+        now = time.time()
+        others = [w for w in self.waiters if w is not waiter]
+        if not others:
+            # Zero-length queue: nothing to evict, the request is shed
+            return False
+        victim = max(others, key=lambda w: (w.rank(now, self.aging_seconds), w.seq))
+        if victim.rank(now, self.aging_seconds) <= waiter.rank(now, self.aging_seconds):
+            return False
+        victim.evicted = True
+        self.waiters.remove(victim)
+        self.cond.notify_all()
+        return True
+
+    @contextmanager
+    def acquire(self, timeout: Optional[float] = None, priority: int = PRIORITY_NORMAL) -> Iterator[_Slot]:
+        """
+        Admit one upstream call, waiting in the bounded priority queue if needed.
+        Raises LoadShedError when the queue is full or the wait times out.
+
+        Args:
+            timeout: Longest to wait for a slot (capped at queue_timeout)
+            priority: PRIORITY_CRITICAL, PRIORITY_NORMAL or PRIORITY_LOW
+        """
+        max_wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        waiter = _Waiter(priority, next(self._seq))
+
+        with self.cond:
+            self.waiters.append(waiter)
+            try:
+                if not self._is_next(waiter):
+                    if len(self.waiters) > self.max_queue and not self._make_room(waiter):
+                        raise self._shed(priority, "Upstream queue full")
+                    self.max_queue_depth = max(self.max_queue_depth, len(self.waiters))
+
+                    while not self._is_next(waiter):
+                        if waiter.evicted:
+                            raise self._shed(priority, "Evicted by higher-priority request")
+                        remaining = max_wait - (time.time() - waiter.enqueued_at)
+                        if remaining <= 0:
+                            raise self._shed(priority, "Timed out waiting for upstream slot")
+                        self.cond.wait(remaining)
+            finally:
+                if not waiter.evicted:
+                    self.waiters.remove(waiter)
+
+            self.in_flight += 1
+            stats = self.priority_stats[priority]
+            stats.admitted += 1
+            stats.wait_samples.append(time.time() - waiter.enqueued_at)
+            in_flight_at_start = self.in_flight
+            # The next waiter in line may be admissible too
+            self.cond.notify_all()
+
+        slot = _Slot()
+        call_start = time.time()
+        try:
+            yield slot
+        except BaseException:
+            # Includes GeneratorExit: a streaming caller abandoned mid-call
+            slot.failed = True
+            raise
+        finally:
+            self._release(time.time() - call_start - slot.excluded, slot.failed, in_flight_at_start)
+
+    def _release(self, latency: float, failed: bool, in_flight_at_start: int):
+        """Return the slot and adapt the limit"""
+        with self.cond:
+            self.in_flight -= 1
+
+            if failed:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            else:
+                self.avg_latency = latency if self.avg_latency is None else (
+                    0.2 * latency + 0.8 * self.avg_latency
+                )
+                if self.min_latency is None or latency < self.min_latency:
+                    self.min_latency = latency
+                else:
+                    # Drift the baseline up slowly so it tracks a changing upstream
+                    self.min_latency += (latency - self.min_latency) * 0.01
+
+                if latency > self.min_latency * self.latency_tolerance:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                elif in_flight_at_start >= self.limit * 0.5:
+                    # Only grow when the current limit is actually being used
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+            self.cond.notify_all()
+
+    def queue_utilization(self) -> float:
+        """Queued requests as a fraction of the queue capacity"""
+        with self.cond:
+            return len(self.waiters) / max(self.max_queue, 1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Limiter metrics, with queue latency per priority class"""
+        with self.cond:
+            by_priority = {}
+            for priority, stats in self.priority_stats.items():
+                waits = sorted(stats.wait_samples)
+                by_priority[PRIORITY_NAMES[priority]] = {
+                    "queued": sum(1 for w in self.waiters if w.priority == priority),
+                    "admitted": stats.admitted,
+                    "shed": stats.shed,
+                    "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                    "p95_wait_ms": round(waits[min(int(len(waits) * 0.95), len(waits) - 1)] * 1000, 2) if waits else 0.0
+                }
+
+            return {
+                "limit": round(self.limit, 2),
+                "reserved_slots": self.reserved_slots,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self.waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "queue_capacity": self.max_queue,
+                "admitted": sum(s.admitted for s in self.priority_stats.values()),
+                "shed": sum(s.shed for s in self.priority_stats.values()),
+                "by_priority": by_priority,
+                "avg_latency_ms": round(self.avg_latency * 1000, 2) if self.avg_latency is not None else None,
+                "min_latency_ms": round(self.min_latency * 1000, 2) if self.min_latency is not None else None
+            }
+
+
+# Global limiter for OpenRouter calls
+upstream_limiter = AdaptiveLimiter(
+    initial_limit=LIMITER_INITIAL_LIMIT,
+    min_limit=LIMITER_MIN_LIMIT,
+    max_limit=LIMITER_MAX_LIMIT,
+    max_queue=LIMITER_QUEUE_SIZE,
+    queue_timeout=LIMITER_QUEUE_TIMEOUT,
+    reserved_slots=LIMITER_RESERVED_SLOTS,
+    aging_seconds=LIMITER_AGING_SECONDS
+)
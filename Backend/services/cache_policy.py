@@ -0,0 +1,108 @@
+"""
+Chat Cache Policies
+How long a chat answer may be served from cache, per intent and complexity,
+and the background refresher that regenerates stale answers
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, NamedTuple, Optional, Set
+from config import (CACHE_TTL_SECONDS, CACHE_INTENT_TTLS, CACHE_MEDIUM_TTL_RATIO, CACHE_STALE_GRACE_RATIO,
+                    CACHE_REFRESH_WORKERS)
+from utils.logger import logger
+
+# Sensitive and crisis answers are always generated for the person asking
+UNCACHEABLE_INTENTS = {"consent", "assault_support", "emergency", "crisis", "mental_health"}
+
+# Seconds an answer stays fresh for a simple question; factual topics change rarely
+DEFAULT_INTENT_TTLS = {
+    "basic_info": 3600,
+    "HIV_prevention": 3600,
+    "STI_info": 3600,
+    "contraception": 3600,
+    "puberty": 3600,
+    "pregnancy": 1800,
+    "LGBTQ": 1800,
+    "relationships": 900
+}
+
+# Complexity -> share of the intent TTL (complex answers depend on the conversation)
+COMPLEXITY_TTL_RATIOS = {
+    "simple": 1.0,
+    "medium": CACHE_MEDIUM_TTL_RATIO
+}
+
+
+class CachePolicy(NamedTuple):
+    """Freshness window and the stale-while-revalidate grace period after it, in seconds"""
+    ttl: float
+    grace: float
+
+
+def policy_for(intent: str, complexity: str) -> Optional[CachePolicy]:
+    """Cache policy for a chat answer, or None when it must not be cached"""
+    if intent in UNCACHEABLE_INTENTS or complexity not in COMPLEXITY_TTL_RATIOS:
+        return None
+    base_ttl = CACHE_INTENT_TTLS.get(intent, DEFAULT_INTENT_TTLS.get(intent, CACHE_TTL_SECONDS))
+    ttl = base_ttl * COMPLEXITY_TTL_RATIOS[complexity]
+    if ttl <= 0:
+        return None
+    return CachePolicy(ttl=ttl, grace=ttl * CACHE_STALE_GRACE_RATIO)
+
+
+class BackgroundRefresher:
+    """
+    Runs cache refreshes on a small thread pool, at most one per key at a
+    time, so a stale entry hit by many requests is regenerated once
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Set[str] = set()
+        self._lock = Lock()
+
+    def schedule(self, key: str, fn: Callable[[], None]) -> bool:
+        """
+        Run fn() in the background unless a refresh for `key` is already running
+
+        Returns:
+            True if a refresh was scheduled
+        """
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cache-refresh")
+            executor = self._executor
+
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                logger.error("Background cache refresh failed", error=e, key=key)
+            finally:
+                with self._lock:
+                    self._in_flight.discard(key)
+
+        executor.submit(run)
+        return True
+
+    def in_flight(self) -> int:
+        """Refreshes currently queued or running"""
+        with self._lock:
+            return len(self._in_flight)
+
+    def reset_after_fork(self):
+        """Worker threads do not survive fork; start a fresh pool in the child"""
+        self._executor = None
+        self._in_flight = set()
+        self._lock = Lock()
+
+
+# Global refresher for stale chat answers
+cache_refresher = BackgroundRefresher(max_workers=CACHE_REFRESH_WORKERS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=cache_refresher.reset_after_fork)
@@ -0,0 +1,195 @@
+"""
+Circuit Breaker
+Per-(model, API key) breakers driven by EWMA latency and error rate, so a
+degraded upstream is skipped instead of retried into
+"""
+import time
+from threading import Lock
+from typing import Dict, Any, Optional
+from config import (BREAKER_ERROR_THRESHOLD, BREAKER_LATENCY_THRESHOLD, BREAKER_OPEN_SECONDS,
+                    BREAKER_EWMA_ALPHA, BREAKER_MIN_SAMPLES)
+from services.openrouter_client import key_label
+from utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Returned as an error when a route's breaker turns a request away at dispatch"""
+
+
+class CircuitBreaker:
+    """Thread-safe closed / open / half-open breaker for one upstream route"""
+
+    def __init__(self, name: str, error_threshold: float = 0.5, latency_threshold: float = 20.0,
+                 open_seconds: float = 30.0, alpha: float = 0.3, min_samples: int = 5):
+        """
+        Initialize breaker
+        Args:
+            name: Route name used in logs and metrics
+            error_threshold: EWMA error rate (0-1) that opens the breaker
+            latency_threshold: EWMA latency in seconds that opens the breaker
+            open_seconds: How long the breaker stays open before a half-open probe
+            alpha: EWMA smoothing factor (higher reacts faster)
+            min_samples: Calls observed before the breaker may open
+        """
+        self.name = name
+        self.error_threshold = error_threshold
+        self.latency_threshold = latency_threshold
+        self.open_seconds = open_seconds
+        self.alpha = alpha
+        self.min_samples = min_samples
+
+        self.state = CLOSED
+        self.error_rate = 0.0
+        self.latency = None
+        self.samples = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self.times_opened = 0
+        self.lock = Lock()
+
+    def can_attempt(self) -> bool:
+        """
+        Whether allow_request would currently admit a request, without claiming
+        the half-open probe. For picking routes; call allow_request right
+        before actually sending.
+        """
+        now = time.time()
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return now - self.opened_at >= self.open_seconds
+            return self.probe_started_at is None or now - self.probe_started_at > self.open_seconds
+
+    def allow_request(self) -> bool:
+        """
+        Whether a request may be sent on this route; call it only when the
+        request is about to be sent.
+        An open breaker lets a single probe through once its cool-down has passed.
+        """
+        now = time.time()
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+
+            if self.state == OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self.probe_started_at = now
+                logger.info("Circuit breaker half-open", route=self.name)
+                return True
+
+            # Half-open: one probe at a time; a lost probe is retried after the cool-down
+            if self.probe_started_at is None or now - self.probe_started_at > self.open_seconds:
+                self.probe_started_at = now
+                return True
+            return False
+
+    def record_success(self, latency: float):
+        """Record a successful call and its latency in seconds"""
+        with self.lock:
+            self._observe(error=False, latency=latency)
+
+            if self.state == HALF_OPEN:
+                if self.latency is not None and self.latency >= self.latency_threshold:
+                    # Answered, but still too slow to take traffic
+                    self._open()
+                    return
+                self.state = CLOSED
+                self.error_rate = 0.0
+                self.probe_started_at = None
+                logger.info("Circuit breaker closed", route=self.name)
+                return
+
+            self._maybe_open()
+
+    def record_failure(self, latency: Optional[float] = None):
+        """Record a failed call (timeout, 429, 5xx, connection error)"""
+        with self.lock:
+            self._observe(error=True, latency=latency)
+
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+
+            self._maybe_open()
+
+    def _observe(self, error: bool, latency: Optional[float]):
+        """Update the EWMAs (caller holds the lock)"""
+        self.samples += 1
+        self.error_rate = self.alpha * (1.0 if error else 0.0) + (1 - self.alpha) * self.error_rate
+        if latency is not None:
+            self.latency = latency if self.latency is None else (
+                self.alpha * latency + (1 - self.alpha) * self.latency
+            )
+
+    def _maybe_open(self):
+        """Open the breaker if error rate or latency crossed a threshold (caller holds the lock)"""
+        if self.state != CLOSED or self.samples < self.min_samples:
+            return
+        too_slow = self.latency is not None and self.latency >= self.latency_threshold
+        if self.error_rate >= self.error_threshold or too_slow:
+            self._open()
+
+    def _open(self):
+        """Trip the breaker (caller holds the lock)"""
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.probe_started_at = None
+        self.times_opened += 1
+        logger.warning("Circuit breaker opened", route=self.name,
+                       error_rate=round(self.error_rate, 3),
+                       latency=round(self.latency, 3) if self.latency is not None else None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current breaker state for metrics"""
+        with self.lock:
+            return {
+                "state": self.state,
+                "error_rate": round(self.error_rate, 3),
+                "latency_ewma_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+                "samples": self.samples,
+                "times_opened": self.times_opened,
+                "open_for_seconds": round(max(self.open_seconds - (time.time() - self.opened_at), 0), 1)
+                if self.state == OPEN else 0
+            }
+
+
+class BreakerRegistry:
+    """Lazily created breakers keyed by (model, API key)"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = Lock()
+
+    def get(self, model: str, api_key: Optional[str]) -> CircuitBreaker:
+        """Breaker for a (model, key) route"""
+        name = f"{model}|{key_label(api_key)}"
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    name,
+                    error_threshold=BREAKER_ERROR_THRESHOLD,
+                    latency_threshold=BREAKER_LATENCY_THRESHOLD,
+                    open_seconds=BREAKER_OPEN_SECONDS,
+                    alpha=BREAKER_EWMA_ALPHA,
+                    min_samples=BREAKER_MIN_SAMPLES
+                )
+                self._breakers[name] = breaker
+            return breaker
+
+    def get_states(self) -> Dict[str, Dict[str, Any]]:
+        """Snapshot of every breaker keyed by "model|key_label" """
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+# Global breaker registry
+breakers = BreakerRegistry()
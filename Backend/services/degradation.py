@@ -0,0 +1,153 @@
+"""
+Load-Adaptive Degradation
+Watches live latency and queueing per model and flags a model as degraded
+while it is under pressure, with hysteresis so routing does not flap
+"""
+import time
+from threading import Lock
+from typing import Dict, Any, Optional
+from config import (DEGRADE_LATENCY_RATIO, DEGRADE_RECOVER_RATIO, DEGRADE_QUEUE_RATIO,
+                    DEGRADE_RECOVER_QUEUE_RATIO, DEGRADE_MIN_SECONDS)
+from services.admission import upstream_limiter
+from services.hedging import latency_tracker
+from services.openrouter_client import openrouter_client
+from utils.logger import logger
+
+# Recent successful calls whose median is compared against the baseline
+LATENCY_WINDOW = 10
+# How fast the latency baseline follows a slower upstream (per new sample)
+BASELINE_DRIFT = 0.01
+
+
+class _ModelState:
+    """Pressure state for one model"""
+
+    def __init__(self):
+        self.degraded = False
+        self.changed_at = 0.0
+        self.baseline = None
+        self.samples_seen = 0
+        self.reason = None
+        self.times_degraded = 0
+
+
+class DegradationPolicy:
+    """
+    Thread-safe per-model pressure detector.
+    A model degrades when its recent median latency reaches `latency_ratio`
+    times its baseline, its connection pools are saturated, or the shared
+    upstream queue is filling up. It recovers only once every signal is below
+    the lower recover thresholds and it has stayed degraded for `min_seconds`.
+    """
+
+    def __init__(self, latency_ratio: float = 3.0, recover_ratio: float = 1.5,
+                 queue_ratio: float = 0.5, recover_queue_ratio: float = 0.2,
+                 min_seconds: float = 30.0):
+        """
+        Initialize policy
+        Args:
+            latency_ratio: Recent / baseline latency that counts as pressure
+            recover_ratio: Recent / baseline latency below which pressure has cleared
+            queue_ratio: Upstream queue fill (0-1) that counts as pressure
+            recover_queue_ratio: Queue fill below which pressure has cleared
+            min_seconds: Shortest time a model stays degraded
+        """
+        self.latency_ratio = latency_ratio
+        self.recover_ratio = recover_ratio
+        self.queue_ratio = queue_ratio
+        self.recover_queue_ratio = recover_queue_ratio
+        self.min_seconds = min_seconds
+        self._states: Dict[str, _ModelState] = {}
+        self._lock = Lock()
+
+    def _latency_ratio(self, model: str, state: _ModelState) -> Optional[float]:
+        """Recent median latency over the baseline, updating the baseline (caller holds the lock)"""
+        recent = latency_tracker.recent_median(model, LATENCY_WINDOW)
+        age = latency_tracker.last_sample_age(model)
+        if recent is None or age is None:
+            return None
+
+        if state.baseline is None:
+            state.baseline = recent
+        ratio = recent / state.baseline if state.baseline else None
+
+        count = latency_tracker.sample_count(model)
+        if count != state.samples_seen:
+            new_samples = count - state.samples_seen
+            state.samples_seen = count
+            if recent < state.baseline:
+                state.baseline = recent
+            elif not state.degraded and ratio is not None and ratio < self.latency_ratio:
+                # Track a slowly changing upstream, but never learn the overload itself
+                state.baseline += (recent - state.baseline) * min(BASELINE_DRIFT * new_samples, 1.0)
+
+        # A degraded model gets little traffic; don't hold it down on stale samples
+        if age > self.min_seconds:
+            return None
+        return ratio
+
+    def is_degraded(self, model: str) -> bool:
+        """Evaluate the model's signals and report whether it is under pressure"""
+        now = time.time()
+        pool_load = openrouter_client.utilization(model)
+        queue_load = upstream_limiter.queue_utilization()
+
+        with self._lock:
+            state = self._states.setdefault(model, _ModelState())
+            latency_ratio = self._latency_ratio(model, state)
+
+            if state.degraded and now - state.changed_at < self.min_seconds:
+                return True
+
+            if not state.degraded:
+                reason = None
+                if latency_ratio is not None and latency_ratio >= self.latency_ratio:
+                    reason = "latency"
+                elif pool_load >= 1.0:
+                    reason = "connection_pool"
+                elif queue_load >= self.queue_ratio:
+                    reason = "upstream_queue"
+
+                if reason:
+                    state.degraded = True
+                    state.changed_at = now
+                    state.reason = reason
+                    state.times_degraded += 1
+                    logger.warning("Model under pressure, degrading", model=model, reason=reason,
+                                   latency_ratio=round(latency_ratio, 2) if latency_ratio else None,
+                                   pool_load=round(pool_load, 2), queue_load=round(queue_load, 2))
+            else:
+                cleared = ((latency_ratio is None or latency_ratio <= self.recover_ratio)
+                           and pool_load < 1.0 and queue_load <= self.recover_queue_ratio)
+                if cleared:
+                    state.degraded = False
+                    state.changed_at = now
+                    state.reason = None
+                    logger.info("Model pressure cleared, restoring", model=model)
+
+            return state.degraded
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-model degradation state"""
+        now = time.time()
+        with self._lock:
+            return {
+                model: {
+                    "degraded": state.degraded,
+                    "reason": state.reason,
+                    "times_degraded": state.times_degraded,
+                    "state_for_seconds": round(now - state.changed_at, 1) if state.changed_at else None,
+                    "baseline_latency_ms": round(state.baseline * 1000, 2) if state.baseline else None
+                }
+                for model, state in self._states.items()
+            }
+
+
+# Global degradation policy
+degradation_policy = DegradationPolicy(
+    latency_ratio=DEGRADE_LATENCY_RATIO,
+    recover_ratio=DEGRADE_RECOVER_RATIO,
+    queue_ratio=DEGRADE_QUEUE_RATIO,
+    recover_queue_ratio=DEGRADE_RECOVER_QUEUE_RATIO,
+    min_seconds=DEGRADE_MIN_SECONDS
+)
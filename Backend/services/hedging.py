@@ -0,0 +1,164 @@
+"""
+Hedged Upstream Requests
+Fires a backup request when the first one is slower than the model usually is,
+and takes whichever answers first
+"""
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait, FIRST_COMPLETED
+from threading import Lock
+from typing import Any, Callable, Optional, Tuple
+from config import HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_MAX_WORKERS
+from services.telemetry import record_hedge, record_hedge_latency_saved
+from utils.logger import logger
+
+# Delay used until a model has enough latency samples for a percentile
+DEFAULT_HEDGE_DELAY = 10.0
+MIN_LATENCY_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Thread-safe rolling window of successful call latencies per model"""
+
+    def __init__(self, sample_size: int = 200):
+        """
+        Initialize tracker
+        Args:
+            sample_size: Number of recent samples kept per model
+        """
+        self.samples = defaultdict(lambda: deque(maxlen=sample_size))
+        self.recorded = defaultdict(int)
+        self.last_recorded_at = {}
+        self.lock = Lock()
+
+    def record(self, model: str, duration: float):
+        """Record a successful call duration in seconds"""
+        with self.lock:
+            self.samples[model].append(duration)
+            self.recorded[model] += 1
+            self.last_recorded_at[model] = time.time()
+
+    def recent_median(self, model: str, window: int) -> Optional[float]:
+        """Median of the last `window` latencies for a model, or None with fewer samples"""
+        with self.lock:
+            samples = self.samples.get(model, ())
+            if len(samples) < window:
+                return None
+            recent = sorted(list(samples)[-window:])
+        return recent[len(recent) // 2]
+
+    def last_sample_age(self, model: str) -> Optional[float]:
+        """Seconds since the model's last recorded latency"""
+        with self.lock:
+            recorded_at = self.last_recorded_at.get(model)
+        return None if recorded_at is None else time.time() - recorded_at
+
+    def sample_count(self, model: str) -> int:
+        """Total latencies recorded for a model"""
+        with self.lock:
+            return self.recorded.get(model, 0)
+
+    def percentile(self, model: str, p: float) -> Optional[float]:
+        """Latency percentile for a model, or None with too few samples"""
+        with self.lock:
+            samples = sorted(self.samples.get(model, ()))
+        if len(samples) < MIN_LATENCY_SAMPLES:
+            return None
+        return samples[min(int(len(samples) * p), len(samples) - 1)]
+
+
+latency_tracker = LatencyTracker()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Lazily create the shared hedging thread pool"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _executor
+
+
+def _reset_after_fork():
+    """Worker threads do not survive fork; start a fresh pool in the child"""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def hedge_delay(model: str) -> float:
+    """How long to wait on the first request before firing the hedge"""
+    observed = latency_tracker.percentile(model, HEDGE_PERCENTILE)
+    if observed is None:
+        return max(DEFAULT_HEDGE_DELAY, HEDGE_MIN_DELAY)
+    return max(observed, HEDGE_MIN_DELAY)
+
+
+def _succeeded(result: Tuple[Any, Optional[Exception]]) -> bool:
+    content, error = result
+    return bool(content) and error is None
+
+
+def hedged_call(primary: Callable[[], Tuple[Any, Optional[Exception]]],
+                backup: Callable[[], Tuple[Any, Optional[Exception]]],
+                delay: float) -> Tuple[Tuple[Any, Optional[Exception]], bool]:
+    """
+    Run primary; if it has not answered within `delay`, also run backup and
+    return the first successful result. The losing call is left to finish in
+    the background and its result is ignored.
+
+    Args:
+        primary: Callable returning (content, error)
+        backup: Callable returning (content, error)
+        delay: Seconds to wait before hedging
+
+    Returns:
+        ((content, error), backup_won)
+    """
+    start_time = time.time()
+    primary_future = _get_executor().submit(primary)
+
+    try:
+        result = primary_future.result(timeout=delay)
+        record_hedge(fired=False)
+        return result, False
+    except FuturesTimeout:
+        pass
+
+    logger.info("Hedging slow upstream request", delay=round(delay, 2))
+    backup_future = _get_executor().submit(backup)
+    pending = {primary_future, backup_future}
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            result = future.result()
+            if not _succeeded(result):
+                continue
+
+            backup_won = future is backup_future
+            record_hedge(fired=True, won=backup_won)
+            if backup_won:
+                won_at = time.time() - start_time
+                primary_future.add_done_callback(
+                    lambda f: _record_saved(f, start_time, won_at)
+                )
+            return result, backup_won
+
+    # Both failed: surface the primary's error
+    record_hedge(fired=True, won=False)
+    return primary_future.result(), False
+
+
+def _record_saved(primary_future, start_time: float, won_at: float):
+    """Once the losing primary finishes, record how much sooner the hedge answered"""
+    if _succeeded(primary_future.result()):
+        record_hedge_latency_saved(time.time() - start_time - won_at)
@@ -0,0 +1,128 @@
+"""
+Idempotent Chat Requests
+Remembers /api/chat responses by (session, Idempotency-Key) for a short
+window, so a client retry replays the original response (or waits for it
+while it is still being generated) instead of running the pipeline again
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Dict, Optional, Tuple
+from config import IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS
+
+# Longest Idempotency-Key header accepted
+MAX_KEY_LENGTH = 255
+
+# Outcomes of IdempotencyStore.begin
+NEW = "new"
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+MISMATCH = "mismatch"
+
+
+def fingerprint(message: str) -> str:
+    """Digest of the request payload a key was first used with"""
+    return hashlib.sha256(message.encode("utf-8")).hexdigest()
+
+
+class _Record:
+    """One keyed request: in flight until `done` is set"""
+
+    __slots__ = ("fingerprint", "done", "status", "body", "expires_at")
+
+    def __init__(self, request_fingerprint: str):
+        self.fingerprint = request_fingerprint
+        self.done = Event()
+        self.status: Optional[int] = None
+        self.body: Optional[Dict[str, Any]] = None
+        self.expires_at = float("inf")
+
+
+class IdempotencyStore:
+    """
+    Thread-safe store of keyed chat responses.
+    Only the first request for a key runs; completed responses are kept for
+    `ttl_seconds` and at most `max_keys` are held (oldest dropped first).
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_keys: int = 10000):
+        """
+        Initialize store
+        Args:
+            ttl_seconds: How long a completed response is replayed
+            max_keys: Maximum keys held across all sessions
+        """
+        self.ttl = ttl_seconds
+        self.max_keys = max_keys
+        self._records: "OrderedDict[Tuple[str, str], _Record]" = OrderedDict()
+        self._lock = Lock()
+
+    def _prune(self, now: float):
+        """Drop expired and surplus completed records (caller holds the lock)"""
+        for record_key in list(self._records):
+            record = self._records[record_key]
+            if record.expires_at > now and len(self._records) <= self.max_keys:
+                break
+            # In-flight records are never dropped; their requests still need them
+            if record.done.is_set():
+                del self._records[record_key]
+
+    def begin(self, session_id: str, key: str, request_fingerprint: str) -> Tuple[str, _Record]:
+        """
+        Claim a key for a request
+
+        Returns:
+            (outcome, record): NEW means this caller runs the request and must
+            call complete() or abandon(); IN_FLIGHT means wait() on the
+            original; COMPLETED carries the stored response; MISMATCH means
+            the key was used with a different message
+        """
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            record = self._records.get((session_id, key))
+            if record is None or (record.done.is_set() and record.expires_at <= now):
+                record = _Record(request_fingerprint)
+                self._records[(session_id, key)] = record
+                return NEW, record
+            if record.fingerprint != request_fingerprint:
+                return MISMATCH, record
+            return (COMPLETED if record.done.is_set() else IN_FLIGHT), record
+
+    def complete(self, session_id: str, key: str, record: _Record, status: int, body: Dict[str, Any]):
+        """Store the response of a request started with begin()"""
+        with self._lock:
+            record.status = status
+            record.body = body
+            record.expires_at = time.time() + self.ttl
+            self._records[(session_id, key)] = record
+            self._records.move_to_end((session_id, key))
+        record.done.set()
+
+    def abandon(self, session_id: str, key: str, record: _Record):
+        """Forget a request that failed transiently, so a retry runs it again"""
+        with self._lock:
+            if self._records.get((session_id, key)) is record:
+                del self._records[(session_id, key)]
+        record.done.set()
+
+    @staticmethod
+    def wait(record: _Record, timeout: Optional[float]) -> bool:
+        """Wait for an in-flight original; True once it has finished (stored or abandoned)"""
+        return record.done.wait(timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Keys held and how many are still in flight"""
+        with self._lock:
+            in_flight = sum(1 for record in self._records.values() if not record.done.is_set())
+            return {
+                "keys": len(self._records),
+                "in_flight": in_flight,
+                "max_keys": self.max_keys,
+                "ttl_seconds": self.ttl
+            }
+
+
+# Global idempotency store for /api/chat
+idempotency_store = IdempotencyStore(ttl_seconds=IDEMPOTENCY_TTL_SECONDS, max_keys=IDEMPOTENCY_MAX_KEYS)
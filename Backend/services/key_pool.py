@@ -0,0 +1,204 @@
+"""
+OpenRouter API Key Pool
+Spreads upstream calls over every configured key, least-loaded first, and
+benches keys that are being rate limited
+"""
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Any, Iterable, Iterator, List, Optional
+from config import (OPENROUTER_API_KEYS, OPENROUTER_API_KEY_PRIMARY, OPENROUTER_API_KEY_SECONDARY,
+                    KEY_QUARANTINE_SECONDS, KEY_QUARANTINE_MAX_SECONDS, KEY_THROTTLE_WINDOW)
+from services.openrouter_client import key_label
+from utils.logger import logger
+
+
+def _parse_reset(value: Optional[str], now: float) -> Optional[float]:
+    """Epoch seconds from an X-RateLimit-Reset header (epoch ms, epoch s or delta s)"""
+    if not value:
+        return None
+    try:
+        reset = float(value)
+    except ValueError:
+        return None
+    if reset > 1e12:
+        return reset / 1000.0
+    if reset > 1e9:
+        return reset
+    return now + reset
+
+
+class _KeyState:
+    """Usage and rate-limit state for one API key"""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.label = key_label(api_key)
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.recent_throttles = deque()
+        self.consecutive_throttles = 0
+        self.quarantined_until = 0.0
+        self.rate_limit = None
+        self.rate_remaining = None
+        self.rate_reset_at = None
+
+    def load(self) -> tuple:
+        """Sort key: fewer in-flight calls and recent 429s first, then most quota left"""
+        if self.rate_limit and self.rate_remaining is not None:
+            headroom = self.rate_remaining / self.rate_limit
+        else:
+            headroom = 1.0
+        return (self.in_flight + 2 * len(self.recent_throttles), -headroom, self.requests)
+
+
+class KeyPool:
+    """Thread-safe pool of OpenRouter API keys"""
+
+    def __init__(self, keys: Iterable[str], quarantine_seconds: float = 15.0,
+                 max_quarantine_seconds: float = 300.0, throttle_window: float = 60.0):
+        """
+        Initialize pool
+        Args:
+            keys: API keys (duplicates and blanks are dropped)
+            quarantine_seconds: Bench time after a first 429
+            max_quarantine_seconds: Cap for the doubling bench time on repeated 429s
+            throttle_window: How long a 429 counts against a key's load
+        """
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self.throttle_window = throttle_window
+        self._keys: Dict[str, _KeyState] = {
+            key: _KeyState(key) for key in dict.fromkeys(k for k in keys if k)
+        }
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _expire_throttles(self, state: _KeyState, now: float):
+        """Drop 429s older than the window (caller holds the lock)"""
+        while state.recent_throttles and now - state.recent_throttles[0] > self.throttle_window:
+            state.recent_throttles.popleft()
+
+    def _available(self, state: _KeyState, now: float) -> bool:
+        """Not benched and not known to be out of quota (caller holds the lock)"""
+        if state.quarantined_until > now:
+            return False
+        if state.rate_remaining == 0 and state.rate_reset_at and state.rate_reset_at > now:
+            return False
+        return True
+
+    def ranked(self) -> List[str]:
+        """
+        Keys in the order they should be tried: healthy keys least-loaded first.
+        If every key is benched, all keys are returned soonest-available first
+        rather than failing outright.
+        """
+        now = time.time()
+        with self._lock:
+            states = list(self._keys.values())
+            for state in states:
+                self._expire_throttles(state, now)
+
+            healthy = [s for s in states if self._available(s, now)]
+            if healthy:
+                return [s.api_key for s in sorted(healthy, key=lambda s: s.load())]
+            return [s.api_key for s in sorted(states, key=lambda s: max(s.quarantined_until,
+                                                                       s.rate_reset_at or 0.0))]
+
+    def is_available(self, api_key: str) -> bool:
+        """Whether a key may take traffic right now"""
+        with self._lock:
+            state = self._keys.get(api_key)
+            return state is None or self._available(state, time.time())
+
+    @contextmanager
+    def track(self, api_key: str) -> Iterator[None]:
+        """Count a call against a key while it is in flight"""
+        state = self._keys.get(api_key)
+        if state is None:
+            yield
+            return
+
+        with self._lock:
+            state.in_flight += 1
+            state.requests += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                state.in_flight -= 1
+
+    def record_response(self, api_key: str, status_code: Optional[int], headers: Optional[dict] = None,
+                        retry_after: Optional[float] = None):
+        """
+        Update a key from an upstream response: rate-limit headers always,
+        and a quarantine on 429
+        """
+        state = self._keys.get(api_key)
+        if state is None:
+            return
+
+        now = time.time()
+        headers = headers or {}
+        with self._lock:
+            try:
+                if headers.get("X-RateLimit-Limit") is not None:
+                    state.rate_limit = int(float(headers["X-RateLimit-Limit"]))
+                if headers.get("X-RateLimit-Remaining") is not None:
+                    state.rate_remaining = int(float(headers["X-RateLimit-Remaining"]))
+            except ValueError:
+                pass
+            reset_at = _parse_reset(headers.get("X-RateLimit-Reset"), now)
+            if reset_at is not None:
+                state.rate_reset_at = reset_at
+
+            if status_code != 429:
+                if status_code is not None and status_code < 400:
+                    state.consecutive_throttles = 0
+                return
+
+            state.throttled += 1
+            state.consecutive_throttles += 1
+            state.recent_throttles.append(now)
+            bench = min(self.quarantine_seconds * 2 ** (state.consecutive_throttles - 1),
+                        self.max_quarantine_seconds)
+            if retry_after is not None:
+                bench = max(bench, retry_after)
+            if state.rate_remaining == 0 and state.rate_reset_at:
+                bench = max(bench, state.rate_reset_at - now)
+            state.quarantined_until = max(state.quarantined_until, now + bench)
+
+        logger.warning("API key throttled, quarantining", key=state.label, seconds=round(bench, 1),
+                       consecutive=state.consecutive_throttles)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-key metrics keyed by key label"""
+        now = time.time()
+        with self._lock:
+            stats = {}
+            for state in self._keys.values():
+                self._expire_throttles(state, now)
+                stats[state.label] = {
+                    "in_flight": state.in_flight,
+                    "requests": state.requests,
+                    "throttled": state.throttled,
+                    "recent_throttles": len(state.recent_throttles),
+                    "quarantined_for_seconds": round(max(state.quarantined_until - now, 0), 1),
+                    "rate_limit": state.rate_limit,
+                    "rate_remaining": state.rate_remaining,
+                    "available": self._available(state, now)
+                }
+            return stats
+
+
+# Global key pool
+key_pool = KeyPool(
+    OPENROUTER_API_KEYS + [OPENROUTER_API_KEY_PRIMARY, OPENROUTER_API_KEY_SECONDARY],
+    quarantine_seconds=KEY_QUARANTINE_SECONDS,
+    max_quarantine_seconds=KEY_QUARANTINE_MAX_SECONDS,
+    throttle_window=KEY_THROTTLE_WINDOW
+)
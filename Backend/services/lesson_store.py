@@ -0,0 +1,97 @@
+"""
+Lesson Store
+Generated lessons keyed by canonical topic, language and reading level,
+kept in memory and in a SQLite file under STATE_DIR so they survive
+restarts and are shared by every worker
+"""
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+from config import STATE_DIR, LESSON_TTL_SECONDS, LESSON_STORE_MAX_ENTRIES, LESSON_PROMPT_VERSION
+from services.semantic_cache import normalize_query
+from utils.cache import ResponseCache
+from utils.disk_cache import DiskCache
+
+# Lessons held in each worker's memory tier; the rest are read from disk
+MEMORY_ENTRIES = 500
+
+
+def canonical_topic(topic: str) -> str:
+    """Topic as stored: "HIV Prevention " and "hiv prevention?" share one entry"""
+    return normalize_query(topic)[:100]
+
+
+class LessonStore:
+    """
+    Two-tier lesson store. Keys embed the prompt version, so bumping
+    LESSON_PROMPT_VERSION retires every lesson generated by an older prompt
+    (old rows age out of the disk file).
+    """
+
+    def __init__(self, path: Optional[str], ttl_seconds: float, max_entries: int, version: int):
+        """
+        Initialize store
+        Args:
+            path: SQLite file for the disk tier (None keeps lessons in memory only)
+            ttl_seconds: How long a generated lesson is served
+            max_entries: Lessons kept on disk
+            version: Lesson prompt version
+        """
+        self.version = version
+        self.ttl = ttl_seconds
+        self._cache = ResponseCache(
+            ttl_seconds=ttl_seconds,
+            max_size=min(MEMORY_ENTRIES, max_entries),
+            disk=DiskCache(path, max_entries=max_entries) if path else None
+        )
+
+    def key(self, topic: str, lang: str, reading_level: str) -> str:
+        """Store (and single-flight) key for a lesson"""
+        return f"lesson:v{self.version}:{lang}:{reading_level}:{canonical_topic(topic)}"
+
+    def get(self, topic: str, lang: str, reading_level: str) -> Optional[Tuple[dict, str]]:
+        """
+        Look up a stored lesson
+
+        Returns:
+            (lesson_json, model) or None
+        """
+        stored = self._cache.get_key(self.key(topic, lang, reading_level))
+        if stored is None:
+            return None
+        return stored["lesson"], stored["model"]
+
+    def put(self, topic: str, lang: str, reading_level: str, lesson: dict, model: str):
+        """Store a generated lesson"""
+        self._cache.set_key(self.key(topic, lang, reading_level), {
+            "lesson": lesson,
+            "model": model,
+            "topic": canonical_topic(topic),
+            "version": self.version,
+            "created_at": time.time()
+        })
+
+    def delete(self, topic: str, lang: str, reading_level: str):
+        """Drop one stored lesson"""
+        self._cache.delete_key(self.key(topic, lang, reading_level))
+
+    def clear(self) -> int:
+        """Drop every stored lesson; returns the number removed"""
+        return self._cache.invalidate("lesson")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit counters for both tiers and the current prompt version"""
+        stats = self._cache.get_stats()
+        stats["version"] = self.version
+        stats["ttl_seconds"] = self.ttl
+        stats.pop("by_prefix", None)
+        return stats
+
+
+# Global lesson store
+lesson_store = LessonStore(
+    path=os.path.join(STATE_DIR, "lessons.db") if STATE_DIR else None,
+    ttl_seconds=LESSON_TTL_SECONDS,
+    max_entries=LESSON_STORE_MAX_ENTRIES,
+    version=LESSON_PROMPT_VERSION
+)
@@ -0,0 +1,65 @@
+"""
+Message Analysis
+Text forms of one chat message (stripped, lowercased, tokens, normalized
+cache form) computed once and shared by the validator, safety filter,
+intent classifier, complexity estimate and cache keys, together with what
+each of those stages matched
+"""
+import hashlib
+from collections import Counter
+from functools import cached_property
+from typing import List, Optional
+from services.semantic_cache import normalize_query
+
+
+class AnalyzedMessage:
+    """
+    One message as the chat pipeline sees it. Each text form is derived on
+    first use and kept; stage results are filled in by the stage that
+    computes them, so a later stage (or a second call) reuses them.
+    """
+
+    def __init__(self, text: str):
+        """
+        Initialize analysis
+        Args:
+            text: Message as received
+        """
+        self.text = text
+        # Stage results: safety verdict (services.safety._Verdict), intent,
+        # and number of complexity cues matched
+        self.safety = None
+        self.intent: Optional[str] = None
+        self.complexity_cues: Optional[int] = None
+
+    @cached_property
+    def stripped(self) -> str:
+        return self.text.strip()
+
+    @cached_property
+    def lower(self) -> str:
+        return self.stripped.lower()
+
+    @cached_property
+    def tokens(self) -> List[str]:
+        """Whitespace-separated words of the lowercased message"""
+        return self.lower.split()
+
+    @cached_property
+    def token_counts(self) -> Counter:
+        return Counter(self.tokens)
+
+    @cached_property
+    def normalized(self) -> str:
+        """Cache / popularity form (see normalize_query)"""
+        return normalize_query(self.text)
+
+    @cached_property
+    def digest(self) -> bytes:
+        """Digest of the lowercased message, for verdict memoization"""
+        return hashlib.blake2b(self.lower.encode("utf-8"), digest_size=16).digest()
+
+
+def analyze(message: str, analysis: Optional[AnalyzedMessage] = None) -> AnalyzedMessage:
+    """The analysis passed along with a message, or a fresh one"""
+    return analysis if analysis is not None else AnalyzedMessage(message)
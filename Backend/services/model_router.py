@@ -4,13 +4,31 @@ Intelligently routes requests to appropriate AI models based on query complexity
 intent, safety requirements, and context.
 """
 import requests
+import random
 import time
 import re
 import json
-from typing import Tuple, Optional
-from config import OPENROUTER_API_KEY_PRIMARY, OPENROUTER_API_KEY_SECONDARY
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Set, Tuple, Optional
+from config import (ENABLE_HEDGING, ENABLE_SEMANTIC_CACHE, MODEL_FAILOVER_CHAIN, ENABLE_DEGRADATION, DEGRADE_MAX_TOKENS_FACTOR, CHAT_DEADLINE_SECONDS, LESSON_DEADLINE_SECONDS,
+                    NEGATIVE_CACHE_SECONDS, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+from services.circuit_breaker import breakers, CircuitOpenError
+from services.key_pool import key_pool
+from services.degradation import degradation_policy
+from services.token_budget import token_budget, BudgetKey
+from services.semantic_cache import semantic_cache
+from services.message_analysis import AnalyzedMessage, analyze
+from services.telemetry import record_downgrade, record_coalesced, record_chat_cache_event
+from services.cache_policy import CachePolicy, policy_for, cache_refresher
+from services.lesson_store import lesson_store
+from services.openrouter_client import openrouter_client
+from services.hedging import hedged_call, hedge_delay, latency_tracker
+from services.admission import upstream_limiter, LoadShedError, PRIORITY_CRITICAL, PRIORITY_NORMAL, PRIORITY_LOW
 from utils.logger import logger
 from utils.cache import cache
+from utils.singleflight import single_flight
+from utils.deadline import Deadline, DeadlineExceeded
 
 # Model names as required by OpenRouter
 MISTRAL_NEMO_MODEL = "mistralai/mistral-nemo:free"
@@ -18,11 +36,28 @@ LLAMA3_70B_MODEL = "meta-llama/llama-3.3-70b-instruct:free"
 
 # API configuration
 OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-REQUEST_TIMEOUT = 30
+REQUEST_TIMEOUT = 30  # Per-attempt cap; the request deadline usually binds first
 MAX_RETRIES = 2
+MIN_ATTEMPT_TIMEOUT = 2.0  # Don't start an attempt with less budget than this
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
 
+# Intents that always get the advanced model
+SENSITIVE_INTENTS = {"consent", "assault_support", "emergency", "crisis"}
 
-def _estimate_query_complexity(message: str, history_length: int) -> str:
+# Intents that skip the upstream queue and may use reserved slots
+CRISIS_INTENTS = {"emergency", "assault_support", "mental_health", "crisis"}
+
+
+# Cues that a question needs a longer, more careful answer
+COMPLEX_INDICATORS = [
+    re.compile(r'\b(why|how|explain|describe|compare|analyze|evaluate|discuss)\b'),
+    re.compile(r'\b(what is|what are|what causes|what happens)\b'),
+    re.compile(r'\?.*\?'),  # Multiple questions
+]
+
+
+def _estimate_query_complexity(message: str, history_length: int,
+                               analysis: Optional[AnalyzedMessage] = None) -> str:
     """
     Estimate query complexity to determine appropriate model
     Returns: "simple", "medium", or "complex"
@@ -32,14 +67,10 @@ def _estimate_query_complexity(message: str, history_length: int) -> str:
         return "complex"
     
     # Check for complex questions
-    complex_indicators = [
-        r'\b(why|how|explain|describe|compare|analyze|evaluate|discuss)\b',
-        r'\b(what is|what are|what causes|what happens)\b',
-        r'\?.*\?',  # Multiple questions
-    ]
-    
-    message_lower = message.lower()
-    complex_count = sum(1 for pattern in complex_indicators if re.search(pattern, message_lower))
+    analysis = analyze(message, analysis)
+    if analysis.complexity_cues is None:
+        analysis.complexity_cues = sum(1 for pattern in COMPLEX_INDICATORS if pattern.search(analysis.lower))
+    complex_count = analysis.complexity_cues
     
     # Check history length (longer conversations may need better context understanding)
     if history_length > 15:
@@ -75,106 +106,456 @@ def _calculate_confidence(data: dict, model: str) -> float:
         return 0.80
 
 
-def _select_model(intent: str, safety_flags: list, complexity: str, message: str) -> Tuple[str, str]:
+def _preferred_model(intent: str, safety_flags: list, complexity: str) -> str:
     """
-    Intelligently select the best model for the query
-    Returns: (model_name, api_key)
+    Pick the model best suited to the query, ignoring upstream health
     """
     # Always use advanced model for sensitive topics
-    sensitive_intents = {"consent", "assault_support", "emergency", "crisis"}
-    if intent in sensitive_intents or "blocked_context" in safety_flags:
+    if intent in SENSITIVE_INTENTS or "blocked_context" in safety_flags:
         logger.info("Using advanced model for sensitive topic", intent=intent, model=LLAMA3_70B_MODEL)
-        return LLAMA3_70B_MODEL, OPENROUTER_API_KEY_SECONDARY or OPENROUTER_API_KEY_PRIMARY
+        return LLAMA3_70B_MODEL
     
     # Use advanced model for complex queries
     if complexity == "complex":
         logger.info("Using advanced model for complex query", complexity=complexity, model=LLAMA3_70B_MODEL)
-        return LLAMA3_70B_MODEL, OPENROUTER_API_KEY_SECONDARY or OPENROUTER_API_KEY_PRIMARY
+        return LLAMA3_70B_MODEL
     
     # Use advanced model if safety flags indicate concerns
     if "low_confidence" in safety_flags or "needs_review" in safety_flags:
         logger.info("Using advanced model for safety review", flags=safety_flags, model=LLAMA3_70B_MODEL)
-        return LLAMA3_70B_MODEL, OPENROUTER_API_KEY_SECONDARY or OPENROUTER_API_KEY_PRIMARY
+        return LLAMA3_70B_MODEL
     
     # Default to faster model for simple queries
     logger.info("Using standard model for query", complexity=complexity, model=MISTRAL_NEMO_MODEL)
-    return MISTRAL_NEMO_MODEL, OPENROUTER_API_KEY_PRIMARY
+    return MISTRAL_NEMO_MODEL
+
 
+def _upstream_priority(intent: str, safety_flags: list) -> int:
+    """Admission priority for a chat call"""
+    if intent in CRISIS_INTENTS or "emergency" in safety_flags:
+        return PRIORITY_CRITICAL
+    return PRIORITY_NORMAL
 
-def _call_openrouter_api(payload: dict, headers: dict, retry_count: int = 0) -> Tuple[Optional[str], Optional[Exception]]:
+
+def _next_route(preferred_model: str, exclude: Set[Tuple[str, str]] = frozenset()) -> Optional[Tuple[str, str]]:
     """
-    Call OpenRouter API with retry logic
-    Returns: (response_content, error)
+    First (model, api_key) along the failover chain, starting at the preferred
+    model, whose circuit breaker would admit a request. Keys are tried
+    least-loaded first, skipping throttled ones. Only looks: the breaker is
+    claimed when the call is actually sent.
+    """
+    chain = [preferred_model] + [m for m in MODEL_FAILOVER_CHAIN if m != preferred_model]
+    keys = key_pool.ranked()
+    for model in chain:
+        for api_key in keys:
+            if (model, api_key) in exclude:
+                continue
+            if breakers.get(model, api_key).can_attempt():
+                return model, api_key
+    return None
+
+
+def _should_downgrade(preferred: str, intent: str, safety_flags: list, complexity: str) -> bool:
     """
+    Whether to send a query meant for the advanced model to the faster one
+    because the advanced model is under pressure. Sensitive intents and
+    safety-flagged messages are never downgraded.
+    """
+    if not ENABLE_DEGRADATION or preferred != LLAMA3_70B_MODEL or complexity == "simple":
+        return False
+    if intent in SENSITIVE_INTENTS or intent in CRISIS_INTENTS:
+        return False
+    if {"blocked_context", "low_confidence", "needs_review"} & set(safety_flags):
+        return False
+    return degradation_policy.is_degraded(LLAMA3_70B_MODEL)
+
+
+def _select_model(intent: str, safety_flags: list, complexity: str, message: str) -> Tuple[str, Optional[str], bool]:
+    """
+    Intelligently select the best model for the query, downgrading under load
+    and failing over along MODEL_FAILOVER_CHAIN when circuit breakers are open
+    Returns: (model_name, api_key, downgraded); api_key is None when every route is open
+    """
+    preferred = _preferred_model(intent, safety_flags, complexity)
+    downgraded = _should_downgrade(preferred, intent, safety_flags, complexity)
+    if downgraded:
+        logger.info("Advanced model under pressure, downgrading", intent=intent,
+                    complexity=complexity, model=MISTRAL_NEMO_MODEL)
+        record_downgrade(intent)
+        preferred = MISTRAL_NEMO_MODEL
+    
+    route = _next_route(preferred)
+    
+    if not route:
+        logger.warning("All upstream routes unavailable", preferred=preferred)
+        return preferred, None, downgraded
+    
+    if route[0] != preferred:
+        logger.warning("Preferred model unavailable, failing over", preferred=preferred, model=route[0])
+    return route[0], route[1], downgraded
+
+
+def _build_headers(api_key: str) -> dict:
+    """Standard OpenRouter request headers"""
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://somaai.org",
+        "X-Title": "SomaAI Health Education"
+    }
+
+
+def warm_up_connections():
+    """Open keep-alive connections for every model/key pair the router uses"""
+    keys = key_pool.ranked()
+    openrouter_client.start_warm_up([(model, key) for model in (MISTRAL_NEMO_MODEL, LLAMA3_70B_MODEL)
+                                     for key in keys])
+
+
+def _parse_retry_after(resp) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), if present"""
+    value = resp.headers.get("Retry-After") if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
     try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter; Retry-After sets the floor"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay += retry_after
+    return delay
+
+
+def _route_at_fault(status_code: Optional[int]) -> bool:
+    """Whether a failed call counts against the route (malformed requests are our fault, not the route's)"""
+    return status_code is None or status_code >= 429 or status_code in [401, 402, 403]
+
+
+def _call_openrouter_api(payload: dict, api_key: str, deadline: Optional[Deadline] = None,
+                         budget_key: Optional[BudgetKey] = None) -> Tuple[Optional[str], Optional[Exception]]:
+    """
+    Call OpenRouter API with bounded retries.
+    Each attempt's timeout comes from what is left of the deadline, and retries
+    back off exponentially with jitter (honouring Retry-After on 429s).
+    Completion lengths are recorded under `budget_key` to learn max_tokens.
+    Returns: (response_content, error)
+    """
+    deadline = deadline or Deadline(CHAT_DEADLINE_SECONDS)
+    breaker = breakers.get(payload.get("model"), api_key)
+    last_error = None
+    
+    for attempt in range(MAX_RETRIES + 1):
+        timeout = deadline.timeout(REQUEST_TIMEOUT)
+        if timeout < MIN_ATTEMPT_TIMEOUT:
+            last_error = last_error or DeadlineExceeded("Request deadline exceeded before upstream call")
+            break
+        if not breaker.allow_request():
+            # Another request holds the half-open probe (or the route just opened)
+            last_error = last_error or CircuitOpenError(f"Circuit open for {breaker.name}")
+            break
+        
         start_time = time.time()
-        resp = requests.post(
-            OPENROUTER_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=REQUEST_TIMEOUT
-        )
-        duration = time.time() - start_time
+        retry_after = None
+        
+        try:
+            with key_pool.track(api_key):
+                resp = openrouter_client.post(
+                    OPENROUTER_API_URL,
+                    model=payload.get("model"),
+                    api_key=api_key,
+                    json=payload,
+                    headers=_build_headers(api_key),
+                    timeout=timeout
+                )
+            duration = time.time() - start_time
+            
+            logger.performance("OpenRouter API call", duration, model=payload.get("model"), 
+                              status_code=resp.status_code)
+            if resp.status_code != 429:
+                key_pool.record_response(api_key, resp.status_code, resp.headers)
+            
+            resp.raise_for_status()
+            data = resp.json()
+            content = data["choices"][0]["message"]["content"]
+            latency_tracker.record(payload.get("model"), duration)
+            breaker.record_success(duration)
+            if budget_key:
+                token_budget.record(budget_key, (data.get("usage") or {}).get("completion_tokens"),
+                                    data["choices"][0].get("finish_reason"))
+            
+            return content, None
+            
+        except requests.exceptions.Timeout as e:
+            logger.error("OpenRouter API timeout", error=e, attempt=attempt, timeout=round(timeout, 2))
+            breaker.record_failure(time.time() - start_time)
+            last_error = e
+            
+        except requests.exceptions.RequestException as e:
+            status_code = getattr(e.response, 'status_code', None)
+            logger.error("OpenRouter API request error", error=e, status_code=status_code)
+            if _route_at_fault(status_code):
+                breaker.record_failure(time.time() - start_time)
+            else:
+                # The route answered; this also settles a half-open probe instead of leaving it claimed
+                breaker.record_success(time.time() - start_time)
+            if status_code not in RETRYABLE_STATUS_CODES:
+                return None, e
+            if status_code == 429:
+                retry_after = _parse_retry_after(e.response)
+                key_pool.record_response(api_key, 429, e.response.headers, retry_after)
+            last_error = e
+            
+        except Exception as e:
+            logger.error("Unexpected error in OpenRouter API call", error=e)
+            breaker.record_failure(time.time() - start_time)
+            return None, e
         
-        logger.performance("OpenRouter API call", duration, model=payload.get("model"), 
-                          status_code=resp.status_code)
+        # Stop retrying into a route whose breaker opened or key got benched; the caller fails over
+        if attempt == MAX_RETRIES or not key_pool.is_available(api_key) or not breaker.can_attempt():
+            break
         
-        resp.raise_for_status()
-        data = resp.json()
-        content = data["choices"][0]["message"]["content"]
+        delay = _backoff_delay(attempt, retry_after)
+        if delay + MIN_ATTEMPT_TIMEOUT > deadline.remaining():
+            logger.warning("Not retrying, deadline too close", delay=round(delay, 2),
+                           remaining=round(deadline.remaining(), 2))
+            break
+        
+        logger.info("Retrying OpenRouter API call", retry_count=attempt + 1, delay=round(delay, 2))
+        time.sleep(delay)
+    
+    return None, last_error
+
+
+# Fallback responses when the upstream model is unavailable
+FALLBACK_RESPONSES = {
+    "en": "I apologize, but I'm having technical difficulties right now. Please try again in a moment, or check our FAQ section for immediate information.",
+    "fr": "Je m'excuse, mais j'ai des difficultés techniques en ce moment. Veuillez réessayer dans un instant, ou consultez notre section FAQ pour des informations immédiates.",
+    "pt": "Desculpe, mas estou com dificuldades técnicas no momento. Por favor, tente novamente em um instante ou verifique nossa seção de FAQ para informações imediatas.",
+    "es": "Lo siento, pero estoy teniendo dificultades técnicas en este momento. Por favor, intente nuevamente en un momento o consulte nuestra sección de preguntas frecuentes para obtener información inmediata.",
+    "sw": "Samahani, lakini nina shida za kiufundi hivi sasa. Tafadhali jaribu tena baadaye, au angalia sehemu yetu ya maswali ya mara kwa mara kwa taarifa za haraka.",
+    "hi": "माफ करें, लेकिन अभी मुझे तकनीकी कठिनाइयों का सामना करना पड़ रहा है। कृपया कुछ समय बाद पुनः प्रयास करें, या तत्काल जानकारी के लिए हमारे FAQ अनुभाग देखें।"
+}
+
+
+def _hedge_target(model: str, api_key: str, intent: str) -> Optional[Tuple[str, str]]:
+    """
+    Pick the backup (model, api_key) for a hedged request.
+    Prefers the same model on another API key; falls back to the next model in
+    the failover chain for non-sensitive intents. Returns None when there is
+    nothing healthy to hedge with.
+    """
+    route = _next_route(model, exclude={(model, api_key)})
+    if not route:
+        return None
+    if route[0] != model and intent in SENSITIVE_INTENTS:
+        return None
+    return route
+
+
+def _call_with_hedging(payload: dict, api_key: str, intent: str, deadline: Deadline,
+                       budget_key: Optional[BudgetKey] = None) -> Tuple[Optional[str], Optional[Exception], str]:
+    """
+    Call OpenRouter, hedging with a second key or model if the first call is slow
+    Returns: (response_content, error, model_used)
+    """
+    model = payload["model"]
+    target = _hedge_target(model, api_key, intent)
+    if not target:
+        content, error = _call_openrouter_api(payload, api_key, deadline, budget_key)
+        return content, error, model
+    
+    backup_model, backup_key = target
+    backup_payload = dict(payload, model=backup_model)
+    
+    (content, error), backup_won = hedged_call(
+        lambda: _call_openrouter_api(payload, api_key, deadline, budget_key),
+        lambda: _call_openrouter_api(backup_payload, backup_key, deadline, budget_key),
+        min(hedge_delay(model), deadline.remaining())
+    )
+    return content, error, backup_model if backup_won else model
+
+
+def _call_with_failover(payload: dict, api_key: str, deadline: Deadline, intent: str = None,
+                        budget_key: Optional[BudgetKey] = None) -> Tuple[Optional[str], Optional[Exception], str]:
+    """
+    Call OpenRouter, moving along the failover chain when a route errors out,
+    until the deadline runs out. Chat calls (with an intent) are hedged when
+    ENABLE_HEDGING is set.
+    Returns: (response_content, error, model_used)
+    """
+    preferred = payload["model"]
+    tried = set()
+    
+    while True:
+        if ENABLE_HEDGING and intent is not None:
+            content, error, model_used = _call_with_hedging(payload, api_key, intent, deadline, budget_key)
+        else:
+            content, error = _call_openrouter_api(payload, api_key, deadline, budget_key)
+            model_used = payload["model"]
         
-        return content, None
+        if content and not error:
+            return content, None, model_used
         
-    except requests.exceptions.Timeout as e:
-        logger.error("OpenRouter API timeout", error=e, retry_count=retry_count)
-        if retry_count < MAX_RETRIES:
-            logger.info("Retrying OpenRouter API call", retry_count=retry_count + 1)
-            time.sleep(1)  # Brief delay before retry
-            return _call_openrouter_api(payload, headers, retry_count + 1)
-        return None, e
+        tried.add((payload["model"], api_key))
+        if deadline.remaining() < MIN_ATTEMPT_TIMEOUT:
+            return content, error or DeadlineExceeded("Request deadline exceeded"), payload["model"]
         
-    except requests.exceptions.RequestException as e:
-        logger.error("OpenRouter API request error", error=e, status_code=getattr(e.response, 'status_code', None))
-        if retry_count < MAX_RETRIES and getattr(e.response, 'status_code', None) in [429, 500, 502, 503, 504]:
-            logger.info("Retrying OpenRouter API call after error", retry_count=retry_count + 1)
-            time.sleep(2)  # Longer delay for server errors
-            return _call_openrouter_api(payload, headers, retry_count + 1)
-        return None, e
+        route = _next_route(preferred, exclude=tried)
+        if not route:
+            return content, error, payload["model"]
         
-    except Exception as e:
-        logger.error("Unexpected error in OpenRouter API call", error=e)
-        return None, e
+        logger.warning("Upstream route failed, failing over", failed_model=payload["model"], model=route[0])
+        payload = dict(payload, model=route[0])
+        api_key = route[1]
 
 
-def route_chat(session: dict, message: str, intent: str, safety_flags: list) -> Tuple[str, str, float]:
-    """
-    Advanced chat routing with intelligent model selection and error handling.
+def _chat_cache_key(session: dict, message: str, intent: str, model: str,
+                    analysis: Optional[AnalyzedMessage] = None) -> str:
+    """Cache (and single-flight) key for a chat answer"""
+    return cache.make_key("chat_response", message=analyze(message, analysis).normalized[:100], intent=intent, model=model,
+                          lang=session.get("language", "en"), reading_level=session.get("reading_level", "simple"))
+
+
+def _failure_key(cache_key: str) -> str:
+    """Negative cache key remembering a recent upstream failure for a chat answer"""
+    return "chat_failure:" + cache_key.split(":", 1)[1]
+
+
+def _semantic_partition(session: dict, intent: str, model: str) -> tuple:
+    """Near-duplicate lookups never cross language, reading level, intent or model"""
+    return (session.get("language", "en"), session.get("reading_level", "simple"), intent or "general", model)
+
+
+def _cached_answer(session: dict, message: str, intent: str, model: str, cache_key: str) -> Optional[dict]:
+    """Exact cache hit, else a near-duplicate question's answer ({"content", "fresh_until"})"""
+    cached_response = cache.get_key(cache_key)
+    if cached_response or not ENABLE_SEMANTIC_CACHE:
+        return cached_response
+    
+    match = semantic_cache.lookup(message, _semantic_partition(session, intent, model))
+    if match:
+        logger.info("Semantic cache hit for chat response", intent=intent, similarity=round(match[1], 3))
+        return match[0]
+    return None
+
+
+def _store_answer(session: dict, message: str, intent: str, model: str, cache_key: str, content: str,
+                  policy: CachePolicy):
+    """Cache an answer for exact and near-duplicate lookups, kept through its stale grace period"""
+    entry = {"content": content, "fresh_until": time.time() + policy.ttl}
+    cache.set_key(cache_key, entry, ttl=policy.ttl + policy.grace)
+    if ENABLE_SEMANTIC_CACHE:
+        semantic_cache.add(message, _semantic_partition(session, intent, model), entry,
+                           ttl=policy.ttl + policy.grace)
+
+
+def _remember_failure(cache_key: str):
+    """Negative-cache an upstream failure so the same question does not hammer a broken upstream"""
+    cache.set_key(_failure_key(cache_key), True, ttl=NEGATIVE_CACHE_SECONDS)
+
+
+def _refresh_in_background(session: dict, message: str, intent: str, complexity: str, model: str,
+                           api_key: str, downgraded: bool, cache_key: str, policy: CachePolicy):
+    """Regenerate a stale cached answer at low priority without delaying the request that found it"""
+    # Snapshot the prompt now; the session keeps changing after this request returns
+    payload = _build_chat_payload(session, message, intent, complexity, model, downgraded)
+    session_snapshot = dict(session)
+    budget_key = (intent, session.get("language", "en"), complexity)
+    
+    def refresh():
+        deadline = Deadline(CHAT_DEADLINE_SECONDS)
+        try:
+            with upstream_limiter.acquire(timeout=deadline.remaining(), priority=PRIORITY_LOW) as slot:
+                content, error, _ = _call_with_failover(payload, api_key, deadline, intent=intent,
+                                                        budget_key=budget_key)
+                slot.failed = error is not None
+        except LoadShedError:
+            # Busy upstream: keep serving the stale answer, a later hit retries
+            return
+        if content and not error:
+            _store_answer(session_snapshot, message, intent, model, cache_key, content, policy)
+            record_chat_cache_event("refreshed")
+        else:
+            _remember_failure(cache_key)
+            record_chat_cache_event("refresh_failed")
     
-    Args:
-        session: Session dictionary with history and metadata
-        message: User message
-        intent: Detected intent classification
-        safety_flags: List of safety flags
+    cache_refresher.schedule(cache_key, refresh)
+
+
+def _serve_from_cache(session: dict, message: str, intent: str, complexity: str, model: str,
+                      api_key: Optional[str], downgraded: bool, cache_key: str,
+                      policy: CachePolicy) -> Optional[Tuple[str, float]]:
+    """
+    Answer a cacheable query without waiting on upstream, if possible.
+    Stale answers within their grace period are served and refreshed in the
+    background; a recently failed question gets the fallback until its
+    negative cache entry expires.
     
     Returns:
-        (response_content, model_used, confidence_score)
+        (content, confidence), or None when upstream must be called
+    """
+    cached = _cached_answer(session, message, intent, model, cache_key)
+    if cached:
+        if time.time() > cached["fresh_until"] and api_key and not cache.get_key(_failure_key(cache_key)):
+            record_chat_cache_event("stale_served")
+            _refresh_in_background(session, message, intent, complexity, model, api_key, downgraded,
+                                   cache_key, policy)
+        return cached["content"], 0.90
+    
+    if cache.get_key(_failure_key(cache_key)):
+        record_chat_cache_event("negative_hit")
+        logger.warning("Recent upstream failure cached, serving fallback", intent=intent)
+        return _fallback_message(session), 0.3
+    return None
+
+
+def chat_cache_state(session: dict, message: str, intent: str, safety_flags: list,
+                     analysis: Optional[AnalyzedMessage] = None) -> str:
+    """
+    How route_chat would answer a question from cache, without calling upstream
+    Returns: "uncacheable", "fresh", "stale" or "missing", or "unroutable" when
+    the answer is stale or missing and no upstream route would take the call
+    """
+    analysis = analyze(message, analysis)
+    complexity = _estimate_query_complexity(message, len(session.get("history", [])), analysis)
+    policy = policy_for(intent, complexity)
+    if not policy:
+        return "uncacheable"
+    
+    model = _preferred_model(intent, safety_flags, complexity)
+    if _should_downgrade(model, intent, safety_flags, complexity):
+        model = MISTRAL_NEMO_MODEL
+    cached = _cached_answer(session, message, intent, model,
+                            _chat_cache_key(session, message, intent, model, analysis))
+    if cached and time.time() <= cached["fresh_until"]:
+        return "fresh"
+    if not _next_route(model):
+        return "unroutable"
+    return "stale" if cached else "missing"
+
+
+def _fallback_message(session: dict) -> str:
+    """Localized fallback response for upstream failures"""
+    lang = session.get("language", "en")
+    return FALLBACK_RESPONSES.get(lang, FALLBACK_RESPONSES["en"])
+
+
+def _build_chat_payload(session: dict, message: str, intent: str, complexity: str, model: str,
+                        downgraded: bool = False) -> dict:
+    """
+    Build the OpenRouter chat completion payload.
+    max_tokens is learned per (intent, language, complexity); downgraded
+    queries get more room so the faster model can answer in full.
     """
-    start_time = time.time()
-    
-    # Estimate query complexity
-    history_length = len(session.get("history", []))
-    complexity = _estimate_query_complexity(message, history_length)
-    
-    # Select appropriate model
-    model, api_key = _select_model(intent, safety_flags, complexity, message)
-    
-    # Check cache for similar queries (simple queries only)
-    if complexity == "simple":
-        cached_response = cache.get("chat_response", message=message[:100], intent=intent, model=model)
-        if cached_response:
-            logger.info("Cache hit for chat response", intent=intent)
-            return cached_response, model, 0.90
-    
     # Prepare enhanced prompt with context
     prompt = session.get("history", []).copy()
     
@@ -184,15 +565,18 @@ def route_chat(session: dict, message: str, intent: str, safety_flags: list) ->
     # Configure temperature based on intent (lower for sensitive topics)
     temperature = 0.4 if intent in {"consent", "assault_support", "emergency"} else 0.6
     
-    # Configure max_tokens based on complexity
+    # Configure max_tokens from observed completion lengths (complexity defaults while learning)
     max_tokens_map = {
         "simple": 400,
         "medium": 600,
         "complex": 800
     }
-    max_tokens = max_tokens_map.get(complexity, 512)
+    max_tokens = token_budget.max_tokens(intent, session.get("language", "en"), complexity,
+                                         default=max_tokens_map.get(complexity, 512))
+    if downgraded:
+        max_tokens = int(max_tokens * DEGRADE_MAX_TOKENS_FACTOR)
     
-    payload = {
+    return {
         "model": model,
         "messages": prompt,
         "response_format": {"type": "text"},
@@ -202,61 +586,274 @@ def route_chat(session: dict, message: str, intent: str, safety_flags: list) ->
         "frequency_penalty": 0.1,
         "presence_penalty": 0.1
     }
+
+
+def route_chat(session: dict, message: str, intent: str, safety_flags: list,
+               deadline: Optional[Deadline] = None, priority: Optional[int] = None,
+               analysis: Optional[AnalyzedMessage] = None, negative_cache: bool = True) -> Tuple[str, str, float]:
+    """
+    Advanced chat routing with intelligent model selection and error handling.
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://somaai.org",
-        "X-Title": "SomaAI Health Education"
-    }
+    Args:
+        session: Session dictionary with history and metadata
+        message: User message
+        intent: Detected intent classification
+        safety_flags: List of safety flags
+        deadline: Time budget for the whole call (defaults to CHAT_DEADLINE_SECONDS)
+        priority: Upstream admission priority (defaults to one derived from intent)
+        analysis: The message's shared analysis, if the caller already has one
+        negative_cache: Remember an upstream failure so students asking the same
+            question get the fallback for a while (off for background warm-up calls)
     
-    # Call API with retry logic
-    content, error = _call_openrouter_api(payload, headers)
+    Returns:
+        (response_content, model_used, confidence_score)
+    """
+    start_time = time.time()
+    
+    # Estimate query complexity
+    analysis = analyze(message, analysis)
+    history_length = len(session.get("history", []))
+    complexity = _estimate_query_complexity(message, history_length, analysis)
+    
+    # Select appropriate model
+    model, api_key, downgraded = _select_model(intent, safety_flags, complexity, message)
+    
+    # Check cache for similar queries (per-intent policy; sensitive and complex queries never cached)
+    policy = policy_for(intent, complexity)
+    cache_key = _chat_cache_key(session, message, intent, model, analysis)
+    if policy:
+        served = _serve_from_cache(session, message, intent, complexity, model, api_key, downgraded,
+                                   cache_key, policy)
+        if served:
+            logger.info("Cache hit for chat response", intent=intent)
+            return served[0], model, served[1]
+    
+    if not api_key:
+        logger.error("No upstream route available", intent=intent, model=model)
+        return _fallback_message(session), model, 0.3
+    
+    payload = _build_chat_payload(session, message, intent, complexity, model, downgraded)
+    deadline = deadline or Deadline(CHAT_DEADLINE_SECONDS)
+    if priority is None:
+        priority = _upstream_priority(intent, safety_flags)
+    
+    def call_upstream() -> Tuple[Optional[str], Optional[Exception], str]:
+        # Call API with retries, failover and optional hedging (raises LoadShedError when saturated)
+        with upstream_limiter.acquire(timeout=deadline.remaining(), priority=priority) as slot:
+            result = _call_with_failover(payload, api_key, deadline, intent=intent,
+                                         budget_key=(intent, session.get("language", "en"), complexity))
+            slot.failed = result[1] is not None
+        if policy:
+            if result[0] and not result[1]:
+                _store_answer(session, message, intent, model, cache_key, result[0], policy)
+            elif negative_cache:
+                _remember_failure(cache_key)
+        return result
+    
+    if policy:
+        # Identical questions already in flight share one upstream call
+        try:
+            (content, error, model_used), shared = single_flight.do(
+                cache_key, call_upstream, timeout=deadline.remaining(),
+                on_join=lambda: record_coalesced("chat")
+            )
+        except DeadlineExceeded as e:
+            content, error, model_used = None, e, model
+    else:
+        content, error, model_used = call_upstream()
     
     if error or not content:
         logger.error("Failed to get AI response", error=error, intent=intent)
+        return _fallback_message(session), model, 0.3
+    
+    # Calculate confidence (simplified - using base confidence)
+    confidence = 0.90 if "llama-3.3-70b" in model_used else 0.85
+    
+    duration = time.time() - start_time
+    logger.performance("route_chat complete", duration, model=model_used, complexity=complexity, 
+                      intent=intent, confidence=confidence)
+    
+    return content, model_used, confidence
+
+
+def _iter_stream_tokens(resp, meta: Optional[dict] = None) -> Iterator[str]:
+    """
+    Yield content deltas from an OpenRouter SSE response.
+    The final finish_reason and usage, when sent, are stored in `meta`.
+    """
+    resp.encoding = "utf-8"
+    for line in resp.iter_lines(decode_unicode=True):
+        # Skip keep-alive comments (": OPENROUTER PROCESSING") and blank separators
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if data == "[DONE]":
+            return
         
-        # Fallback response
-        fallback_responses = {
-            "en": "I apologize, but I'm having technical difficulties right now. Please try again in a moment, or check our FAQ section for immediate information.",
-            "fr": "Je m'excuse, mais j'ai des difficultés techniques en ce moment. Veuillez réessayer dans un instant, ou consultez notre section FAQ pour des informations immédiates.",
-            "pt": "Desculpe, mas estou com dificuldades técnicas no momento. Por favor, tente novamente em um instante ou verifique nossa seção de FAQ para informações imediatas.",
-            "es": "Lo siento, pero estoy teniendo dificultades técnicas en este momento. Por favor, intente nuevamente en un momento o consulte nuestra sección de preguntas frecuentes para obtener información inmediata.",
-            "sw": "Samahani, lakini nina shida za kiufundi hivi sasa. Tafadhali jaribu tena baadaye, au angalia sehemu yetu ya maswali ya mara kwa mara kwa taarifa za haraka.",
-            "hi": "माफ करें, लेकिन अभी मुझे तकनीकी कठिनाइयों का सामना करना पड़ रहा है। कृपया कुछ समय बाद पुनः प्रयास करें, या तत्काल जानकारी के लिए हमारे FAQ अनुभाग देखें।"
-        }
-        lang = session.get("language", "en")
-        fallback_msg = fallback_responses.get(lang, fallback_responses["en"])
+        chunk = json.loads(data)
+        if "error" in chunk:
+            raise requests.exceptions.RequestException(chunk["error"].get("message", "Stream error"))
         
-        return fallback_msg, model, 0.3
+        choices = chunk.get("choices") or [{}]
+        if meta is not None:
+            if choices[0].get("finish_reason"):
+                meta["finish_reason"] = choices[0]["finish_reason"]
+            if chunk.get("usage"):
+                meta["usage"] = chunk["usage"]
+        token = (choices[0].get("delta") or {}).get("content")
+        if token:
+            yield token
+
+
+def stream_chat(session: dict, message: str, intent: str, safety_flags: list,
+                deadline: Optional[Deadline] = None,
+                analysis: Optional[AnalyzedMessage] = None) -> Iterator[dict]:
+    """
+    Streaming variant of route_chat using OpenRouter `stream: true`.
+    Generation stops (keeping the partial answer) when the deadline runs out.
     
-    # Calculate confidence (simplified - using base confidence)
-    confidence = 0.90 if "llama-3.3-70b" in model else 0.85
+    Yields:
+        {"type": "token", "content": ...} for each generated chunk, then one
+        {"type": "done", "content": full_text, "model": ..., "confidence": ...,
+         "time_to_first_token": seconds or None}
+    """
+    start_time = time.time()
+    deadline = deadline or Deadline(CHAT_DEADLINE_SECONDS)
+    
+    analysis = analyze(message, analysis)
+    history_length = len(session.get("history", []))
+    complexity = _estimate_query_complexity(message, history_length, analysis)
+    model, api_key, downgraded = _select_model(intent, safety_flags, complexity, message)
+    
+    policy = policy_for(intent, complexity)
+    cache_key = _chat_cache_key(session, message, intent, model, analysis)
+    if policy:
+        served = _serve_from_cache(session, message, intent, complexity, model, api_key, downgraded,
+                                   cache_key, policy)
+        if served:
+            logger.info("Cache hit for streamed chat response", intent=intent)
+            yield {"type": "token", "content": served[0]}
+            yield {"type": "done", "content": served[0], "model": model, "confidence": served[1],
+                   "time_to_first_token": time.time() - start_time}
+            return
+    
+    payload = _build_chat_payload(session, message, intent, complexity, model, downgraded)
+    payload["stream"] = True
+    # Ask for token usage in the final chunk so streamed answers feed the learned budgets
+    payload["usage"] = {"include": True}
+    
+    tokens = []
+    stream_meta = {}
+    time_to_first_token = None
+    error = None
+    
+    if api_key:
+        breaker = breakers.get(model, api_key)
+        # Each token is sent once the next one has been read, so admission and the
+        # connection are released at the upstream's last byte, before the final token
+        held_token = None
+        try:
+            # Errors inside, or the client going away mid-stream, mark the slot failed.
+            # A shed (LoadShedError) leaves before the breaker is claimed.
+            with upstream_limiter.acquire(timeout=deadline.remaining(),
+                                          priority=_upstream_priority(intent, safety_flags)) as slot, \
+                    key_pool.track(api_key):
+                # Claimed only now, right before sending, so a waiting request never holds the half-open probe
+                if not breaker.allow_request():
+                    raise CircuitOpenError(f"Circuit open for {breaker.name}")
+                with openrouter_client.stream(
+                    OPENROUTER_API_URL,
+                    model=model,
+                    api_key=api_key,
+                    json=payload,
+                    headers=_build_headers(api_key),
+                    timeout=deadline.timeout(REQUEST_TIMEOUT)
+                ) as resp:
+                    key_pool.record_response(api_key, resp.status_code, resp.headers,
+                                             _parse_retry_after(resp))
+                    resp.raise_for_status()
+                    for token in _iter_stream_tokens(resp, stream_meta):
+                        if deadline.expired():
+                            raise DeadlineExceeded("Request deadline exceeded while streaming")
+                        if time_to_first_token is None:
+                            time_to_first_token = time.time() - start_time
+                            # Generation length varies, so first-token latency drives the breaker
+                            breaker.record_success(time_to_first_token)
+                        tokens.append(token)
+                        if held_token is not None:
+                            # Time the client takes to read is not upstream latency
+                            paused_at = time.time()
+                            yield {"type": "token", "content": held_token}
+                            slot.excluded += time.time() - paused_at
+                        held_token = token
+        except CircuitOpenError:
+            # Another request took the half-open probe since the route was picked; nothing was sent
+            logger.error("No upstream route available for stream", intent=intent, model=model)
+        except (requests.exceptions.RequestException, ValueError, DeadlineExceeded) as e:
+            error = e
+            logger.error("OpenRouter streaming error", error=e, model=model, tokens_received=len(tokens))
+            if time_to_first_token is None:
+                if isinstance(e, requests.exceptions.HTTPError) and not _route_at_fault(e.response.status_code):
+                    breaker.record_success(time.time() - start_time)
+                else:
+                    breaker.record_failure(time.time() - start_time)
+        if held_token is not None:
+            yield {"type": "token", "content": held_token}
+    else:
+        logger.error("No upstream route available for stream", intent=intent, model=model)
+    
+    content = "".join(tokens)
     
-    # Cache simple responses
-    if complexity == "simple":
-        cache.set("chat_response", content, message=message[:100], intent=intent, model=model)
+    if not content:
+        if error and policy:
+            _remember_failure(cache_key)
+        # Nothing reached the client yet, so the canned fallback can stand in
+        fallback_msg = _fallback_message(session)
+        yield {"type": "token", "content": fallback_msg}
+        yield {"type": "done", "content": fallback_msg, "model": model, "confidence": 0.3,
+               "time_to_first_token": None}
+        return
+    
+    confidence = 0.90 if "llama-3.3-70b" in model else 0.85
+    if error:
+        # Partial answer: keep what was streamed but flag it
+        confidence *= 0.7
+    else:
+        token_budget.record((intent, session.get("language", "en"), complexity),
+                            stream_meta.get("usage", {}).get("completion_tokens"),
+                            stream_meta.get("finish_reason"))
+        if policy:
+            _store_answer(session, message, intent, model, cache_key, content, policy)
     
     duration = time.time() - start_time
-    logger.performance("route_chat complete", duration, model=model, complexity=complexity, 
-                      intent=intent, confidence=confidence)
+    logger.performance("stream_chat complete", duration, model=model, complexity=complexity,
+                      intent=intent, time_to_first_token=time_to_first_token)
     
-    return content, model, confidence
+    yield {"type": "done", "content": content, "model": model, "confidence": confidence,
+           "time_to_first_token": time_to_first_token}
 
-def generate_lesson(session: dict, topic: str) -> Tuple[dict, str]:
+def generate_lesson(session: dict, topic: str, deadline: Optional[Deadline] = None) -> Tuple[dict, str]:
     """
     Generate a comprehensive lesson using advanced AI model.
     Enhanced with better prompts and error handling.
+    Lessons depend only on (topic, language, reading level), so generated
+    ones are served from the lesson store.
+    The whole call is bounded by `deadline` (defaults to LESSON_DEADLINE_SECONDS).
     """
     start_time = time.time()
     
-    # Use advanced model for lesson generation (better structure and accuracy)
-    model = LLAMA3_70B_MODEL
-    api_key = OPENROUTER_API_KEY_SECONDARY or OPENROUTER_API_KEY_PRIMARY
-    
     lang = session.get("language", "en")
     reading_level = session.get("reading_level", "simple")
     
+    stored = lesson_store.get(topic, lang, reading_level)
+    if stored:
+        logger.info("Lesson store hit", topic=topic, lang=lang)
+        return stored
+    
+    # Use advanced model for lesson generation (better structure and accuracy),
+    # failing over along the chain if its circuit breaker is open
+    model, api_key = _next_route(LLAMA3_70B_MODEL) or (LLAMA3_70B_MODEL, None)
+    
     # Enhanced lesson generation prompt
     lesson_prompt = f"""Generate a comprehensive, age-appropriate educational lesson about "{topic}" for adolescents.
     
@@ -281,28 +878,33 @@ JSON Structure:
 
 Generate the lesson now:"""
     
-    prompt = session.get("history", []) + [
-        {"role": "user", "content": lesson_prompt}
-    ]
-    
     payload = {
         "model": model,
-        "messages": prompt,
+        "messages": [{"role": "user", "content": lesson_prompt}],
         "response_format": {"type": "json_object"},
         "temperature": 0.7,
         "max_tokens": 1200,
         "top_p": 0.9
     }
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://somaai.org",
-        "X-Title": "SomaAI Health Education"
-    }
-    
     try:
-        content, error = _call_openrouter_api(payload, headers)
+        if not api_key:
+            raise Exception("No upstream route available for lesson generation")
+        
+        deadline = deadline or Deadline(LESSON_DEADLINE_SECONDS)
+        
+        def call_upstream() -> Tuple[Optional[str], Optional[Exception], str]:
+            # Lessons are not urgent; keep them behind live chat in the queue
+            with upstream_limiter.acquire(timeout=deadline.remaining(), priority=PRIORITY_LOW) as slot:
+                result = _call_with_failover(payload, api_key, deadline)
+                slot.failed = result[1] is not None
+            return result
+        
+        # The same lesson requested concurrently (e.g. a whole class) is generated once
+        (content, error, model), shared = single_flight.do(
+            lesson_store.key(topic, lang, reading_level), call_upstream, timeout=deadline.remaining(),
+            on_join=lambda: record_coalesced("lesson")
+        )
         
         if error or not content:
             logger.error("Failed to generate lesson", error=error, topic=topic)
@@ -321,11 +923,18 @@ Generate the lesson now:"""
         if "resources" not in lesson_json:
             lesson_json["resources"] = []
         
+        if not shared:
+            lesson_store.put(topic, lang, reading_level, lesson_json, model)
+        
         duration = time.time() - start_time
         logger.performance("generate_lesson complete", duration, topic=topic, model=model)
         
         return lesson_json, model
         
+    except LoadShedError:
+        # Overload is reported to the client (503), not masked by a fallback lesson
+        raise
+        
     except json.JSONDecodeError as e:
         logger.error("Failed to parse lesson JSON", error=e, topic=topic)
         # Fallback structured lesson
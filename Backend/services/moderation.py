@@ -0,0 +1,191 @@
+"""
+Batch Moderation
+Re-screens JSONL exports (conversations, candidate FAQ entries) with the
+chat safety filter and intent classifier. Lines are handed to a process
+pool in chunks; workers parse, check and serialize them, and results come
+back as NDJSON in input order while later chunks are still running.
+Keep this module's imports light: every worker process imports it.
+"""
+import json
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from config import MODERATION_WORKERS, MODERATION_CHUNK_SIZE
+from services.safety import check_safety, classify_intent
+from utils.logger import logger
+
+# Chunks queued per worker; bounds memory while keeping every worker busy
+CHUNKS_PER_WORKER = 2
+
+
+def moderate_line(line_number: int, raw: str) -> Optional[Dict[str, Any]]:
+    """
+    Moderate one JSONL line: {"message": "...", "id": ..., "language": "en", "context": [...]}
+    ("id", "language" and "context" are optional)
+
+    Returns:
+        {"line", "id", "flags", "blocked", "intent"}, {"line", "error"} for a bad
+        line, or None for a blank line
+    """
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        item = json.loads(raw)
+    except ValueError:
+        return {"line": line_number, "error": "Invalid JSON"}
+    message = item.get("message") if isinstance(item, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        return {"line": line_number, "error": "Missing message"}
+
+    lang = item.get("language") or "en"
+    if not isinstance(lang, str):
+        return {"line": line_number, "error": "Invalid language"}
+    context = item.get("context")
+    if context is not None and not (isinstance(context, list) and all(isinstance(m, str) for m in context)):
+        return {"line": line_number, "error": "Invalid context"}
+    flags = check_safety(message, lang, context=context)
+    blocked = "blocked" in flags
+    return {
+        "line": line_number,
+        "id": item.get("id"),
+        "flags": flags,
+        "blocked": blocked,
+        # Blocked messages are never answered, so they get no intent
+        "intent": None if blocked else classify_intent(message, lang)
+    }
+
+
+def _moderate_line_safely(line_number: int, raw: str) -> Optional[Dict[str, Any]]:
+    """moderate_line, with an unexpected failure reported on that line instead of failing the batch"""
+    try:
+        return moderate_line(line_number, raw)
+    except Exception as e:
+        logger.error("Batch moderation failed for a line", line=line_number, error=str(e))
+        return {"line": line_number, "error": "Moderation failed"}
+
+
+def moderate_chunk(first_line: int, lines: List[str]) -> str:
+    """Moderate consecutive lines (numbered from `first_line`); returns their NDJSON results"""
+    results = (_moderate_line_safely(first_line + i, raw) for i, raw in enumerate(lines))
+    return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results if result is not None)
+
+
+def _init_worker():
+    """Workers only report errors; a batch full of blocked messages would flood the log"""
+    logging.getLogger("SomaAI").setLevel(logging.ERROR)
+
+
+def _worker_context():
+    """
+    Start method for workers: forked from a fork server that has only this
+    module (and so services.safety) loaded, or spawned where there is none.
+    Forking the app itself would copy its pools and locks and re-run its
+    at-fork hooks (connection warm-up threads) in every worker.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class BatchModerator:
+    """
+    Process pool for batch moderation, started on first use and reused.
+    Workers start from a clean interpreter (see _worker_context).
+    """
+
+    def __init__(self, max_workers: int, chunk_size: int):
+        """
+        Initialize moderator
+        Args:
+            max_workers: Worker processes
+            chunk_size: Lines per task handed to a worker
+        """
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_worker_context(),
+                                                 initializer=_init_worker)
+            return self._pool
+
+    def _chunks(self, lines: Iterable[str]) -> Iterator[tuple]:
+        """(first line number, lines) in chunks of chunk_size"""
+        chunk = []
+        first_line = 1
+        for line_number, line in enumerate(lines, start=1):
+            if not chunk:
+                first_line = line_number
+            chunk.append(line)
+            if len(chunk) >= self.chunk_size:
+                yield first_line, chunk
+                chunk = []
+        if chunk:
+            yield first_line, chunk
+
+    def moderate(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Moderate JSONL lines, yielding NDJSON result blocks in input order.
+        Input is read lazily and at most CHUNKS_PER_WORKER chunks per worker
+        are outstanding, so arbitrarily large inputs stream through.
+        """
+        chunks = self._chunks(lines)
+        first = next(chunks, None)
+        if first is None:
+            return
+        second = next(chunks, None)
+        if second is None:
+            # A single chunk is cheaper to do here than to ship to a worker
+            yield moderate_chunk(*first)
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        pending.append(pool.submit(moderate_chunk, *first))
+        pending.append(pool.submit(moderate_chunk, *second))
+        try:
+            for chunk in chunks:
+                while len(pending) >= self.max_workers * CHUNKS_PER_WORKER:
+                    yield pending.popleft().result()
+                pending.append(pool.submit(moderate_chunk, *chunk))
+            while pending:
+                yield pending.popleft().result()
+        except BrokenProcessPool:
+            # A worker died; the next batch gets a new pool
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            raise
+        finally:
+            # Client went away or a worker failed: drop the queued work
+            for future in pending:
+                future.cancel()
+
+    def reset_after_fork(self):
+        """A forked child must not use the parent's pool"""
+        self._pool = None
+        self._lock = Lock()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+
+# Global batch moderator for the admin endpoint
+batch_moderator = BatchModerator(max_workers=MODERATION_WORKERS, chunk_size=MODERATION_CHUNK_SIZE)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=batch_moderator.reset_after_fork)
@@ -0,0 +1,241 @@
+"""
+OpenRouter HTTP Client
+Pooled keep-alive connections to OpenRouter, one pool per (model, API key) pair
+"""
+import os
+import time
+import hashlib
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, Iterator, List, Tuple, Optional
+from config import OPENROUTER_POOL_SIZE, OPENROUTER_POOL_SIZES
+from utils.logger import logger
+
+# Cheap endpoint used to open TCP/TLS connections ahead of the first chat
+WARMUP_URL = "https://openrouter.ai/api/v1/models"
+WARMUP_TIMEOUT = 5
+
+
+def key_label(api_key: Optional[str]) -> str:
+    """Short, non-reversible label for an API key (safe to log and expose)"""
+    if not api_key:
+        return "none"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+class _ConnectionPool:
+    """Keep-alive session for a single (model, key) pair with usage stats"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=size, max_retries=0)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        # Bounds concurrent requests to the pool size so waits can be measured
+        self.slots = threading.BoundedSemaphore(size)
+        self.stats_lock = threading.Lock()
+        self.requests = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def connections_opened(self) -> int:
+        """Number of TCP connections urllib3 has opened for this pool"""
+        pools = self.adapter.poolmanager.pools
+        opened = 0
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is not None:
+                opened += pool.num_connections
+        return opened
+
+    def acquire(self, timeout: float) -> bool:
+        """Wait for a free connection slot, recording the time spent waiting"""
+        wait_start = time.time()
+        with self.stats_lock:
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=timeout)
+        waited = time.time() - wait_start
+
+        with self.stats_lock:
+            self.waiting -= 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if acquired:
+                self.requests += 1
+                self.in_use += 1
+        return acquired
+
+    def release(self):
+        """Return a connection slot to the pool"""
+        with self.stats_lock:
+            self.in_use -= 1
+        self.slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool usage"""
+        opened = self.connections_opened()
+        with self.stats_lock:
+            requests_made = self.requests
+            reused = max(requests_made - opened, 0)
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "requests": requests_made,
+                "connections_opened": opened,
+                "reuse_ratio": round(reused / requests_made, 3) if requests_made else 0.0,
+                "avg_wait_ms": round(self.total_wait / requests_made * 1000, 2) if requests_made else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2)
+            }
+
+    def close(self):
+        """Close all idle connections"""
+        self.session.close()
+
+
+class OpenRouterClient:
+    """Per-worker pooled HTTP client for OpenRouter, safe to use across forks"""
+
+    def __init__(self, default_pool_size: int = 10, pool_sizes: Dict[str, int] = None):
+        """
+        Initialize client
+        Args:
+            default_pool_size: Connections per (model, key) pool
+            pool_sizes: Per-model (or per "model|key_label") pool size overrides
+        """
+        self.default_pool_size = default_pool_size
+        self.pool_sizes = pool_sizes or {}
+        self._pools: Dict[Tuple[str, str], _ConnectionPool] = {}
+        self._lock = threading.Lock()
+        self._warm_targets: List[Tuple[str, str]] = []
+
+    def _pool_size(self, model: str, label: str) -> int:
+        """Resolve the configured pool size for a (model, key) pair"""
+        return self.pool_sizes.get(f"{model}|{label}",
+                                   self.pool_sizes.get(model, self.default_pool_size))
+
+    def _get_pool(self, model: str, api_key: Optional[str]) -> _ConnectionPool:
+        """Get or lazily create the pool for a (model, key) pair"""
+        label = key_label(api_key)
+        pool_id = (model, label)
+
+        with self._lock:
+            pool = self._pools.get(pool_id)
+            if pool is None:
+                pool = _ConnectionPool(self._pool_size(model, label))
+                self._pools[pool_id] = pool
+            return pool
+
+    @staticmethod
+    def _acquire(pool: _ConnectionPool, model: str, timeout: float) -> float:
+        """
+        Wait for a connection slot; the wait counts against the request's timeout
+        Returns: seconds left of `timeout` for the request itself (slot held)
+        Raises requests.exceptions.Timeout if nothing is left
+        """
+        wait_start = time.time()
+        if pool.acquire(timeout):
+            remaining = timeout - (time.time() - wait_start)
+            if remaining > 0:
+                return remaining
+            pool.release()
+        raise requests.exceptions.Timeout(f"Timed out waiting for pooled connection to {model}")
+
+    def post(self, url: str, model: str, api_key: Optional[str], json: dict,
+             headers: dict, timeout: float) -> requests.Response:
+        """
+        POST through the (model, key) pool, finishing within `timeout` including the wait for a connection
+        Raises requests.exceptions.Timeout if no connection frees up within timeout
+        """
+        pool = self._get_pool(model, api_key)
+        remaining = self._acquire(pool, model, timeout)
+
+        try:
+            return pool.session.post(url, json=json, headers=headers, timeout=remaining)
+        finally:
+            pool.release()
+
+    @contextmanager
+    def stream(self, url: str, model: str, api_key: Optional[str], json: dict,
+               headers: dict, timeout: float) -> Iterator[requests.Response]:
+        """
+        Streaming POST through the (model, key) pool
+        The connection slot is held until the response body is consumed or closed;
+        waiting for it counts against `timeout`
+        """
+        pool = self._get_pool(model, api_key)
+        remaining = self._acquire(pool, model, timeout)
+
+        try:
+            resp = pool.session.post(url, json=json, headers=headers, timeout=remaining, stream=True)
+            try:
+                yield resp
+            finally:
+                resp.close()
+        finally:
+            pool.release()
+
+    def warm_up(self, targets: List[Tuple[str, str]]):
+        """Open one keep-alive connection for each (model, api_key) pair"""
+        for model, api_key in targets:
+            pool = self._get_pool(model, api_key)
+            if not pool.acquire(WARMUP_TIMEOUT):
+                continue
+            try:
+                start_time = time.time()
+                pool.session.head(WARMUP_URL, timeout=WARMUP_TIMEOUT)
+                logger.performance("OpenRouter connection warm-up", time.time() - start_time,
+                                   model=model, key=key_label(api_key))
+            except requests.exceptions.RequestException as e:
+                logger.warning("OpenRouter connection warm-up failed", model=model, error=str(e))
+            finally:
+                pool.release()
+
+    def start_warm_up(self, targets: List[Tuple[str, str]]):
+        """Warm up connections in a background thread (re-run in each forked worker)"""
+        self._warm_targets = list(targets)
+        threading.Thread(target=self.warm_up, args=(self._warm_targets,),
+                         name="openrouter-warmup", daemon=True).start()
+
+    def reset_after_fork(self):
+        """Drop pools inherited from the parent process; sockets must not be shared"""
+        self._lock = threading.Lock()
+        self._pools = {}
+        if self._warm_targets:
+            self.start_warm_up(self._warm_targets)
+
+    def utilization(self, model: str) -> float:
+        """(in use + waiting) / size across a model's pools; above 1.0 calls are queueing"""
+        with self._lock:
+            pools = [pool for (pool_model, _), pool in self._pools.items() if pool_model == model]
+
+        size = sum(pool.size for pool in pools)
+        if not size:
+            return 0.0
+        busy = 0
+        for pool in pools:
+            with pool.stats_lock:
+                busy += pool.in_use + pool.waiting
+        return busy / size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Pool metrics keyed by "model|key_label" """
+        with self._lock:
+            pools = dict(self._pools)
+
+        return {
+            "pid": os.getpid(),
+            "pools": {f"{model}|{label}": pool.stats() for (model, label), pool in pools.items()}
+        }
+
+
+# Global client instance (one per worker process)
+openrouter_client = OpenRouterClient(OPENROUTER_POOL_SIZE, OPENROUTER_POOL_SIZES)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=openrouter_client.reset_after_fork)
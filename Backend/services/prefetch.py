@@ -0,0 +1,219 @@
+"""
+Speculative Prefetch
+Learns which question tends to follow which (per intent) from live
+traffic and, after answering, caches the most likely next answer in the
+background at low priority, within a per-minute upstream budget
+"""
+import os
+import time
+from collections import OrderedDict, deque
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from config import (PREFETCH_MAX_CALLS_PER_MINUTE, PREFETCH_MIN_PROBABILITY, PREFETCH_MIN_COUNT,
+                    PREFETCH_MAX_STATES, PREFETCH_HIT_WINDOW_SECONDS, PREFETCH_WORKERS)
+from services.admission import LoadShedError, PRIORITY_LOW
+from services.cache_policy import BackgroundRefresher
+from services.model_router import route_chat, chat_cache_state
+from services.safety import check_safety, classify_intent, localized_system_prompt
+from services.message_analysis import AnalyzedMessage
+from services.semantic_cache import normalize_query
+from utils.sketches import SpaceSaving
+
+# Successors remembered per question (Space-Saving keeps the frequent ones)
+SUCCESSORS_PER_STATE = 8
+
+
+class Prefetcher:
+    """
+    First-order question transition model plus a budgeted background
+    prefetcher. A prefetch counts as a hit when someone asks the prefetched
+    question (same language and reading level) within `hit_window` seconds,
+    otherwise as wasted.
+    """
+
+    def __init__(self, max_calls_per_minute: int, min_probability: float, min_count: int,
+                 max_states: int, hit_window: float, max_workers: int):
+        """
+        Initialize prefetcher
+        Args:
+            max_calls_per_minute: Upstream prefetch calls allowed in any 60s window
+            min_probability: Smallest transition probability worth prefetching
+            min_count: Transitions observed before a prediction is trusted
+            max_states: Questions with learned successors (least recently seen dropped)
+            hit_window: Seconds a prefetched answer has to be asked for
+            max_workers: Prefetches run concurrently
+        """
+        self.max_calls_per_minute = max_calls_per_minute
+        self.min_probability = min_probability
+        self.min_count = min_count
+        self.max_states = max_states
+        self.hit_window = hit_window
+        self.runner = BackgroundRefresher(max_workers=max_workers)
+
+        # (intent, normalized question) -> successors
+        self._states: "OrderedDict[Tuple[str, str], SpaceSaving]" = OrderedDict()
+        # (lang, reading_level, normalized question) -> prefetched at
+        self._outstanding: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+        self._recent_calls = deque()
+        self._lock = Lock()
+
+        self.transitions = 0
+        self.predictions = 0
+        self.issued = 0
+        self.hits = 0
+        self.wasted = 0
+        self.failed = 0
+        self.skipped_cached = 0
+        self.skipped_budget = 0
+
+    def _expire_outstanding(self, now: float):
+        """Count prefetches nobody asked for in time as wasted (caller holds the lock)"""
+        while self._outstanding:
+            key, issued_at = next(iter(self._outstanding.items()))
+            if now - issued_at <= self.hit_window:
+                break
+            del self._outstanding[key]
+            self.wasted += 1
+
+    def _take_budget(self, now: float) -> bool:
+        """Reserve one upstream call in the sliding one-minute window (caller holds the lock)"""
+        while self._recent_calls and now - self._recent_calls[0] > 60:
+            self._recent_calls.popleft()
+        if len(self._recent_calls) >= self.max_calls_per_minute:
+            return False
+        self._recent_calls.append(now)
+        return True
+
+    def _predict(self, intent: str, normalized: str) -> Optional[Tuple[str, float]]:
+        """Most likely next question and its probability (caller holds the lock)"""
+        successors = self._states.get((intent, normalized))
+        if successors is None or not successors.total:
+            return None
+        top = successors.top(1)
+        if not top:
+            return None
+        _, count, error, example = top[0]
+        # Space-Saving counts can be inflated by evictions; trust only the guaranteed part
+        guaranteed = count - error
+        probability = guaranteed / successors.total
+        if guaranteed < self.min_count or probability < self.min_probability:
+            return None
+        return example, probability
+
+    def observe(self, session: dict, previous_message: Optional[str], previous_intent: Optional[str],
+                message: str, intent: str):
+        """
+        Learn from a question that was just answered and prefetch its likely successor
+
+        Args:
+            session: Session the question was asked in (language, reading level)
+            previous_message: The session's previous question, if any
+            previous_intent: Intent of the previous question
+            message: The question just answered
+            intent: Its intent
+        """
+        lang = session.get("language", "en")
+        reading_level = session.get("reading_level", "simple")
+        normalized = normalize_query(message)[:100]
+        now = time.time()
+
+        with self._lock:
+            self._expire_outstanding(now)
+            if self._outstanding.pop((lang, reading_level, normalized), None) is not None:
+                self.hits += 1
+
+            if previous_message and previous_intent:
+                state_key = (previous_intent, normalize_query(previous_message)[:100])
+                successors = self._states.get(state_key)
+                if successors is None:
+                    successors = SpaceSaving(SUCCESSORS_PER_STATE)
+                    self._states[state_key] = successors
+                    while len(self._states) > self.max_states:
+                        self._states.popitem(last=False)
+                else:
+                    self._states.move_to_end(state_key)
+                successors.add(normalized, representative=message)
+                self.transitions += 1
+
+            prediction = self._predict(intent, normalized)
+            if prediction is None:
+                return
+            self.predictions += 1
+
+        self._prefetch(lang, reading_level, prediction[0])
+
+    def _prefetch(self, lang: str, reading_level: str, message: str):
+        """In the background, cache the answer to a predicted question unless cached, unsafe or over budget"""
+        outstanding_key = (lang, reading_level, normalize_query(message)[:100])
+
+        def fetch():
+            session = {
+                "language": lang,
+                "reading_level": reading_level,
+                # A clean session: prefetched answers are shared, so no one's history goes into them
+                "history": [{"role": "system", "content": localized_system_prompt(lang, reading_level)}]
+            }
+            analysis = AnalyzedMessage(message)
+            safety_flags = check_safety(message, lang, context=[], analysis=analysis)
+            if "blocked" in safety_flags:
+                return
+            intent = classify_intent(message, lang, analysis=analysis)
+            state = chat_cache_state(session, message, intent, safety_flags, analysis=analysis)
+
+            with self._lock:
+                if state != "missing" or outstanding_key in self._outstanding:
+                    self.skipped_cached += 1
+                    return
+                if not self._take_budget(time.time()):
+                    self.skipped_budget += 1
+                    return
+                self.issued += 1
+
+            try:
+                # A failed guess must not serve the fallback to the student who then asks it
+                _, _, confidence = route_chat(session, message, intent, safety_flags, priority=PRIORITY_LOW,
+                                              analysis=analysis, negative_cache=False)
+            except LoadShedError:
+                confidence = 0.0
+            with self._lock:
+                if confidence > 0.3:
+                    self._outstanding[outstanding_key] = time.time()
+                else:
+                    self.failed += 1
+
+        self.runner.schedule(":".join(outstanding_key), fetch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Prediction, budget and hit / waste counters"""
+        with self._lock:
+            self._expire_outstanding(time.time())
+            settled = self.hits + self.wasted
+            return {
+                "states": len(self._states),
+                "transitions": self.transitions,
+                "predictions": self.predictions,
+                "issued": self.issued,
+                "failed": self.failed,
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "pending": len(self._outstanding),
+                "hit_rate": round(self.hits / settled, 3) if settled else 0.0,
+                "skipped_cached": self.skipped_cached,
+                "skipped_budget": self.skipped_budget,
+                "calls_last_minute": len(self._recent_calls),
+                "max_calls_per_minute": self.max_calls_per_minute
+            }
+
+
+# Global prefetcher (only fed when ENABLE_PREFETCH is set)
+prefetcher = Prefetcher(
+    max_calls_per_minute=PREFETCH_MAX_CALLS_PER_MINUTE,
+    min_probability=PREFETCH_MIN_PROBABILITY,
+    min_count=PREFETCH_MIN_COUNT,
+    max_states=PREFETCH_MAX_STATES,
+    hit_window=PREFETCH_HIT_WINDOW_SECONDS,
+    max_workers=PREFETCH_WORKERS
+)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=prefetcher.runner.reset_after_fork)
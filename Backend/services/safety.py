@@ -3,7 +3,12 @@ Advanced Safety and Intent Classification System
 Enhanced with context-aware filtering and sophisticated intent detection
 """
 import re
-from typing import List, Tuple
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from config import (SAFETY_CACHE_SIZE, SAFETY_CONTEXT_WINDOW, SAFETY_CONTEXT_BLOCKS,
+                    SAFETY_CONTEXT_WARNINGS)
+from services.message_analysis import AnalyzedMessage, analyze
 from utils.logger import logger
 
 # Context-aware blocked keywords (more specific to avoid false positives)
@@ -29,115 +34,326 @@ WARNING_PATTERNS = [
     r'\b(self-harm|self\s+harm|cutting|burning)\b',
 ]
 
-def check_safety(message: str, lang: str, context: List[str] = None) -> List[str]:
+def _alternation(patterns: List[str], prefix: str) -> str:
+    """
+    Rules joined into one alternation with a named group per rule, so the
+    group that matched identifies the rule. When every rule is wrapped in
+    word boundaries they are hoisted out of the alternation, so the branches
+    are only tried at word boundaries.
+    """
+    if all(pattern.startswith(r"\b") and pattern.endswith(r"\b") for pattern in patterns):
+        branches = "|".join(f"(?P<{prefix}{i}>{pattern[2:-2]})" for i, pattern in enumerate(patterns))
+        return rf"\b(?:{branches})\b"
+    return "|".join(f"(?P<{prefix}{i}>{pattern})" for i, pattern in enumerate(patterns))
+
+
+def _compile_rules(patterns: List[str], prefix: str) -> "re.Pattern":
+    """One matcher per severity"""
+    return re.compile(_alternation(patterns, prefix))
+
+
+# Messages are lowercased before matching, so no IGNORECASE is needed
+_CRITICAL_MATCHER = _compile_rules(CRITICAL_BLOCKED_PATTERNS, "critical_")
+_WARNING_MATCHER = _compile_rules(WARNING_PATTERNS, "warning_")
+
+
+def _rule_pattern(rule: str) -> str:
+    """Source pattern of a matched rule name ("critical_3" -> its regex)"""
+    severity, index = rule.rsplit("_", 1)
+    patterns = CRITICAL_BLOCKED_PATTERNS if severity == "critical" else WARNING_PATTERNS
+    return patterns[int(index)]
+
+
+class _Verdict(NamedTuple):
+    """Context-free safety result for one message"""
+    blocked_rule: Optional[str]
+    warning_rule: Optional[str]
+    repetitive: bool
+
+
+class _VerdictCache:
+    """Bounded LRU of verdicts keyed by a digest of the normalized message"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, _Verdict]" = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[_Verdict]:
+        with self._lock:
+            verdict = self._entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key: bytes, verdict: _Verdict):
+        with self._lock:
+            self._entries[key] = verdict
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_verdicts = _VerdictCache(SAFETY_CACHE_SIZE)
+
+
+def _scan(analysis: AnalyzedMessage) -> _Verdict:
+    """Match a message against every rule (memoized per normalized message)"""
+    if analysis.safety is not None:
+        return analysis.safety
+    verdict = _verdicts.get(analysis.digest)
+    if verdict is None:
+        blocked = _CRITICAL_MATCHER.search(analysis.lower)
+        warning = None if blocked else _WARNING_MATCHER.search(analysis.lower)
+        
+        # Excessive repetition (potential spam/abuse): one word is more than 30% of the message
+        repetitive = bool(analysis.tokens) and max(analysis.token_counts.values()) > len(analysis.tokens) * 0.3
+        
+        verdict = _Verdict(blocked.lastgroup if blocked else None, warning.lastgroup if warning else None,
+                           repetitive)
+        _verdicts.put(analysis.digest, verdict)
+    analysis.safety = verdict
+    return verdict
+
+
+# Words of earlier messages kept to catch a blocked phrase split across messages
+# (longer than the longest blocked phrase, so any split is covered)
+CONTEXT_TAIL_WORDS = 4
+
+
+def new_safety_state() -> Dict[str, Any]:
+    """
+    Per-session safety context, updated in O(1) per message: verdicts of
+    the last SAFETY_CONTEXT_WINDOW messages (ring buffer) with running
+    counts, and the last few words said. Plain data, so it lives in the session.
+    """
+    return {
+        "recent": [],
+        "next": 0,
+        "blocked": 0,
+        "warnings": 0,
+        "blocked_total": 0,
+        "tail": []
+    }
+
+
+def _completes_blocked_phrase(tail: List[str], analysis: AnalyzedMessage) -> bool:
+    """True if a blocked phrase starts in the previous words and ends in this message"""
+    if not tail:
+        return False
+    before = " ".join(tail)
+    text = before + " " + " ".join(analysis.tokens[:CONTEXT_TAIL_WORDS])
+    pos = 0
+    while True:
+        match = _CRITICAL_MATCHER.search(text, pos)
+        if not match or match.start() >= len(before):
+            return False
+        if match.end() > len(before):
+            return True
+        pos = match.start() + 1
+
+
+def _record_verdict(state: Dict[str, Any], analysis: AnalyzedMessage, verdict: _Verdict):
+    """Push a message's verdict into the session window and remember its last words"""
+    verdict_code = "blocked" if verdict.blocked_rule else ("warning" if verdict.warning_rule else "clear")
+    recent = state["recent"]
+    if len(recent) < SAFETY_CONTEXT_WINDOW:
+        recent.append(verdict_code)
+    else:
+        evicted = recent[state["next"]]
+        state["blocked"] -= evicted == "blocked"
+        state["warnings"] -= evicted == "warning"
+        recent[state["next"]] = verdict_code
+        state["next"] = (state["next"] + 1) % len(recent)
+    state["blocked"] += verdict_code == "blocked"
+    state["warnings"] += verdict_code == "warning"
+    state["blocked_total"] += verdict_code == "blocked"
+    
+    tokens = analysis.tokens
+    if len(tokens) >= CONTEXT_TAIL_WORDS:
+        state["tail"] = tokens[-CONTEXT_TAIL_WORDS:]
+    else:
+        state["tail"] = (state["tail"] + tokens)[-CONTEXT_TAIL_WORDS:]
+
+
+def check_safety(message: str, lang: str, context: List[str] = None,
+                 analysis: Optional[AnalyzedMessage] = None, state: Optional[Dict[str, Any]] = None) -> List[str]:
     """
     Advanced safety check with context awareness
     Returns list of safety flags
+    
+    Context comes from `state` (a session's safety state from new_safety_state(),
+    updated in place) or, for callers without one, from `context` (recent user messages).
     """
-    message_lower = message.lower().strip()
+    analysis = analyze(message, analysis)
+    verdict = _scan(analysis)
+    
     flags = []
+    if state is not None:
+        # Decided from the session's previous verdicts and last words only, never its history
+        if state["blocked"] >= SAFETY_CONTEXT_BLOCKS or _completes_blocked_phrase(state["tail"], analysis):
+            flags.append("blocked_context")
+        if state["warnings"] >= SAFETY_CONTEXT_WARNINGS:
+            flags.append("needs_review")
+        _record_verdict(state, analysis, verdict)
     
     # Check critical blocked patterns
-    for pattern in CRITICAL_BLOCKED_PATTERNS:
-        if re.search(pattern, message_lower, re.IGNORECASE):
-            logger.warning("Blocked content detected", pattern=pattern[:50], 
-                          message_preview=message[:50])
-            return ["blocked"]
+    if verdict.blocked_rule:
+        logger.warning("Blocked content detected", rule=verdict.blocked_rule,
+                       pattern=_rule_pattern(verdict.blocked_rule)[:50], message_preview=message[:50])
+        return ["blocked"]
     
     # Check warning patterns
-    warning_count = sum(1 for pattern in WARNING_PATTERNS 
-                       if re.search(pattern, message_lower, re.IGNORECASE))
-    
-    if warning_count > 0:
+    if verdict.warning_rule and "needs_review" not in flags:
         flags.append("needs_review")
     
     # Context-aware checking
-    if context:
-        # Check if message is part of a harmful pattern across context
-        recent_messages = " ".join(context[-3:]).lower()
-        if any(pattern in recent_messages for pattern in CRITICAL_BLOCKED_PATTERNS):
+    if state is None and context:
+        # Check if message completes a harmful pattern spread across recent messages
+        recent_messages = " ".join(list(context[-3:]) + [analysis.lower]).lower()
+        if _CRITICAL_MATCHER.search(recent_messages):
             flags.append("blocked_context")
     
-    # Check for excessive repetition (potential spam/abuse)
-    words = message_lower.split()
-    if len(words) > 0:
-        word_freq = {}
-        for word in words:
-            word_freq[word] = word_freq.get(word, 0) + 1
-        max_repetition = max(word_freq.values())
-        if max_repetition > len(words) * 0.3:  # More than 30% repetition
-            flags.append("low_confidence")
+    if "blocked_context" in flags:
+        logger.warning("Blocked content in conversation context", message_preview=message[:50])
+    
+    if verdict.repetitive:
+        flags.append("low_confidence")
     
     return flags
 
 
-def classify_intent(message: str, lang: str) -> str:
+def get_safety_stats() -> Dict[str, Any]:
+    """Verdict memoization statistics"""
+    return {"verdict_cache": _verdicts.get_stats()}
+
+
+# Priority-based intent mapping (more specific first; first match wins).
+# Matched against lowercased text, so rules are written in lowercase.
+INTENT_PATTERNS = [
+    # Emergency/Crisis (highest priority)
+    (r'\b(emergency|urgent|crisis|help\s+now|immediate\s+help|911)\b', "emergency"),
+    (r'\b(call\s+(police|ambulance|doctor|help)|contact\s+authorities)\b', "emergency"),
+    
+    # Assault/Abuse Support
+    (r'\b(rape|raped|assault|abused|molested|violated|hurt\s+me)\b', "assault_support"),
+    (r'\b(sexual\s+(assault|abuse|violence|harassment))\b', "assault_support"),
+    (r'\b(was\s+(raped|assaulted|abused|violated))\b', "assault_support"),
+    (r'\b(forced\s+(me|to|into)|against\s+my\s+will)\b', "assault_support"),
+    
+    # Consent
+    (r'\b(consent|permission|agree|say\s+no|say\s+yes)\b', "consent"),
+    (r'\b(can\s+i\s+say\s+no|do\s+i\s+have\s+to|forced)\b', "consent"),
+    (r'\b(boundaries|personal\s+boundaries|set\s+boundaries)\b', "consent"),
+    
+    # HIV Prevention
+    (r'\b(hiv|aids|h\.i\.v\.|human\s+immunodeficiency)\b', "HIV_prevention"),
+    (r'\b(prevent\s+hiv|hiv\s+prevention|protect\s+from\s+hiv)\b', "HIV_prevention"),
+    (r'\b(hiv\s+test|get\s+tested|hiv\s+transmission)\b', "HIV_prevention"),
+    
+    # Contraception
+    (r'\b(contracept|birth\s+control|condom|pregnancy\s+prevention)\b', "contraception"),
+    (r'\b(pill|iud|implant|injection|patch|ring)\b', "contraception"),
+    (r'\b(prevent\s+pregnancy|not\s+get\s+pregnant|avoid\s+pregnancy)\b', "contraception"),
+    
+    # Pregnancy
+    (r'\b(pregnant|pregnancy|expecting|baby|test\s+positive)\b', "pregnancy"),
+    (r'\b(missed\s+period|late\s+period|am\s+i\s+pregnant)\b', "pregnancy"),
+    
+    # STIs
+    (r'\b(sti|std|sexually\s+transmitted|chlamydia|gonorrhea|herpes)\b', "STI_info"),
+    (r'\b(get\s+tested|sti\s+test|std\s+test|screening)\b', "STI_info"),
+    
+    # Mental Health
+    (r'\b(depressed|depression|anxious|anxiety|suicidal|want\s+to\s+die)\b', "mental_health"),
+    (r'\b(self-harm|cutting|hurting\s+myself|feel\s+hopeless)\b', "mental_health"),
+    (r'\b(counselor|therapy|therapist|need\s+help)\b', "mental_health"),
+    
+    # Puberty/Body Changes
+    (r'\b(puberty|period|menstruation|menstrual|menarche)\b', "puberty"),
+    (r'\b(body\s+changes|growing|development|voice\s+change)\b', "puberty"),
+    
+    # Relationships
+    (r'\b(relationship|dating|boyfriend|girlfriend|breakup)\b', "relationships"),
+    (r'\b(like\s+someone|crush|attraction|love)\b', "relationships"),
+    
+    # LGBTQ+
+    (r'\b(gay|lesbian|bisexual|transgender|lgbtq|lgb|queer)\b', "LGBTQ"),
+    (r'\b(coming\s+out|sexual\s+orientation|gender\s+identity)\b', "LGBTQ"),
+]
+
+
+def _compile_intents(patterns: List[Tuple[str, str]]) -> List[Optional["re.Pattern"]]:
+    """
+    Matchers over the highest-priority rules: entry k is one alternation of
+    rules 0..k-1 (entry 0 is unused), so once rule k has matched only entry k
+    needs searching for something better.
+    """
+    sources = [pattern for pattern, _ in patterns]
+    return [None] + [re.compile(_alternation(sources[:k], "intent_")) for k in range(1, len(sources) + 1)]
+
+
+_INTENT_MATCHERS = _compile_intents(INTENT_PATTERNS)
+_INTENT_RULES = {f"intent_{i}": i for i in range(len(INTENT_PATTERNS))}
+
+
+def classify_intent(message: str, lang: str, analysis: Optional[AnalyzedMessage] = None) -> str:
     """
     Advanced intent classification with multiple patterns and priority
     """
-    message_lower = message.lower()
-    
-    # Priority-based intent mapping (more specific first)
-    intent_patterns = [
-        # Emergency/Crisis (highest priority)
-        (r'\b(emergency|urgent|crisis|help\s+now|immediate\s+help|911)\b', "emergency"),
-        (r'\b(call\s+(police|ambulance|doctor|help)|contact\s+authorities)\b', "emergency"),
-        
-        # Assault/Abuse Support
-        (r'\b(rape|raped|assault|abused|molested|violated|hurt\s+me)\b', "assault_support"),
-        (r'\b(sexual\s+(assault|abuse|violence|harassment))\b', "assault_support"),
-        (r'\b(was\s+(raped|assaulted|abused|violated))\b', "assault_support"),
-        (r'\b(forced\s+(me|to|into)|against\s+my\s+will)\b', "assault_support"),
-        
-        # Consent
-        (r'\b(consent|permission|agree|say\s+no|say\s+yes)\b', "consent"),
-        (r'\b(can\s+I\s+say\s+no|do\s+I\s+have\s+to|forced)\b', "consent"),
-        (r'\b(boundaries|personal\s+boundaries|set\s+boundaries)\b', "consent"),
-        
-        # HIV Prevention
-        (r'\b(hiv|aids|h\.i\.v\.|human\s+immunodeficiency)\b', "HIV_prevention"),
-        (r'\b(prevent\s+hiv|hiv\s+prevention|protect\s+from\s+hiv)\b', "HIV_prevention"),
-        (r'\b(hiv\s+test|get\s+tested|hiv\s+transmission)\b', "HIV_prevention"),
-        
-        # Contraception
-        (r'\b(contracept|birth\s+control|condom|pregnancy\s+prevention)\b', "contraception"),
-        (r'\b(pill|iud|implant|injection|patch|ring)\b', "contraception"),
-        (r'\b(prevent\s+pregnancy|not\s+get\s+pregnant|avoid\s+pregnancy)\b', "contraception"),
-        
-        # Pregnancy
-        (r'\b(pregnant|pregnancy|expecting|baby|test\s+positive)\b', "pregnancy"),
-        (r'\b(missed\s+period|late\s+period|am\s+I\s+pregnant)\b', "pregnancy"),
-        
-        # STIs
-        (r'\b(sti|std|sexually\s+transmitted|chlamydia|gonorrhea|herpes)\b', "STI_info"),
-        (r'\b(get\s+tested|sti\s+test|std\s+test|screening)\b', "STI_info"),
-        
-        # Mental Health
-        (r'\b(depressed|depression|anxious|anxiety|suicidal|want\s+to\s+die)\b', "mental_health"),
-        (r'\b(self-harm|cutting|hurting\s+myself|feel\s+hopeless)\b', "mental_health"),
-        (r'\b(counselor|therapy|therapist|need\s+help)\b', "mental_health"),
-        
-        # Puberty/Body Changes
-        (r'\b(puberty|period|menstruation|menstrual|menarche)\b', "puberty"),
-        (r'\b(body\s+changes|growing|development|voice\s+change)\b', "puberty"),
-        
-        # Relationships
-        (r'\b(relationship|dating|boyfriend|girlfriend|breakup)\b', "relationships"),
-        (r'\b(like\s+someone|crush|attraction|love)\b', "relationships"),
-        
-        # LGBTQ+
-        (r'\b(gay|lesbian|bisexual|transgender|lgbtq|lgb|queer)\b', "LGBTQ"),
-        (r'\b(coming\s+out|sexual\s+orientation|gender\s+identity)\b', "LGBTQ"),
-    ]
-    
-    # Check patterns in order (first match wins)
-    for pattern, intent in intent_patterns:
-        if re.search(pattern, message_lower, re.IGNORECASE):
-            logger.info("Intent classified", intent=intent, message_preview=message[:50])
-            return intent
+    analysis = analyze(message, analysis)
+    if analysis.intent is not None:
+        return analysis.intent
+    message_lower = analysis.lower
+    
+    # Leftmost match of any rule, then only ever look for higher-priority rules.
+    # No rule matches before the leftmost match, and at its position the
+    # alternation already preferred the lowest-numbered rule, so each search
+    # resumes one character later
+    best = len(INTENT_PATTERNS)
+    pos = 0
+    while best:
+        match = _INTENT_MATCHERS[best].search(message_lower, pos)
+        if not match:
+            break
+        best = _INTENT_RULES[match.lastgroup]
+        pos = match.start() + 1
     
     # Default to basic_info
-    return "basic_info"
+    if best == len(INTENT_PATTERNS):
+        analysis.intent = "basic_info"
+    else:
+        analysis.intent = INTENT_PATTERNS[best][1]
+        logger.debug("Intent classified", intent=analysis.intent, message_preview=message[:50])
+    return analysis.intent
+
+
+def classify_many(messages: List[str], lang: str = "en") -> List[str]:
+    """
+    Classify a batch of messages
+    Args:
+        messages: Messages to classify
+        lang: Language shared by the messages
+    Returns:
+        One intent per message, in order
+    """
+    return [classify_intent(message, lang) for message in messages]
 
 def localized_system_prompt(lang: str, reading_level: str) -> str:
     """
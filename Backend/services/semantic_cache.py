@@ -0,0 +1,301 @@
+"""
+Semantic Response Cache
+Finds cached answers for near-duplicate questions ("what is HIV?" vs
+"What is hiv") with MinHash signatures and an LSH index, partitioned so
+answers never cross language, reading level, intent or model
+"""
+import random
+import re
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from threading import Lock
+from typing import Dict, Any, List, Optional, Set, Tuple
+from config import (SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+# 16 bands x 4 rows: pairs above ~0.5 Jaccard usually share a band; the
+# threshold check on the full signature does the precise filtering
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(20240917)
+_PERMUTATIONS = [(_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+                 for _ in range(NUM_PERM)]
+
+# Devanagari vowel signs are not \w but belong to the word ("नहीं"); the dandas are punctuation
+_PUNCTUATION = re.compile(r"[^\w\s\u0900-\u0963\u0966-\u097F]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Conversational filler that does not change what is being asked
+_FILLER_PHRASES = re.compile(
+    r"\b(can you tell me|could you tell me|i want to know|i would like to know|quick question|"
+    r"please|pls|thanks|thank you|hey|hi|hello|"
+    r"s il te pla[iî]t|s il vous pla[iî]t|merci|bonjour|salut|"
+    r"por favor|obrigad[oa]|ol[aá]|oi|gracias|hola)\b"
+)
+
+Partition = Tuple[str, ...]
+
+
+def normalize_query(text: str) -> str:
+    """Case-fold, strip punctuation, filler words and extra whitespace (accents are kept)"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    stripped = _FILLER_PHRASES.sub(" ", text)
+    # Never normalize a greeting-only message down to nothing
+    if stripped.strip():
+        text = stripped
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+# Words that reverse or deny a question, per supported language (after
+# normalization "don't" is "don t"). Never accepted as a typo of another word.
+NEGATORS = {
+    # en
+    "not", "no", "never", "nor", "none", "nothing", "nobody", "neither", "without", "t", "cannot",
+    "dont", "doesnt", "didnt", "isnt", "arent", "wasnt", "werent", "cant", "couldnt", "wont",
+    "wouldnt", "shouldnt", "mustnt", "havent", "hasnt", "hadnt", "aint",
+    # fr
+    "ne", "n", "pas", "non", "jamais", "rien", "aucun", "aucune", "personne", "ni", "sans",
+    # pt / es
+    "não", "nao", "nunca", "nem", "nenhum", "nenhuma", "jamás", "jamas", "ningún", "ningun",
+    "ninguno", "ninguna", "tampoco", "sem", "sin",
+    # sw
+    "si", "sio", "hapana", "hakuna", "kamwe", "bila",
+    # hi
+    "नहीं", "नही", "मत", "न", "ना", "कभी", "बिना", "nahi", "nahin", "mat", "na",
+}
+
+# Single words that never change what is asked (phrases are stripped by normalize_query)
+FILLER_WORDS = {"um", "uh", "umm", "ok", "okay", "so", "well"}
+
+
+def _is_typo(word_a: str, word_b: str) -> bool:
+    """
+    Whether two different words are one misspelling apart: same first letter,
+    at least 4 letters, and one substitution, insertion, deletion or
+    transposition. Short words ("hiv" / "hpv") and negators never are.
+    """
+    if word_a in NEGATORS or word_b in NEGATORS:
+        return False
+    if min(len(word_a), len(word_b)) < 4 or abs(len(word_a) - len(word_b)) > 1 or word_a[0] != word_b[0]:
+        return False
+    if not (word_a.isalpha() and word_b.isalpha()):
+        return False
+    if len(word_a) == len(word_b):
+        diffs = [i for i, (x, y) in enumerate(zip(word_a, word_b)) if x != y]
+        if len(diffs) == 1:
+            return True
+        return (len(diffs) == 2 and diffs[1] == diffs[0] + 1
+                and word_a[diffs[0]] == word_b[diffs[1]] and word_a[diffs[1]] == word_b[diffs[0]])
+    shorter, longer = sorted((word_a, word_b), key=len)
+    i = next((i for i, (x, y) in enumerate(zip(shorter, longer)) if x != y), len(shorter))
+    return shorter[i:] == longer[i + 1:]
+
+
+def _same_question(normalized_a: str, normalized_b: str) -> bool:
+    """
+    Whether two similar queries ask the same thing: their words differ only
+    by filler words and typos, each misspelled word paired with one word of
+    the other query. Any added or swapped content word, and any added
+    negation, makes them different questions.
+    """
+    words_a, words_b = set(normalized_a.split()), set(normalized_b.split())
+    only_a = sorted((words_a - words_b) - FILLER_WORDS)
+    only_b = sorted((words_b - words_a) - FILLER_WORDS)
+    if len(only_a) != len(only_b):
+        return False
+    unmatched = list(only_b)
+    for word in only_a:
+        match = next((other for other in unmatched if _is_typo(word, other)), None)
+        if match is None:
+            return False
+        unmatched.remove(match)
+    return True
+
+
+def _shingles(normalized: str) -> Set[int]:
+    """Hashed character shingles of a normalized query"""
+    padded = f" {normalized} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {zlib.crc32(padded.encode())}
+    return {zlib.crc32(padded[i:i + SHINGLE_SIZE].encode())
+            for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def minhash(normalized: str) -> Tuple[int, ...]:
+    """MinHash signature of a normalized query"""
+    hashes = _shingles(normalized)
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+class _Entry:
+    """A cached answer and its signature"""
+
+    __slots__ = ("partition", "normalized", "signature", "answer", "expires_at", "hits")
+
+    def __init__(self, partition: Partition, normalized: str, signature: Tuple[int, ...], answer: Any, ttl: float):
+        self.partition = partition
+        self.normalized = normalized
+        self.signature = signature
+        self.answer = answer
+        self.expires_at = time.time() + ttl
+        self.hits = 0
+
+
+class SemanticCache:
+    """
+    Thread-safe near-duplicate answer cache.
+    Memory is bounded by `max_entries` (least recently used entries go first)
+    and entries expire after `ttl_seconds` unless added with their own TTL.
+    """
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 5000, ttl_seconds: float = 1800):
+        """
+        Initialize cache
+        Args:
+            threshold: Minimum estimated Jaccard similarity for a hit (0-1)
+            max_entries: Maximum cached answers across all partitions
+            ttl_seconds: Default time to live for cached answers
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        # (partition, band index, band values) -> entry ids
+        self._buckets: Dict[tuple, Set[int]] = defaultdict(set)
+        # (partition, normalized query) -> entry id, so re-adding replaces
+        self._by_query: Dict[tuple, int] = {}
+        self._next_id = 0
+        self._lock = Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+        self.candidates_checked = 0
+        self.lookup_times = deque(maxlen=1000)
+
+    @staticmethod
+    def _band_keys(partition: Partition, signature: Tuple[int, ...]) -> List[tuple]:
+        return [(partition, band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def _remove(self, entry_id: int):
+        """Drop an entry from every index (caller holds the lock)"""
+        entry = self._entries.pop(entry_id)
+        for band_key in self._band_keys(entry.partition, entry.signature):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band_key]
+        self._by_query.pop((entry.partition, entry.normalized), None)
+
+    def lookup(self, query: str, partition: Partition) -> Optional[Tuple[Any, float]]:
+        """
+        Find a cached answer for a near-duplicate query in the same partition
+
+        Returns:
+            (answer, similarity) for the most similar live entry above the
+            threshold, or None
+        """
+        start_time = time.perf_counter()
+        normalized = normalize_query(query)
+        signature = minhash(normalized)
+        now = time.time()
+
+        with self._lock:
+            self.lookups += 1
+            candidates = set()
+            for band_key in self._band_keys(partition, signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best_id, best_score = None, 0.0
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now > entry.expires_at:
+                    self._remove(entry_id)
+                    continue
+                if entry.normalized == normalized:
+                    score = 1.0
+                else:
+                    score = similarity(signature, entry.signature)
+                    if score >= self.threshold and not _same_question(normalized, entry.normalized):
+                        continue
+                if score > best_score:
+                    best_id, best_score = entry_id, score
+            self.candidates_checked += len(candidates)
+
+            result = None
+            if best_id is not None and best_score >= self.threshold:
+                entry = self._entries[best_id]
+                self._entries.move_to_end(best_id)
+                entry.hits += 1
+                self.hits += 1
+                result = (entry.answer, best_score)
+
+            self.lookup_times.append(time.perf_counter() - start_time)
+            return result
+
+    def add(self, query: str, partition: Partition, answer: Any, ttl: Optional[float] = None):
+        """Cache an answer for a query with an optional per-entry TTL"""
+        normalized = normalize_query(query)
+        signature = minhash(normalized)
+
+        with self._lock:
+            existing = self._by_query.get((partition, normalized))
+            if existing is not None:
+                self._remove(existing)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(partition, normalized, signature, answer,
+                                             self.ttl if ttl is None else ttl)
+            self._by_query[(partition, normalized)] = entry_id
+            for band_key in self._band_keys(partition, signature):
+                self._buckets[band_key].add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._by_query.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate, size and lookup latency"""
+        with self._lock:
+            times = sorted(self.lookup_times)
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "partitions": len({entry.partition for entry in self._entries.values()}),
+                "threshold": self.threshold,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "avg_candidates": round(self.candidates_checked / self.lookups, 2) if self.lookups else 0.0,
+                "p50_lookup_ms": round(times[len(times) // 2] * 1000, 3) if times else 0.0,
+                "p95_lookup_ms": round(times[min(int(len(times) * 0.95), len(times) - 1)] * 1000, 3) if times else 0.0
+            }
+
+
+# Global semantic cache
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    ttl_seconds=CACHE_TTL_SECONDS
+)
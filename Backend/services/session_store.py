@@ -168,6 +168,7 @@ def reset_session(session_id: str, language: str, reading_level: str = "simple")
         session["reading_level"] = reading_level
         session["history"] = []
         session["safety_flags"] = []
+        session.pop("safety_state", None)
         session["counters"] = {"tokens": 0, "messages": 0, "ai_responses": 0}
         session["created_at"] = int(time.time())
         session["last_activity"] = int(time.time())
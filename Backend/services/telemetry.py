@@ -3,27 +3,83 @@ Advanced Telemetry and Metrics Service
 Real-time tracking of system usage and performance
 """
 from services.session_store import get_session_stats
+from services.semantic_cache import normalize_query
+from services.message_analysis import AnalyzedMessage, analyze
+from utils.sketches import HeavyHitters
+from config import HEAVY_HITTERS_CAPACITY, HEAVY_HITTERS_SKETCH_WIDTH
 from utils.logger import logger
-from collections import defaultdict
+from collections import defaultdict, deque
 from threading import Lock
+from typing import List, Optional, Tuple
 import time
 
+# Number of recent latency samples kept for percentile reporting
+LATENCY_SAMPLE_SIZE = 1000
+
+# Default number of popular questions / topics reported per language
+DEFAULT_TOP_K = 10
+
+
+def _heavy_hitters() -> HeavyHitters:
+    """Fixed-memory popularity sketch for one language"""
+    return HeavyHitters(capacity=HEAVY_HITTERS_CAPACITY, width=HEAVY_HITTERS_SKETCH_WIDTH)
+
+
+def _new_metrics() -> dict:
+    """Fresh metrics storage"""
+    return {
+        "total_requests": 0,
+        "total_sessions_created": 0,
+        "total_messages_processed": 0,
+        "total_errors": 0,
+        "intent_counts": defaultdict(int),
+        "language_counts": defaultdict(int),
+        "model_usage": defaultdict(int),
+        "safety_blocks": 0,
+        "rate_limit_hits": 0,
+        "streamed_messages": 0,
+        "time_to_first_token": deque(maxlen=LATENCY_SAMPLE_SIZE),
+        "hedge_eligible_calls": 0,
+        "hedges_fired": 0,
+        "hedge_wins": 0,
+        "hedge_latency_saved": deque(maxlen=LATENCY_SAMPLE_SIZE),
+        "downgrades": 0,
+        "downgrades_by_intent": defaultdict(int),
+        "coalesced_requests": defaultdict(int),
+        "chat_cache_events": defaultdict(int),
+        "idempotent_retries": defaultdict(int),
+        # language -> fixed-size sketches of normalized questions and lesson topics
+        "popular_questions": defaultdict(_heavy_hitters),
+        "popular_topics": defaultdict(_heavy_hitters),
+        "start_time": time.time()
+    }
+
+
 # In-memory metrics storage
-_metrics = {
-    "total_requests": 0,
-    "total_sessions_created": 0,
-    "total_messages_processed": 0,
-    "total_errors": 0,
-    "intent_counts": defaultdict(int),
-    "language_counts": defaultdict(int),
-    "model_usage": defaultdict(int),
-    "safety_blocks": 0,
-    "rate_limit_hits": 0,
-    "start_time": time.time()
-}
+_metrics = _new_metrics()
 _metrics_lock = Lock()
 
 
+def _latency_summary(samples) -> dict:
+    """Summarize latency samples (seconds) as milliseconds percentiles"""
+    if not samples:
+        return {"count": 0, "avg_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        index = min(int(len(ordered) * p), len(ordered) - 1)
+        return round(ordered[index] * 1000, 2)
+
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99)
+    }
+
+
 def record_request():
     """Record an API request"""
     with _metrics_lock:
@@ -47,6 +103,91 @@ def record_message(intent: str = None, model: str = None):
             _metrics["model_usage"][model] += 1
 
 
+def record_question(language: str, message: str, analysis: Optional[AnalyzedMessage] = None):
+    """
+    Count a chat question in its language's heavy-hitter sketch. Only the
+    normalized, truncated form is kept: any entry (even a one-off) can show
+    up in the metrics and warm-up, so the student's own wording never does.
+    """
+    key = analyze(message, analysis).normalized[:100]
+    with _metrics_lock:
+        _metrics["popular_questions"][language].add(key)
+
+
+def record_lesson_topic(language: str, topic: str):
+    """Count a requested lesson topic in its language's heavy-hitter sketch (normalized form only)"""
+    key = normalize_query(topic)[:100]
+    with _metrics_lock:
+        _metrics["popular_topics"][language].add(key)
+
+
+def top_questions(language: str, limit: int = 20) -> List[Tuple[str, int]]:
+    """Most asked chat questions in a language as (normalized question, count), most frequent first"""
+    with _metrics_lock:
+        sketch = _metrics["popular_questions"].get(language)
+        if sketch is None:
+            return []
+        return [(entry["example"], entry["count"]) for entry in sketch.top(limit)]
+
+
+def _popular(sketches: dict, top_k: int) -> dict:
+    """Top-K per language from heavy-hitter sketches (caller holds the lock)"""
+    return {
+        language: {"total": sketch.total, "top": sketch.top(top_k)}
+        for language, sketch in sketches.items()
+    }
+
+
+def record_stream(time_to_first_token: float = None):
+    """Record a streamed chat response and its time to first token (seconds)"""
+    with _metrics_lock:
+        _metrics["streamed_messages"] += 1
+        if time_to_first_token is not None:
+            _metrics["time_to_first_token"].append(time_to_first_token)
+
+
+def record_hedge(fired: bool, won: bool = False):
+    """Record a hedging-eligible upstream call, whether it hedged and whether the hedge won"""
+    with _metrics_lock:
+        _metrics["hedge_eligible_calls"] += 1
+        if fired:
+            _metrics["hedges_fired"] += 1
+        if won:
+            _metrics["hedge_wins"] += 1
+
+
+def record_hedge_latency_saved(seconds: float):
+    """Record how much sooner a winning hedge answered than the original request"""
+    with _metrics_lock:
+        _metrics["hedge_latency_saved"].append(seconds)
+
+
+def record_downgrade(intent: str = None):
+    """Record a query sent to the faster model because the advanced one was under pressure"""
+    with _metrics_lock:
+        _metrics["downgrades"] += 1
+        if intent:
+            _metrics["downgrades_by_intent"][intent] += 1
+
+
+def record_coalesced(kind: str):
+    """Record a request that waited on an identical in-flight upstream call"""
+    with _metrics_lock:
+        _metrics["coalesced_requests"][kind] += 1
+
+
+def record_chat_cache_event(event: str):
+    """Record a chat cache event (stale_served, refreshed, refresh_failed, negative_hit)"""
+    with _metrics_lock:
+        _metrics["chat_cache_events"][event] += 1
+
+
+def record_idempotent_retry(outcome: str):
+    """Record a retried /api/chat request by outcome (replayed, joined_in_flight, key_reused)"""
+    with _metrics_lock:
+        _metrics["idempotent_retries"][outcome] += 1
+
+
 def record_error():
     """Record an error"""
     with _metrics_lock:
@@ -65,10 +206,13 @@ def record_rate_limit():
         _metrics["rate_limit_hits"] += 1
 
 
-def get_metrics() -> dict:
+def get_metrics(top_k: int = DEFAULT_TOP_K) -> dict:
     """
     Get comprehensive system metrics
     
+    Args:
+        top_k: Popular questions and topics reported per language
+    
     Returns:
         Dictionary with system metrics
     """
@@ -135,6 +279,45 @@ def get_metrics() -> dict:
             "safety_blocks": _metrics["safety_blocks"],
             "rate_limit_hits": _metrics["rate_limit_hits"],
             
+            # Streaming stats
+            "streamed_messages": _metrics["streamed_messages"],
+            "time_to_first_token": _latency_summary(_metrics["time_to_first_token"]),
+            
+            # Hedged upstream requests
+            "hedging": {
+                "eligible_calls": _metrics["hedge_eligible_calls"],
+                "hedges_fired": _metrics["hedges_fired"],
+                "hedge_wins": _metrics["hedge_wins"],
+                "hedge_rate": round(
+                    _metrics["hedges_fired"] / max(_metrics["hedge_eligible_calls"], 1), 3
+                ),
+                "win_rate": round(
+                    _metrics["hedge_wins"] / max(_metrics["hedges_fired"], 1), 3
+                ),
+                "latency_saved": _latency_summary(_metrics["hedge_latency_saved"])
+            },
+            
+            # Requests that shared an identical in-flight upstream call, by kind
+            "coalesced_requests": dict(_metrics["coalesced_requests"]),
+            
+            # Client retries answered by Idempotency-Key instead of re-running the pipeline
+            "idempotent_retries": dict(_metrics["idempotent_retries"]),
+            
+            # Most asked questions and lesson topics per language (counts are upper bounds)
+            "popular": {
+                "questions": _popular(_metrics["popular_questions"], top_k),
+                "lesson_topics": _popular(_metrics["popular_topics"], top_k)
+            },
+            
+            # Stale-while-revalidate and negative caching of chat answers
+            "chat_cache": dict(_metrics["chat_cache_events"]),
+            
+            # Load-adaptive model downgrades
+            "degradation": {
+                "downgrades": _metrics["downgrades"],
+                "downgrades_by_intent": dict(_metrics["downgrades_by_intent"])
+            },
+            
             # Session details
             "sessions_by_language": session_stats.get("sessions_by_language", {}),
             "oldest_session_age_hours": round(
@@ -147,16 +330,5 @@ def get_metrics() -> dict:
 def reset_metrics():
     """Reset all metrics (use with caution)"""
     with _metrics_lock:
-        _metrics.update({
-            "total_requests": 0,
-            "total_sessions_created": 0,
-            "total_messages_processed": 0,
-            "total_errors": 0,
-            "intent_counts": defaultdict(int),
-            "language_counts": defaultdict(int),
-            "model_usage": defaultdict(int),
-            "safety_blocks": 0,
-            "rate_limit_hits": 0,
-            "start_time": time.time()
-        })
+        _metrics.update(_new_metrics())
         logger.info("Metrics reset")
\ No newline at end of file
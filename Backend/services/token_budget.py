@@ -0,0 +1,223 @@
+"""
+Learned Token Budgets
+Sets max_tokens per (intent, language, complexity) from the completion
+lengths actually observed, persisted across restarts and shared by every
+worker process through one file
+"""
+import atexit
+import json
+import os
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialized between processes
+    fcntl = None
+from collections import defaultdict, deque
+from threading import Lock
+from typing import Dict, Any, Optional, Tuple
+from config import (STATE_DIR, TOKEN_BUDGET_PERCENTILE, TOKEN_BUDGET_MIN_SAMPLES,
+                    TOKEN_BUDGET_MIN, TOKEN_BUDGET_MAX)
+from utils.logger import logger
+
+# Completions kept per bucket
+SAMPLE_SIZE = 200
+# Truncated completions only tell us the answer was longer; count them as this much longer
+TRUNCATION_BOOST = 1.5
+# Headroom over the percentile so typical answers are not cut short
+BUDGET_HEADROOM = 1.15
+SAVE_INTERVAL_SECONDS = 60
+
+BudgetKey = Tuple[str, str, str]
+
+
+def _bucket(key: BudgetKey) -> str:
+    """Serialized "intent|lang|complexity" bucket name"""
+    return "|".join(key)
+
+
+class TokenBudget:
+    """Thread-safe per-bucket completion length tracker"""
+
+    def __init__(self, path: Optional[str] = None, percentile: float = 0.95, min_samples: int = 20,
+                 min_tokens: int = 128, max_tokens: int = 1200):
+        """
+        Initialize budgets
+        Args:
+            path: JSON file the table is persisted to (None keeps it in memory)
+            percentile: Completion length percentile the budget covers
+            min_samples: Samples a bucket needs before its budget replaces the default
+            min_tokens: Lower bound for a learned budget
+            max_tokens: Upper bound for a learned budget
+        """
+        self.path = path
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_tokens = min_tokens
+        self.max_tokens_cap = max_tokens
+        # bucket -> deque of (completion_tokens, truncated)
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+        self._calls = defaultdict(int)
+        self._truncated = defaultdict(int)
+        # Completions recorded here since the last save, merged into the shared file on save
+        self._pending: Dict[str, list] = defaultdict(list)
+        self._lock = Lock()
+        self._dirty = False
+        self._last_save = time.time()
+        self._load()
+
+    def _budget(self, samples) -> Optional[int]:
+        """Budget from a bucket's samples, or None when there are too few (caller holds the lock)"""
+        if len(samples) < self.min_samples:
+            return None
+        lengths = sorted(tokens * TRUNCATION_BOOST if truncated else tokens for tokens, truncated in samples)
+        observed = lengths[min(int(len(lengths) * self.percentile), len(lengths) - 1)]
+        return int(min(max(observed * BUDGET_HEADROOM, self.min_tokens), self.max_tokens_cap))
+
+    def max_tokens(self, intent: str, lang: str, complexity: str, default: int) -> int:
+        """max_tokens to request for a chat, falling back to `default` while learning"""
+        with self._lock:
+            samples = self._samples.get(_bucket((intent or "general", lang, complexity)))
+            budget = self._budget(samples) if samples else None
+        return default if budget is None else budget
+
+    def record(self, key: BudgetKey, completion_tokens: Optional[int], finish_reason: Optional[str]):
+        """
+        Record one completion
+        Args:
+            key: (intent, language, complexity)
+            completion_tokens: usage.completion_tokens from the response
+            finish_reason: "stop", "length", ...
+        """
+        if not completion_tokens:
+            return
+        bucket = _bucket((key[0] or "general", key[1], key[2]))
+        truncated = finish_reason == "length"
+
+        with self._lock:
+            self._samples[bucket].append((int(completion_tokens), truncated))
+            self._pending[bucket].append((int(completion_tokens), truncated))
+            self._calls[bucket] += 1
+            if truncated:
+                self._truncated[bucket] += 1
+            self._dirty = True
+            save_due = time.time() - self._last_save >= SAVE_INTERVAL_SECONDS
+
+        if save_due:
+            self.save()
+
+    def _read(self) -> Dict[str, Any]:
+        """The persisted table, or {} for a missing or unreadable file"""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            return stored if isinstance(stored, dict) else {}
+        except (OSError, ValueError) as e:
+            logger.warning("Could not load token budgets", path=self.path, error=str(e))
+            return {}
+
+    def _adopt(self, stored: Dict[str, Any]):
+        """
+        Replace the in-memory table with a persisted one, keeping completions
+        not saved yet (caller holds the lock)
+        """
+        self._samples.clear()
+        self._calls.clear()
+        self._truncated.clear()
+        try:
+            for bucket, entry in stored.items():
+                self._samples[bucket].extend((int(t), bool(tr)) for t, tr in entry.get("samples", []))
+                self._calls[bucket] = int(entry.get("calls", 0))
+                self._truncated[bucket] = int(entry.get("truncated", 0))
+        except (AttributeError, ValueError, TypeError) as e:
+            logger.warning("Ignoring malformed token budgets", path=self.path, error=str(e))
+        for bucket, samples in self._pending.items():
+            self._samples[bucket].extend(samples)
+            self._calls[bucket] += len(samples)
+            self._truncated[bucket] += sum(1 for _, truncated in samples if truncated)
+
+    def _load(self):
+        """Load a persisted table, ignoring a missing or unreadable file"""
+        if not self.path:
+            return
+        stored = self._read()
+        with self._lock:
+            self._adopt(stored)
+        if stored:
+            logger.info("Token budgets loaded", buckets=len(stored), path=self.path)
+
+    def save(self):
+        """
+        Merge this process's new completions into the persisted table and
+        write it back atomically (no-op without changes). The file is locked
+        while merging, so workers sharing it add to each other's samples
+        instead of overwriting them, and each worker picks up what the
+        others learned.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            pending, self._pending = self._pending, defaultdict(list)
+            self._dirty = False
+            self._last_save = time.time()
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                stored = self._read()
+                for bucket, samples in pending.items():
+                    entry = stored.get(bucket)
+                    if not isinstance(entry, dict):
+                        entry = stored[bucket] = {"samples": [], "calls": 0, "truncated": 0}
+                    entry["samples"] = (list(entry.get("samples", [])) + [list(sample) for sample in samples])[-SAMPLE_SIZE:]
+                    entry["calls"] = int(entry.get("calls", 0)) + len(samples)
+                    entry["truncated"] = int(entry.get("truncated", 0)) + sum(1 for _, truncated in samples if truncated)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(stored, f)
+                os.replace(tmp_path, self.path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Could not save token budgets", path=self.path, error=str(e))
+            with self._lock:
+                # Keep the completions for the next save
+                for bucket, samples in pending.items():
+                    self._pending[bucket][:0] = samples
+                self._dirty = True
+            return
+
+        with self._lock:
+            self._adopt(stored)
+
+    def get_table(self) -> Dict[str, Any]:
+        """Learned budgets and completion stats per bucket"""
+        with self._lock:
+            table = {}
+            for bucket, samples in self._samples.items():
+                lengths = sorted(tokens for tokens, _ in samples)
+                recent_truncated = sum(1 for _, truncated in samples if truncated)
+                table[bucket] = {
+                    "samples": len(lengths),
+                    "calls": self._calls[bucket],
+                    "truncated": self._truncated[bucket],
+                    "recent_truncation_rate": round(recent_truncated / len(lengths), 3) if lengths else 0.0,
+                    "p50_tokens": lengths[len(lengths) // 2] if lengths else None,
+                    "p95_tokens": lengths[min(int(len(lengths) * 0.95), len(lengths) - 1)] if lengths else None,
+                    "max_tokens": self._budget(samples)
+                }
+            return table
+
+
+# Global token budget table
+token_budget = TokenBudget(
+    path=os.path.join(STATE_DIR, "token_budgets.json") if STATE_DIR else None,
+    percentile=TOKEN_BUDGET_PERCENTILE,
+    min_samples=TOKEN_BUDGET_MIN_SAMPLES,
+    min_tokens=TOKEN_BUDGET_MIN,
+    max_tokens=TOKEN_BUDGET_MAX
+)
+atexit.register(token_budget.save)
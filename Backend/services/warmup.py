@@ -0,0 +1,222 @@
+"""
+Cache Warm-up Job
+Feeds FAQ questions and the most asked chat questions through route_chat
+at low priority, so the first student of the day gets a cached answer
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from config import (ALLOWED_LANGS, WARMUP_INTERVAL_SECONDS, WARMUP_WORKERS, WARMUP_TOP_QUERIES,
+                    WARMUP_MAX_UPSTREAM_CALLS)
+from services.admission import LoadShedError, PRIORITY_LOW
+from services.model_router import route_chat, chat_cache_state
+from services.safety import check_safety, classify_intent, localized_system_prompt
+from services.message_analysis import AnalyzedMessage
+from services.telemetry import top_questions
+from utils.logger import logger
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Reading level of the sessions being warmed (the session default)
+WARMUP_READING_LEVEL = "simple"
+
+
+def _faq_questions(lang: str) -> List[str]:
+    """Questions from data/faq_<lang>.json (missing or empty files give none)"""
+    try:
+        with open(os.path.join(DATA_DIR, f"faq_{lang}.json"), "r", encoding="utf-8") as f:
+            return [item["question"] for item in json.load(f) if item.get("question")]
+    except (OSError, ValueError, TypeError, KeyError):
+        return []
+
+
+class _LanguageProgress:
+    """Counters for one language in the current run"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.warmed = 0
+        self.refreshed = 0
+        self.already_cached = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class CacheWarmer:
+    """
+    Runs warm-up passes at startup and every `interval_seconds`.
+    Questions already fresh in cache, uncacheable, blocked by the safety
+    filter or with no upstream route available cost nothing; each pass stops
+    calling upstream once `max_upstream_calls` is spent.
+    """
+
+    def __init__(self, languages: List[str], interval_seconds: float, max_workers: int,
+                 top_queries: int, max_upstream_calls: int):
+        """
+        Initialize warmer
+        Args:
+            languages: Languages to warm
+            interval_seconds: Time between passes (0 runs once at startup only)
+            max_workers: Questions warmed concurrently
+            top_queries: Most asked questions per language added to the FAQ list
+            max_upstream_calls: Upstream calls allowed per pass
+        """
+        self.languages = languages
+        self.interval = interval_seconds
+        self.max_workers = max_workers
+        self.top_queries = top_queries
+        self.max_upstream_calls = max_upstream_calls
+
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.running = False
+        self.runs = 0
+        self.upstream_calls = 0
+        self.total_upstream_calls = 0
+        self.last_started: Optional[float] = None
+        self.last_finished: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.next_run_at: Optional[float] = None
+        self.progress: Dict[str, _LanguageProgress] = {}
+
+    def start(self):
+        """Start the background scheduler (first pass runs immediately)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="cache-warmup", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop scheduling further passes"""
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self.run_once()
+            if self.interval <= 0:
+                return
+            self.next_run_at = time.time() + self.interval
+            self._stop.wait(self.interval)
+
+    def _questions(self, lang: str) -> List[str]:
+        """FAQ questions then the most asked ones, without duplicates"""
+        questions = _faq_questions(lang) + [message for message, _ in top_questions(lang, self.top_queries)]
+        return list(dict.fromkeys(questions))
+
+    def _take_upstream_call(self) -> bool:
+        """Reserve one upstream call from this pass's budget"""
+        with self._lock:
+            if self.upstream_calls >= self.max_upstream_calls:
+                return False
+            self.upstream_calls += 1
+            self.total_upstream_calls += 1
+            return True
+
+    def _warm(self, lang: str, message: str):
+        """Warm one question unless it is already cached or must not be"""
+        session = {
+            "language": lang,
+            "reading_level": WARMUP_READING_LEVEL,
+            "history": [{"role": "system", "content": localized_system_prompt(lang, WARMUP_READING_LEVEL)}]
+        }
+        progress = self.progress[lang]
+        outcome = "skipped"
+        try:
+            analysis = AnalyzedMessage(message)
+            safety_flags = check_safety(message, lang, context=[], analysis=analysis)
+            if "blocked" not in safety_flags:
+                intent = classify_intent(message, lang, analysis=analysis)
+                state = chat_cache_state(session, message, intent, safety_flags, analysis=analysis)
+                if state == "fresh":
+                    outcome = "already_cached"
+                elif state in ("missing", "stale") and self._take_upstream_call():
+                    # A stale answer is served and refreshed in the background by route_chat
+                    # A failed warm-up must not make students wait out a negative cache entry
+                    _, _, confidence = route_chat(session, message, intent, safety_flags, priority=PRIORITY_LOW,
+                                                  analysis=analysis, negative_cache=False)
+                    if state == "stale":
+                        outcome = "refreshed"
+                    else:
+                        outcome = "warmed" if confidence > 0.3 else "failed"
+        except LoadShedError:
+            outcome = "failed"
+        except Exception as e:
+            logger.error("Cache warm-up failed for question", error=e, lang=lang)
+            outcome = "failed"
+
+        with self._lock:
+            setattr(progress, outcome, getattr(progress, outcome) + 1)
+            progress.done += 1
+
+    def run_once(self) -> bool:
+        """
+        Run one warm-up pass now
+
+        Returns:
+            False if a pass was already running
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return False
+        try:
+            work = [(lang, question) for lang in self.languages for question in self._questions(lang)]
+            with self._lock:
+                self.running = True
+                self.upstream_calls = 0
+                self.last_started = time.time()
+                self.progress = {lang: _LanguageProgress(sum(1 for l, _ in work if l == lang))
+                                 for lang in self.languages}
+            logger.info("Cache warm-up started", questions=len(work), languages=len(self.languages))
+
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="warmup") as executor:
+                for lang, question in work:
+                    executor.submit(self._warm, lang, question)
+
+            with self._lock:
+                self.running = False
+                self.runs += 1
+                self.last_finished = time.time()
+                self.last_duration = self.last_finished - self.last_started
+            logger.info("Cache warm-up finished", duration=round(self.last_duration, 2),
+                        upstream_calls=self.upstream_calls)
+            return True
+        finally:
+            self._run_lock.release()
+
+    def get_progress(self) -> Dict[str, Any]:
+        """Current or last pass progress and upstream budget use"""
+        with self._lock:
+            return {
+                "running": self.running,
+                "runs": self.runs,
+                "interval_seconds": self.interval,
+                "last_started": self.last_started,
+                "last_finished": self.last_finished,
+                "last_duration_seconds": round(self.last_duration, 2) if self.last_duration else None,
+                "next_run_at": self.next_run_at,
+                "upstream_calls": self.upstream_calls,
+                "upstream_budget": self.max_upstream_calls,
+                "total_upstream_calls": self.total_upstream_calls,
+                "languages": {lang: progress.to_dict() for lang, progress in self.progress.items()}
+            }
+
+
+# Global cache warmer
+cache_warmer = CacheWarmer(
+    languages=[lang.strip() for lang in ALLOWED_LANGS],
+    interval_seconds=WARMUP_INTERVAL_SECONDS,
+    max_workers=WARMUP_WORKERS,
+    top_queries=WARMUP_TOP_QUERIES,
+    max_upstream_calls=WARMUP_MAX_UPSTREAM_CALLS
+)
@@ -1,84 +1,307 @@
 """
 Response Caching Utility
-Simple in-memory cache for frequently asked questions
+In-memory LRU cache with per-entry TTL, an entry and byte budget, and
+per-prefix statistics, optionally backed by a shared disk tier
 """
 import hashlib
+import heapq
+import json
+import sys
 import time
-from typing import Optional, Dict, Any
+from collections import OrderedDict, defaultdict
+from typing import Optional, Dict, Any, List
 from threading import Lock
+from config import (CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, ENABLE_DISK_CACHE, DISK_CACHE_PATH,
+                    DISK_CACHE_MAX_ENTRIES)
+from utils.disk_cache import DiskCache
+
+# Characters of each value shown by dump()
+DUMP_PREVIEW_CHARS = 200
+
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes"""
+    if isinstance(value, str):
+        return sys.getsizeof(value)
+    if isinstance(value, bytes):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return sys.getsizeof(value)
+
+
+class _Entry:
+    """A cached value and its bookkeeping"""
+
+    __slots__ = ("value", "prefix", "expires_at", "created_at", "size", "hits")
+
+    def __init__(self, value: Any, prefix: str, ttl: float, size: int):
+        self.value = value
+        self.prefix = prefix
+        self.created_at = time.time()
+        self.expires_at = self.created_at + ttl
+        self.size = size
+        self.hits = 0
+
+
+class _PrefixStats:
+    """Hit / miss / eviction counters for one key prefix"""
+
+    __slots__ = ("hits", "disk_hits", "misses", "evictions", "expirations", "entries", "bytes")
+
+    def __init__(self):
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.entries = 0
+        self.bytes = 0
+
 
 class ResponseCache:
-    """Thread-safe in-memory cache for API responses"""
-    
-    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000):
+    """
+    Thread-safe in-memory cache for API responses.
+    get, set and eviction are O(1) (LRU order in an OrderedDict); expiry uses
+    a min-heap of deadlines so expired entries are dropped in O(log n) each.
+    With a disk tier, misses fall through to disk (hits are promoted into
+    memory) and writes go to both tiers.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_size: int = 1000, max_bytes: int = 64 * 1024 * 1024,
+                 disk: Optional[DiskCache] = None):
         """
         Initialize cache
         Args:
-            ttl_seconds: Time to live for cache entries in seconds
+            ttl_seconds: Default time to live for cache entries in seconds
             max_size: Maximum number of cache entries
+            max_bytes: Maximum approximate size of all cached values
+            disk: Optional shared second tier
         """
-        self.cache: Dict[str, Dict[str, Any]] = {}
+        self.cache: "OrderedDict[str, _Entry]" = OrderedDict()
         self.ttl = ttl_seconds
         self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.disk = disk
+        self.bytes = 0
         self.lock = Lock()
-    
-    def _generate_key(self, prefix: str, *args, **kwargs) -> str:
-        """Generate cache key from arguments"""
+        self._expiry_heap: List[tuple] = []
+        self._prefix_keys: Dict[str, set] = defaultdict(set)
+        self._stats: Dict[str, _PrefixStats] = defaultdict(_PrefixStats)
+
+    def make_key(self, prefix: str, *args, **kwargs) -> str:
+        """Cache key for a prefix and arguments ("prefix:digest")"""
         # Create a deterministic string from args and kwargs
         key_data = f"{prefix}:{str(args)}:{str(sorted(kwargs.items()))}"
-        return hashlib.md5(key_data.encode()).hexdigest()
-    
-    def get(self, prefix: str, *args, **kwargs) -> Optional[Any]:
-        """Get cached value if exists and not expired"""
-        key = self._generate_key(prefix, *args, **kwargs)
-        
+        return f"{prefix}:{hashlib.md5(key_data.encode()).hexdigest()}"
+
+    def _generate_key(self, prefix: str, *args, **kwargs) -> str:
+        """Generate cache key from arguments"""
+        return self.make_key(prefix, *args, **kwargs)
+
+    def _remove(self, key: str) -> _Entry:
+        """Drop an entry and its accounting (caller holds the lock)"""
+        entry = self.cache.pop(key)
+        self.bytes -= entry.size
+        self._prefix_keys[entry.prefix].discard(key)
+        stats = self._stats[entry.prefix]
+        stats.entries -= 1
+        stats.bytes -= entry.size
+        return entry
+
+    def _expire(self, now: float):
+        """Drop entries whose deadline has passed (caller holds the lock)"""
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, key = heapq.heappop(heap)
+            entry = self.cache.get(key)
+            # Skip heap records left behind by overwritten or evicted entries
+            if entry is not None and entry.expires_at == expires_at:
+                self._remove(key)
+                self._stats[entry.prefix].expirations += 1
+
+        # Overwrites leave stale heap records; rebuild before they pile up
+        if len(heap) > 2 * len(self.cache) + 64:
+            self._expiry_heap = [(entry.expires_at, key) for key, entry in self.cache.items()]
+            heapq.heapify(self._expiry_heap)
+
+    def get_key(self, key: str) -> Optional[Any]:
+        """Get a cached value by full key if it exists and has not expired"""
+        prefix = key.split(":", 1)[0]
+        now = time.time()
+
         with self.lock:
-            if key not in self.cache:
+            entry = self.cache.get(key)
+            if entry is not None and now <= entry.expires_at:
+                self.cache.move_to_end(key)
+                entry.hits += 1
+                self._stats[prefix].hits += 1
+                return entry.value
+
+            if entry is not None:
+                self._remove(key)
+                self._stats[prefix].expirations += 1
+            if self.disk is None:
+                self._stats[prefix].misses += 1
                 return None
-            
-            entry = self.cache[key]
-            
-            # Check if expired
-            if time.time() > entry['expires_at']:
-                del self.cache[key]
+
+        stored = self.disk.get(key)
+        with self.lock:
+            if stored is None:
+                self._stats[prefix].misses += 1
                 return None
-            
-            return entry['value']
-    
+            self._stats[prefix].hits += 1
+            self._stats[prefix].disk_hits += 1
+
+        # Promote so repeat lookups in this worker stay in memory
+        value, expires_at = stored
+        self._store(key, value, expires_at - now)
+        return value
+
+    def set_key(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Set a value by full key with an optional per-entry TTL (written to both tiers)"""
+        ttl = self.ttl if ttl is None else ttl
+        self._store(key, value, ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, time.time() + ttl)
+
+    def _store(self, key: str, value: Any, ttl: float):
+        """Insert into the memory tier, evicting to fit the budgets"""
+        prefix = key.split(":", 1)[0]
+        size = _estimate_size(value) + len(key)
+        if size > self.max_bytes:
+            return
+        entry = _Entry(value, prefix, ttl, size)
+
+        with self.lock:
+            self._expire(entry.created_at)
+            if key in self.cache:
+                self._remove(key)
+
+            self.cache[key] = entry
+            self.bytes += size
+            self._prefix_keys[prefix].add(key)
+            stats = self._stats[prefix]
+            stats.entries += 1
+            stats.bytes += size
+            heapq.heappush(self._expiry_heap, (entry.expires_at, key))
+
+            # Evict least recently used entries until both budgets fit
+            while len(self.cache) > self.max_size or self.bytes > self.max_bytes:
+                oldest_key = next(iter(self.cache))
+                evicted = self._remove(oldest_key)
+                self._stats[evicted.prefix].evictions += 1
+
+    def get(self, prefix: str, *args, **kwargs) -> Optional[Any]:
+        """Get cached value if exists and not expired"""
+        return self.get_key(self.make_key(prefix, *args, **kwargs))
+
     def set(self, prefix: str, value: Any, *args, **kwargs):
-        """Set cache value with TTL"""
-        key = self._generate_key(prefix, *args, **kwargs)
-        
+        """Set cache value with the default TTL"""
+        self.set_key(self.make_key(prefix, *args, **kwargs), value)
+
+    def delete_key(self, key: str):
+        """Remove one entry from both tiers"""
         with self.lock:
-            # Evict oldest if cache is full
-            if len(self.cache) >= self.max_size and key not in self.cache:
-                oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k]['expires_at'])
-                del self.cache[oldest_key]
-            
-            self.cache[key] = {
-                'value': value,
-                'expires_at': time.time() + self.ttl,
-                'created_at': time.time()
-            }
-    
+            if key in self.cache:
+                self._remove(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove every entry under a prefix; returns the number removed (from disk when tiered)"""
+        with self.lock:
+            keys = list(self._prefix_keys.get(prefix, ()))
+            for key in keys:
+                self._remove(key)
+        if self.disk is not None:
+            # Other workers keep their memory copies until they expire
+            return self.disk.invalidate(prefix)
+        return len(keys)
+
     def clear(self):
         """Clear all cache entries"""
+        if self.disk is not None:
+            self.disk.clear()
         with self.lock:
             self.cache.clear()
-    
-    def cleanup_expired(self):
+            self.bytes = 0
+            self._expiry_heap = []
+            self._prefix_keys.clear()
+            for stats in self._stats.values():
+                stats.entries = 0
+                stats.bytes = 0
+
+    def cleanup_expired(self) -> int:
         """Remove expired entries (call periodically)"""
-        current_time = time.time()
+        if self.disk is not None:
+            self.disk.prune()
+        with self.lock:
+            before = len(self.cache)
+            self._expire(time.time())
+            return before - len(self.cache)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Overall and per-prefix cache statistics"""
+        with self.lock:
+            by_prefix = {}
+            for prefix, stats in self._stats.items():
+                lookups = stats.hits + stats.misses
+                by_prefix[prefix] = {
+                    "entries": stats.entries,
+                    "bytes": stats.bytes,
+                    "hits": stats.hits,
+                    "disk_hits": stats.disk_hits,
+                    "misses": stats.misses,
+                    "hit_rate": round(stats.hits / lookups, 3) if lookups else 0.0,
+                    "evictions": stats.evictions,
+                    "expirations": stats.expirations
+                }
+
+            hits = sum(s.hits for s in self._stats.values())
+            misses = sum(s.misses for s in self._stats.values())
+            summary = {
+                "entries": len(self.cache),
+                "max_entries": self.max_size,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+                "by_prefix": by_prefix
+            }
+        if self.disk is not None:
+            summary["disk"] = self.disk.get_stats()
+        return summary
+
+    def dump(self, prefix: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recently used entries (optionally under one prefix) with value previews"""
+        now = time.time()
         with self.lock:
-            expired_keys = [
-                key for key, entry in self.cache.items()
-                if current_time > entry['expires_at']
-            ]
-            for key in expired_keys:
-                del self.cache[key]
-        
-        return len(expired_keys)
-
-# Global cache instance
-cache = ResponseCache(ttl_seconds=1800)  # 30 minutes default TTL
+            entries = []
+            for key in reversed(self.cache):
+                entry = self.cache[key]
+                if prefix and entry.prefix != prefix:
+                    continue
+                preview = entry.value if isinstance(entry.value, str) else json.dumps(entry.value, default=str)
+                entries.append({
+                    "key": key,
+                    "prefix": entry.prefix,
+                    "bytes": entry.size,
+                    "hits": entry.hits,
+                    "age_seconds": round(now - entry.created_at, 1),
+                    "ttl_remaining_seconds": round(max(entry.expires_at - now, 0), 1),
+                    "value": preview[:DUMP_PREVIEW_CHARS]
+                })
+                if len(entries) >= limit:
+                    break
+            return entries
 
+# Global cache instance (memory only unless the shared disk tier is enabled)
+cache = ResponseCache(
+    ttl_seconds=CACHE_TTL_SECONDS,
+    max_size=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    disk=DiskCache(DISK_CACHE_PATH, max_entries=DISK_CACHE_MAX_ENTRIES) if ENABLE_DISK_CACHE else None
+)
@@ -0,0 +1,34 @@
+"""
+Request Deadline Utility
+End-to-end time budget carried from a route down to upstream calls
+"""
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised (or returned as an error) when a request's time budget runs out"""
+
+
+class Deadline:
+    """Absolute point in time by which a request must finish"""
+    
+    def __init__(self, seconds: float):
+        """
+        Initialize deadline
+        Args:
+            seconds: Time budget from now
+        """
+        self.budget = seconds
+        self.expires_at = time.time() + seconds
+    
+    def remaining(self) -> float:
+        """Seconds left in the budget (never negative)"""
+        return max(self.expires_at - time.time(), 0.0)
+    
+    def expired(self) -> bool:
+        """Whether the budget has run out"""
+        return time.time() >= self.expires_at
+    
+    def timeout(self, cap: float) -> float:
+        """Per-operation timeout: the remaining budget, capped"""
+        return min(cap, self.remaining())
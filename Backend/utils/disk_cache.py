@@ -0,0 +1,204 @@
+"""
+Disk Cache Tier
+SQLite (WAL mode) key-value store shared by every worker process on a node
+and surviving restarts; sits behind the in-memory ResponseCache
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from utils.logger import logger
+
+# Writes between expiry / size pruning passes
+PRUNE_EVERY_WRITES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    prefix TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at);
+CREATE INDEX IF NOT EXISTS cache_prefix ON cache (prefix);
+"""
+
+
+class DiskCache:
+    """
+    Process- and thread-safe persistent cache.
+    Each thread gets its own connection (re-opened after fork); WAL mode lets
+    readers in other workers proceed while one worker writes. Values must be
+    JSON-serializable. Errors are logged and treated as misses so a disk
+    problem never fails a request.
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, busy_timeout: float = 2.0):
+        """
+        Initialize cache
+        Args:
+            path: SQLite database file (created with its directory if missing)
+            max_entries: Entries kept after pruning (oldest dropped first)
+            busy_timeout: Seconds to wait for another worker's write lock
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connection()
+        if conn is not None:
+            conn.executescript(_SCHEMA)
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """This thread's connection, opened on first use in each process"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        try:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL only risks the last writes on power loss, fine for a cache
+            conn.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as e:
+            self._record_error("Could not open disk cache", e)
+            return None
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _record_error(self, message: str, error: Exception):
+        with self._lock:
+            self.errors += 1
+        logger.warning(message, path=self.path, error=str(error))
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """
+        Look up a live entry
+
+        Returns:
+            (value, expires_at) or None when missing or expired
+        """
+        conn = self._connection()
+        row = None
+        if conn is not None:
+            try:
+                row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?",
+                                   (key, time.time())).fetchone()
+            except sqlite3.Error as e:
+                self._record_error("Disk cache read failed", e)
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires_at: float):
+        """Store a value until `expires_at` (unserializable values are skipped)"""
+        try:
+            encoded = json.dumps(value)
+        except (TypeError, ValueError):
+            return
+        conn = self._connection()
+        if conn is None:
+            return
+        try:
+            conn.execute("INSERT OR REPLACE INTO cache (key, prefix, value, expires_at, created_at) "
+                         "VALUES (?, ?, ?, ?, ?)",
+                         (key, key.split(":", 1)[0], encoded, expires_at, time.time()))
+        except sqlite3.Error as e:
+            self._record_error("Disk cache write failed", e)
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune_due = self._writes % PRUNE_EVERY_WRITES == 0
+        if prune_due:
+            self.prune()
+
+    def prune(self) -> int:
+        """Drop expired entries, then the oldest beyond max_entries; returns the number removed"""
+        conn = self._connection()
+        if conn is None:
+            return 0
+        try:
+            removed = conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            removed += conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY created_at DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,)
+            ).rowcount
+            return removed
+        except sqlite3.Error as e:
+            self._record_error("Disk cache prune failed", e)
+            return 0
+
+    def delete(self, key: str):
+        """Remove one entry"""
+        conn = self._connection()
+        if conn is None:
+            return
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self._record_error("Disk cache delete failed", e)
+
+    def invalidate(self, prefix: str) -> int:
+        """Remove every entry under a prefix; returns the number removed"""
+        conn = self._connection()
+        if conn is None:
+            return 0
+        try:
+            return conn.execute("DELETE FROM cache WHERE prefix = ?", (prefix,)).rowcount
+        except sqlite3.Error as e:
+            self._record_error("Disk cache invalidate failed", e)
+            return 0
+
+    def clear(self):
+        """Remove every entry"""
+        conn = self._connection()
+        if conn is None:
+            return
+        try:
+            conn.execute("DELETE FROM cache")
+        except sqlite3.Error as e:
+            self._record_error("Disk cache clear failed", e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry count, file size and this process's hit counters"""
+        entries = None
+        conn = self._connection()
+        if conn is not None:
+            try:
+                entries = conn.execute("SELECT COUNT(*) FROM cache WHERE expires_at > ?",
+                                       (time.time(),)).fetchone()[0]
+            except sqlite3.Error as e:
+                self._record_error("Disk cache stats failed", e)
+        try:
+            file_bytes = os.path.getsize(self.path)
+        except OSError:
+            file_bytes = 0
+
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "file_bytes": file_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "errors": self.errors
+            }
@@ -0,0 +1,88 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one in-flight computation
+instead of each starting their own
+"""
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Optional, Tuple
+from utils.deadline import DeadlineExceeded
+
+
+class _Call:
+    """One in-flight computation and the callers waiting on it"""
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread-safe duplicate call suppression keyed by string"""
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None,
+           on_join: Optional[Callable[[], None]] = None) -> Tuple[Any, bool]:
+        """
+        Run fn() unless an identical call is already in flight, in which case
+        wait for and share its result (or exception).
+
+        Args:
+            key: Identity of the call
+            fn: Computation to run if no call for `key` is in flight
+            timeout: Longest a duplicate waits for the in-flight call
+            on_join: Called when this caller joins an in-flight call
+
+        Returns:
+            (result, shared) where shared is True for callers that waited
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            if on_join:
+                on_join()
+            if not call.done.wait(timeout):
+                raise DeadlineExceeded("Timed out waiting for coalesced request")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Coalescing counters"""
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "waiting": sum(call.waiters for call in self._calls.values()),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced
+            }
+
+
+# Global single-flight group (keys carry their cache prefix, e.g. "chat_response:...")
+single_flight = SingleFlight()
@@ -0,0 +1,150 @@
+"""
+Streaming Frequency Sketches
+Fixed-memory counters for "what is asked most": Space-Saving keeps the
+top-K items with error bounds, count-min estimates the count of any item
+"""
+import heapq
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class CountMinSketch:
+    """
+    Count-min sketch with conservative update.
+    Estimates never undercount; with width w and depth d the overcount is
+    at most 2N/w with probability 1 - (1/2)^d for N total updates.
+    """
+
+    def __init__(self, width: int = 2048, depth: int = 4):
+        """
+        Initialize sketch
+        Args:
+            width: Counters per row
+            depth: Independent hash rows
+        """
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+        self._seeds = [zlib.crc32(f"row{i}".encode()) for i in range(depth)]
+        self.total = 0
+
+    def _indexes(self, item: str) -> List[int]:
+        data = item.encode("utf-8")
+        return [zlib.crc32(data, seed) % self.width for seed in self._seeds]
+
+    def add(self, item: str, count: int = 1) -> int:
+        """Count an item; returns its new estimate"""
+        indexes = self._indexes(item)
+        # Conservative update: only raise counters that are below the new estimate
+        estimate = min(row[i] for row, i in zip(self.rows, indexes)) + count
+        for row, i in zip(self.rows, indexes):
+            if row[i] < estimate:
+                row[i] = estimate
+        self.total += count
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        """Upper-bound estimate of how often an item was added"""
+        return min(row[i] for row, i in zip(self.rows, self._indexes(item)))
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters over at most `capacity` monitored items.
+    When full, a new item replaces the least counted one and inherits its
+    count as error, so every item seen more than N/capacity times is kept.
+    Updates are O(log capacity) amortized (lazy min-heap).
+    """
+
+    def __init__(self, capacity: int = 200):
+        """
+        Initialize summary
+        Args:
+            capacity: Items monitored at once
+        """
+        self.capacity = capacity
+        # item -> [count, error, representative]
+        self._items: Dict[str, list] = {}
+        # (count, item) records; stale ones are skipped when popped
+        self._heap: List[Tuple[int, str]] = []
+        self.total = 0
+
+    def _pop_min(self) -> str:
+        """Least counted monitored item (removes stale heap records on the way)"""
+        while True:
+            count, item = self._heap[0]
+            entry = self._items.get(item)
+            if entry is not None and entry[0] == count:
+                return item
+            heapq.heappop(self._heap)
+
+    def add(self, item: str, representative: Any = None, count: int = 1):
+        """Count an item, optionally remembering a representative (e.g. original wording)"""
+        self.total += count
+        entry = self._items.get(item)
+        if entry is None:
+            if len(self._items) < self.capacity:
+                entry = [0, 0, representative]
+            else:
+                evicted = self._pop_min()
+                floor = self._items.pop(evicted)[0]
+                entry = [floor, floor, representative]
+            self._items[item] = entry
+        entry[0] += count
+        if representative is not None:
+            entry[2] = representative
+        heapq.heappush(self._heap, (entry[0], item))
+
+        # Increments leave stale records behind; rebuild before they pile up
+        if len(self._heap) > 4 * self.capacity + 64:
+            self._heap = [(entry[0], key) for key, entry in self._items.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k: int) -> List[Tuple[str, int, int, Any]]:
+        """
+        Most counted items
+
+        Returns:
+            (item, count, max_overcount, representative), highest count first
+        """
+        ranked = heapq.nlargest(k, self._items.items(), key=lambda kv: kv[1][0])
+        return [(item, entry[0], entry[1], entry[2]) for item, entry in ranked]
+
+    def count(self, item: str) -> Optional[int]:
+        """Count of a monitored item, None if not monitored"""
+        entry = self._items.get(item)
+        return entry[0] if entry else None
+
+
+class HeavyHitters:
+    """Space-Saving top-K with a count-min sketch to tighten its counts"""
+
+    def __init__(self, capacity: int = 200, width: int = 2048, depth: int = 4):
+        self.top_k = SpaceSaving(capacity)
+        self.sketch = CountMinSketch(width, depth)
+
+    def add(self, item: str, representative: Any = None):
+        self.top_k.add(item, representative)
+        self.sketch.add(item)
+
+    def estimate(self, item: str) -> int:
+        """Upper-bound count of any item, monitored or not"""
+        monitored = self.top_k.count(item)
+        estimate = self.sketch.estimate(item)
+        return estimate if monitored is None else min(monitored, estimate)
+
+    def top(self, k: int) -> List[Dict[str, Any]]:
+        """Top-K items with both sketches' bounds applied"""
+        results = []
+        for item, count, error, representative in self.top_k.top(k):
+            results.append({
+                "item": item,
+                "example": representative if representative is not None else item,
+                "count": min(count, self.sketch.estimate(item)),
+                "max_overcount": error
+            })
+        return results
+
+    @property
+    def total(self) -> int:
+        return self.top_k.total
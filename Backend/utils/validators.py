@@ -19,16 +19,19 @@ class InputValidator:
     SQL_INJECTION_PATTERN = re.compile(r"('|(\\')|(--)|(;)|(\*)|(\%))", re.IGNORECASE)
     
     @staticmethod
-    def validate_message(message: str) -> Tuple[bool, Optional[str]]:
+    def validate_message(message: str, analysis=None) -> Tuple[bool, Optional[str]]:
         """
         Validate and sanitize user message
+        Args:
+            message: Message as received
+            analysis: The message's shared AnalyzedMessage, if any (reuses its stripped text)
         Returns: (is_valid, error_message)
         """
         if not message or not isinstance(message, str):
             return False, "Message must be a non-empty string"
         
         # Trim whitespace
-        message = message.strip()
+        message = analysis.stripped if analysis is not None else message.strip()
         
         if len(message) < InputValidator.MIN_MESSAGE_LENGTH:
             return False, "Message is too short"